@@ -0,0 +1,156 @@
+"""
+Asignación distrito -> provincia / municipio (u otra capa de polígonos)
+======================================================================
+Sustituye al overlay completo (todos los distritos x todas las provincias + áreas):
+
+1. STRtree sobre la capa destino: candidatos de cada distrito con `intersects`
+2. Un solo candidato -> asignado sin calcular nada más
+3. Varios: si la provincia que contiene el punto representativo cubre el
+   distrito entero, es esa; si no (distrito en la frontera), área exacta de la
+   intersección solo con sus candidatos y se queda la mayor
+4. Sin candidatos (costa, huecos): la más cercana
+
+La tabla resultante (id, campo, metodo) se cachea junto a la zonificación
+(geometrias.py), con clave = hash de ambos ficheros + campo: los análisis la
+leen sin repetir nada de esto.
+
+    python asignar_zonas.py <distritos.geojson> <provincias.geojson> --campo Texto [--salida tabla.csv]
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from geometrias import CACHE_DIR, ID_COL, _hash_fichero, cargar_zonas
+
+# CRS métrico para medir áreas (España: ETRS89 / UTM 30N)
+CRS_AREA = "EPSG:25830"
+
+
+def asignar_poligonos(zonas, capa, campo: str, id_col: str = ID_COL) -> pd.DataFrame:
+    """
+    zonas, capa: GeoDataFrames en el mismo CRS métrico.
+    Devuelve DF: id_col, campo, metodo (unico / cubierto / area / cercano).
+    """
+    import shapely
+    from shapely import STRtree
+
+    geoms = zonas.geometry.values
+    destino = capa.geometry.values
+    valores = capa[campo].to_numpy(dtype=object)
+    arbol = STRtree(destino)
+
+    asignado = np.full(len(zonas), -1, dtype=np.int64)
+    metodo = np.full(len(zonas), "", dtype=object)
+
+    # 1) candidatos exactos (intersects) vía índice espacial
+    i_zona, j_capa = arbol.query(geoms, predicate="intersects")
+    n_cand = np.bincount(i_zona, minlength=len(zonas))
+
+    # 2) un único candidato
+    unico = n_cand[i_zona] == 1
+    asignado[i_zona[unico]] = j_capa[unico]
+    metodo[i_zona[unico]] = "unico"
+
+    # 3) varios candidatos: ¿lo cubre entero el polígono del punto representativo?
+    multi = np.flatnonzero(n_cand > 1)
+    if len(multi):
+        puntos = shapely.point_on_surface(geoms[multi])
+        ip, jp = arbol.query(puntos, predicate="within")
+        j_punto = np.full(len(multi), -1, dtype=np.int64)
+        j_punto[ip] = jp
+        con_punto = j_punto >= 0
+        cubierto = np.zeros(len(multi), dtype=bool)
+        cubierto[con_punto] = shapely.covers(destino[j_punto[con_punto]], geoms[multi[con_punto]])
+        asignado[multi[cubierto]] = j_punto[cubierto]
+        metodo[multi[cubierto]] = "cubierto"
+
+        # 4) frontera: área exacta solo con sus candidatos
+        frontera = multi[~cubierto]
+        if len(frontera):
+            sel = np.isin(i_zona, frontera)
+            zi, cj = i_zona[sel], j_capa[sel]
+            areas = shapely.area(shapely.intersection(geoms[zi], destino[cj]))
+            orden = np.lexsort((-areas, zi))
+            primero = np.r_[True, zi[orden][1:] != zi[orden][:-1]]
+            asignado[zi[orden][primero]] = cj[orden][primero]
+            metodo[zi[orden][primero]] = "area"
+
+    # 5) sin candidatos: el más cercano
+    sin = np.flatnonzero(asignado < 0)
+    if len(sin):
+        iz, jc = arbol.query_nearest(geoms[sin], all_matches=False)
+        asignado[sin[iz]] = jc
+        metodo[sin[iz]] = "cercano"
+
+    return pd.DataFrame({
+        id_col: zonas[id_col].to_numpy(),
+        campo: np.where(asignado >= 0, valores[np.clip(asignado, 0, None)], None),
+        "metodo": metodo,
+    })
+
+
+def asignacion_zonas(
+    distritos: Path,
+    capa: Path,
+    campo: str,
+    id_col: str = ID_COL,
+    cache_dir: Path = CACHE_DIR,
+    recalcular: bool = False,
+) -> pd.DataFrame:
+    """Tabla distrito -> `campo` de la capa (cacheada por hash de ambos ficheros y campo)."""
+    cache_dir = Path(cache_dir)
+    clave = f"{_hash_fichero(distritos, cache_dir)}_{_hash_fichero(capa, cache_dir)}"
+    destino = cache_dir / f"asignacion_{Path(distritos).stem}_{Path(capa).stem}_{campo}_{clave}.parquet"
+    if destino.exists() and not recalcular:
+        return pd.read_parquet(destino)
+
+    print(f"  Asignando {Path(distritos).name} -> {Path(capa).name}[{campo}]...")
+    zonas_m = cargar_zonas(distritos, crs=CRS_AREA, id_col=id_col, cache_dir=cache_dir)
+    capa_m = cargar_zonas(capa, crs=CRS_AREA, id_col=id_col, cache_dir=cache_dir)
+    tabla = asignar_poligonos(zonas_m, capa_m, campo, id_col=id_col)
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(".tmp")
+    tabla.to_parquet(tmp, index=False)
+    os.replace(tmp, destino)
+    return tabla
+
+
+def mapa_zonas(distritos: Path, capa: Path, campo: str, id_col: str = ID_COL) -> pd.Series:
+    """Serie ID -> valor del campo, lista para .map() / reindex."""
+    tabla = asignacion_zonas(distritos, capa, campo, id_col=id_col)
+    return tabla.set_index(id_col)[campo]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asigna cada distrito a un polígono de otra capa (provincia, municipio...)")
+    parser.add_argument("distritos", type=Path)
+    parser.add_argument("capa", type=Path)
+    parser.add_argument("--campo", required=True, help="campo de la capa a copiar (p. ej. nombre de provincia)")
+    parser.add_argument("--id-col", default=ID_COL)
+    parser.add_argument("--salida", type=Path, default=None, help=".csv, .parquet o .geojson (distritos + campo)")
+    parser.add_argument("--recalcular", action="store_true")
+    args = parser.parse_args()
+
+    tabla = asignacion_zonas(args.distritos, args.capa, args.campo, id_col=args.id_col, recalcular=args.recalcular)
+    print(tabla["metodo"].value_counts().to_string())
+
+    if args.salida is not None:
+        suf = args.salida.suffix.lower()
+        if suf == ".csv":
+            tabla.to_csv(args.salida, index=False)
+        elif suf == ".parquet":
+            tabla.to_parquet(args.salida, index=False)
+        else:
+            gdf = cargar_zonas(args.distritos, crs="EPSG:4326", id_col=args.id_col)
+            gdf = gdf.merge(tabla[[args.id_col, args.campo]], on=args.id_col, how="left")
+            gdf.to_file(args.salida, driver="GeoJSON")
+        print(f"✓ Guardado: {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
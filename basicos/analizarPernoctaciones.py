@@ -1,38 +1,46 @@
-import pandas as pd
+import sys
+from pathlib import Path
 
-# Cargar los datos de los días clave del Orgullo por año
-df2022 = pd.read_parquet("D://Datos//Movilidad//MinisteriodeTransportes//EstudiosBasicos//Pernoctaciones//20220604_Pernoctaciones_distritos.parquet")
-df2023 = pd.read_parquet("D://Datos//Movilidad//MinisteriodeTransportes//EstudiosBasicos//Pernoctaciones//20230218_Pernoctaciones_distritos.parquet")
-df2024 = pd.read_parquet("D://Datos//Movilidad//MinisteriodeTransportes//EstudiosBasicos//Pernoctaciones//20240210_Pernoctaciones_distritos.parquet")
-df2025 = pd.read_parquet("D://Datos//Movilidad//MinisteriodeTransportes//EstudiosBasicos//Pernoctaciones//20250301_Pernoctaciones_distritos.parquet")
+import pandas as pd
 
-# Añadir columna de año a cada DataFrame
-df2022['año'] = 2022
-df2023['año'] = 2023
-df2024['año'] = 2024
-df2025['año'] = 2025
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from catalogo import ESTUDIOS  # noqa: E402
+from lectura_zonas import leer_dias_zonas  # noqa: E402
 
+# Catálogo particionado (ver catalogo.py). Para pasar los parquets planos antiguos:
+#   python catalogo.py importar "D:\Datos\...\EstudiosBasicos\Pernoctaciones" pernoctaciones_distritos --base "D:\Datos\...\EstudiosBasicos"
+BASE_DIR = Path(r"D:\Datos\Movilidad\MinisteriodeTransportes\EstudiosBasicos")
 
-# Unirlos en uno solo
-df = pd.concat([df2022,df2023,df2024,df2025], ignore_index=True)
+# Días clave del Orgullo por año
+FECHAS = {
+    2022: "2022-06-04",
+    2023: "2023-02-18",
+    2024: "2024-02-10",
+    2025: "2025-03-01",
+}
 
 # Definir los distritos objetivo 
 zonas_distritos = ['1101201','1101202','1101203','1101204','1101205','1101206','1101207','1101208','1101209','1101210']
 
-# Filtrar solo pernoctaciones en esos distritos
-dffiltrado = df[df['zona_pernoctacion'].isin(zonas_distritos)].copy()
+# Leer solo las pernoctaciones en esos distritos de esos días (y solo las columnas necesarias)
+dffiltrado = leer_dias_zonas(
+    BASE_DIR, ESTUDIOS["pernoctaciones"], FECHAS.values(),
+    "zona_pernoctacion", ids=zonas_distritos,
+    columns=['fecha', 'zona_residencia', 'zona_pernoctacion', 'personas'],
+)
+dffiltrado['año'] = pd.to_datetime(dffiltrado['fecha']).dt.year
 
 # Asegurar que 'personas' es numérico
 dffiltrado['personas'] = pd.to_numeric(dffiltrado['personas'], errors='coerce')
 
 # Agrupar por zona_residencia y año
-df_origen_anual = dffiltrado.groupby(['zona_residencia', 'año'])['personas'].sum().reset_index()
+df_origen_anual = dffiltrado.groupby(['zona_residencia', 'año'], observed=True)['personas'].sum().reset_index()
 
 # Pivotar para tener una columna por año
 df_pivot = df_origen_anual.pivot(index='zona_residencia', columns='año', values='personas').fillna(0)
 
 # Reordenar columnas por año
-df_pivot = df_pivot[[2022,2023,2024,2025]]
+df_pivot = df_pivot[list(FECHAS)]
 
 
 # Mostrar top 20 zonas con más pernoctaciones en total
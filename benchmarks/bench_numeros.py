@@ -0,0 +1,95 @@
+"""
+Micro-benchmark del parser de números (numeros.py) frente a las implementaciones anteriores
+==========================================================================================
+Uso (con un fichero diario real de Viajes):
+    python benchmarks/bench_numeros.py C:\\ruta\\20250215_Viajes_distritos.csv.gz [--repeticiones 3]
+
+Lee solo las columnas viajes/viajes_km (como str), las parsea con las versiones
+antiguas de descargarViajes.py / pie.py y con numeros.py, comprueba que coinciden
+y muestra tiempos y aceleración.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from numeros import parse_miles_float, parse_miles_int  # noqa: E402
+
+
+# =========================
+# Implementaciones anteriores (referencia)
+# =========================
+def old_viajes_parse_miles_int(series: pd.Series) -> pd.Series:
+    s = series.astype("string").fillna("0").str.strip()
+    has_comma = s.str.contains(",", na=False)
+    s_comma = s.where(has_comma, "0").str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    s_nocomma = s.where(~has_comma, "0").str.replace(r"[^\d\-]", "", regex=True)
+    merged = s_nocomma.where(~has_comma, s_comma)
+    num = pd.to_numeric(merged, errors="coerce").fillna(0)
+    return num.round().astype("int64")
+
+
+def old_viajes_parse_miles_float(series: pd.Series) -> pd.Series:
+    s = series.astype("string").fillna("0").str.strip()
+    has_comma = s.str.contains(",", na=False)
+    s_comma = s.where(has_comma, "0").str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    s_nocomma = (
+        s.where(~has_comma, "0")
+        .str.replace(".", "", regex=False)
+        .str.replace(r"[^\d\-]", "", regex=True)
+    )
+    merged = s_nocomma.where(~has_comma, s_comma)
+    return pd.to_numeric(merged, errors="coerce").fillna(0.0).astype(float)
+
+
+def old_pie_parse_miles_float(series: pd.Series) -> pd.Series:
+    s = series.astype(str).str.strip()
+    s = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype(float)
+
+
+def _cronometrar(func, series: pd.Series, repeticiones: int):
+    mejor = float("inf")
+    res = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        res = func(series)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fichero", type=Path, help="*_Viajes_distritos.csv.gz")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    head = pd.read_csv(args.fichero, compression="gzip", sep="|", nrows=0)
+    col_v = "viajes" if "viajes" in head.columns else "trips"
+    col_km = "viajes_km" if "viajes_km" in head.columns else "trips_km"
+    usecols = [c for c in (col_v, col_km) if c in head.columns]
+    df = pd.read_csv(args.fichero, compression="gzip", sep="|", usecols=usecols, dtype="string")
+    print(f"{args.fichero.name}: {len(df):,} filas")
+
+    casos = [
+        (col_v, "int   (descargarViajes)", old_viajes_parse_miles_int, parse_miles_int),
+        (col_km, "float (descargarViajes)", old_viajes_parse_miles_float, parse_miles_float),
+        (col_v, "float (pie.py)", old_pie_parse_miles_float, parse_miles_float),
+    ]
+    print(f"{'caso':<26}{'antes (s)':>12}{'ahora (s)':>12}{'x':>8}{'difieren':>10}")
+    for col, nombre, viejo, nuevo in casos:
+        if col not in df.columns:
+            continue
+        t_old, r_old = _cronometrar(viejo, df[col], args.repeticiones)
+        t_new, r_new = _cronometrar(nuevo, df[col], args.repeticiones)
+        difieren = int((~np.isclose(r_old.to_numpy(dtype=float), r_new.to_numpy(dtype=float))).sum())
+        print(f"{nombre:<26}{t_old:>12.3f}{t_new:>12.3f}{t_old / t_new:>8.1f}{difieren:>10,}")
+
+
+if __name__ == "__main__":
+    main()
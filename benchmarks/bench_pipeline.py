@@ -0,0 +1,330 @@
+"""
+Benchmarks del pipeline con ficheros MITMA sintéticos (benchmarks/sinteticos.py)
+===============================================================================
+Casos (cada uno en un proceso nuevo, así el pico de memoria es solo suyo):
+  conversion_viajes           descargarViajes.read_mitma_csv_gz + normalize_columns
+  conversion_pernoctaciones   descargarPernoctaciones.read_mitma_csv_gz + normalize_columns + parseo de personas
+  wanda_agg                   pie.read_mitma_wanda_agg
+  impacto                     pie.expected_stats + pie.impacto_derbi (línea base de los demás días)
+  exodo                       bucle de full.py: procesar_dia (gz -> parquet + cubos + éxodo) y máximos
+
+Cada ejecución se añade a un historial JSON (segundos, filas/s, MB/s de gz, pico RSS,
+commit, backend de gzip...) y se compara con la anterior de los mismos parámetros
+para que las regresiones se vean. El historial va por defecto junto a los datos
+(fuera del repo). Los ficheros sintéticos se generan una vez y se reutilizan
+(mismos parámetros -> mismos bytes).
+
+Además de las filas, los casos de conversión y éxodo comprueban que la suma de
+viajes / personas leída coincide con la que escribió el generador: un parseo de
+números roto (todo a 0) no puede pasar por un benchmark rápido.
+
+Uso:
+    python benchmarks/bench_pipeline.py [--dias 7] [--escala 0.05] [--repeticiones 3]
+        [--casos conversion_viajes,exodo] [--datos DIR] [--historial <datos>/historial_benchmarks.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import sinteticos  # noqa: E402
+
+HISTORIAL_NAME = "historial_benchmarks.json"
+UMBRAL_REGRESION = 0.10  # +10% de tiempo respecto a la ejecución anterior comparable
+TOLERANCIA_SUMA = 1e-6   # relativa (orden de la suma en coma flotante)
+
+
+def _pico_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso (MB); None si no se puede medir."""
+    # Linux: VmHWM es del proceso actual (ru_maxrss hereda el pico del padre al hacer fork)
+    status = Path("/proc/self/status")
+    if status.exists():
+        for linea in status.read_text().splitlines():
+            if linea.startswith("VmHWM:"):
+                return int(linea.split()[1]) / 1024
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 1024 / 1024 if sys.platform == "darwin" else pico / 1024  # bytes en macOS, KB en Linux
+    except ImportError:
+        pass
+    try:
+        import psutil  # opcional (Windows)
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1e6
+    except ImportError:
+        return None
+
+
+def _mejor(repeticiones: int, preparar, medir) -> float:
+    """Mejor tiempo de `medir(estado)` en N repeticiones; `preparar()` no se cronometra."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        estado = preparar()
+        t0 = time.perf_counter()
+        medir(estado)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def _yyyymmdd(info: Dict) -> str:
+    return info["fecha"].replace("-", "")
+
+
+def _comprobar_suma(info: Dict, obtenida: float, que: str = "") -> None:
+    """La suma leída de la medida (viajes / personas) debe ser la que escribió el generador."""
+    esperada = info["suma"]
+    if abs(obtenida - esperada) > TOLERANCIA_SUMA * max(abs(esperada), 1.0):
+        raise AssertionError(
+            f"{Path(info['ruta']).name}{que}: suma leída {obtenida:,.1f}, el generador escribió {esperada:,.1f}"
+        )
+
+
+# =========================
+# Casos
+# =========================
+def caso_conversion_viajes(datos: Dict, tmp: Path, repeticiones: int) -> Dict:
+    from descargarViajes import normalize_columns, read_mitma_csv_gz
+
+    sumas = {}
+
+    def medir(_):
+        for info in datos["viajes"]:
+            df = normalize_columns(read_mitma_csv_gz(Path(info["ruta"])), _yyyymmdd(info))
+            if len(df) != info["filas"]:
+                raise AssertionError(f"{Path(info['ruta']).name}: {len(df):,} filas leídas de {info['filas']:,}")
+            sumas[info["ruta"]] = float(df["viajes"].sum())
+
+    segundos = _mejor(repeticiones, lambda: None, medir)
+    for info in datos["viajes"]:
+        _comprobar_suma(info, sumas[info["ruta"]])
+    return {"segundos": segundos, "filas": sum(i["filas"] for i in datos["viajes"]), "bytes": sum(i["bytes"] for i in datos["viajes"])}
+
+
+def caso_conversion_pernoctaciones(datos: Dict, tmp: Path, repeticiones: int) -> Dict:
+    import pandas as pd
+    from descargarPernoctaciones import normalize_columns, read_mitma_csv_gz
+
+    sumas = {}
+
+    def medir(_):
+        for info in datos["pernoctaciones"]:
+            df = normalize_columns(read_mitma_csv_gz(Path(info["ruta"])), _yyyymmdd(info))
+            if len(df) != info["filas"]:
+                raise AssertionError(f"{Path(info['ruta']).name}: {len(df):,} filas leídas de {info['filas']:,}")
+            # normalize_columns deja personas como str; el esquema las parsea así al escribir
+            sumas[info["ruta"]] = float(pd.to_numeric(df["personas"], errors="coerce").fillna(0.0).sum())
+
+    segundos = _mejor(repeticiones, lambda: None, medir)
+    for info in datos["pernoctaciones"]:
+        _comprobar_suma(info, sumas[info["ruta"]])
+    dias = datos["pernoctaciones"]
+    return {"segundos": segundos, "filas": sum(i["filas"] for i in dias), "bytes": sum(i["bytes"] for i in dias)}
+
+
+def caso_wanda_agg(datos: Dict, tmp: Path, repeticiones: int) -> Dict:
+    from pie import DISTRITO_WANDA, read_mitma_wanda_agg
+
+    valid_ids = set(sinteticos.zonas_sinteticas(semilla=datos["semilla"])[0])
+
+    def medir(_):
+        for info in datos["viajes"]:
+            read_mitma_wanda_agg(Path(info["ruta"]), DISTRITO_WANDA, valid_ids)
+
+    segundos = _mejor(repeticiones, lambda: None, medir)
+    return {"segundos": segundos, "filas": sum(i["filas"] for i in datos["viajes"]), "bytes": sum(i["bytes"] for i in datos["viajes"])}
+
+
+def caso_impacto(datos: Dict, tmp: Path, repeticiones: int) -> Dict:
+    from linea_base import actualizar_linea_base, leer_linea_base
+    from pie import DISTRITO_WANDA, expected_stats, impacto_derbi, read_mitma_wanda_agg
+
+    # Último día = evento; los demás, controles del mismo día de la semana en semanas anteriores
+    valid_ids = set(sinteticos.zonas_sinteticas(semilla=datos["semilla"])[0])
+    *controles, evento = datos["viajes"]
+    f_evento = date.fromisoformat(evento["fecha"])
+    path_lb = tmp / "linea_base.parquet"
+    for k, info in enumerate(controles, start=1):
+        agg = read_mitma_wanda_agg(Path(info["ruta"]), DISTRITO_WANDA, valid_ids)
+        actualizar_linea_base(path_lb, agg, f_evento - timedelta(weeks=k), origen=DISTRITO_WANDA)
+    linea_base = leer_linea_base(path_lb, dia_semana=f_evento.weekday(), origen=DISTRITO_WANDA)
+    df_derbi = read_mitma_wanda_agg(Path(evento["ruta"]), DISTRITO_WANDA, valid_ids)
+
+    segundos = _mejor(repeticiones, lambda: None, lambda _: impacto_derbi(df_derbi, expected_stats(linea_base)))
+    return {"segundos": segundos, "filas": len(linea_base) + len(df_derbi), "bytes": 0}
+
+
+def caso_exodo(datos: Dict, tmp: Path, repeticiones: int) -> Dict:
+    import pandas as pd
+    import full
+    from cubos import estudio_cubo
+    from catalogo import ruta_particion
+
+    dias = [date.fromisoformat(i["fecha"]) for i in datos["pernoctaciones"]]
+
+    def preparar():
+        # catálogo vacío y los gz donde los deja descargar_dia (full.rutas_dia)
+        full.OUTPUT_DIR = tmp / "exodo"
+        shutil.rmtree(full.OUTPUT_DIR, ignore_errors=True)
+        full.OUTPUT_DIR.mkdir(parents=True)
+        for d, info in zip(dias, datos["pernoctaciones"]):
+            shutil.copyfile(info["ruta"], full.rutas_dia(d)[1])
+
+    def medir(_):
+        por_dia = [full.procesar_dia(d) for d in dias]
+        if any(r is None for r in por_dia):
+            raise AssertionError("procesar_dia falló en algún día")
+        df_final = pd.concat(por_dia, ignore_index=True)
+        df_final.loc[df_final.groupby("ciudad")["exodo_personas"].idxmax()]
+
+    segundos = _mejor(repeticiones, preparar, medir)
+    # lo que queda de la última repetición: parquet del día y cubo del que sale el éxodo
+    for d, info in zip(dias, datos["pernoctaciones"]):
+        _comprobar_suma(info, float(pd.read_parquet(full.rutas_dia(d)[2], columns=["personas"])["personas"].sum()))
+        cubo = ruta_particion(full.OUTPUT_DIR, estudio_cubo("mun_mun"), d)
+        _comprobar_suma(info, float(pd.read_parquet(cubo, columns=["personas"])["personas"].sum()), " (cubo mun_mun)")
+    dias_p = datos["pernoctaciones"]
+    return {"segundos": segundos, "filas": sum(i["filas"] for i in dias_p), "bytes": sum(i["bytes"] for i in dias_p)}
+
+
+CASOS = {
+    "conversion_viajes": caso_conversion_viajes,
+    "conversion_pernoctaciones": caso_conversion_pernoctaciones,
+    "wanda_agg": caso_wanda_agg,
+    "impacto": caso_impacto,
+    "exodo": caso_exodo,
+}
+
+
+def _ejecutar_caso(nombre: str, datos: Dict, repeticiones: int) -> Dict:
+    """Corre en un proceso nuevo: tiempo, throughput y pico de memoria del caso."""
+    with tempfile.TemporaryDirectory() as tmp:
+        res = CASOS[nombre](datos, Path(tmp), repeticiones)
+    seg = res["segundos"]
+    res["filas_s"] = res["filas"] / seg if seg > 0 else None
+    res["mb_s"] = res["bytes"] / 1e6 / seg if seg > 0 and res["bytes"] else None
+    res["pico_rss_mb"] = _pico_rss_mb()
+    return res
+
+
+# =========================
+# Datos e historial
+# =========================
+def carpeta_datos(dias: int, escala: float, semilla: int) -> Path:
+    """Carpeta por defecto de los sintéticos (y del historial), en el temporal del sistema."""
+    return Path(tempfile.gettempdir()) / "datosMITMA_bench" / f"d{dias}_e{escala:g}_s{semilla}"
+
+
+def preparar_datos(carpeta: Path, dias: int, escala: float, semilla: int) -> Dict:
+    """Genera los ficheros sintéticos si no están ya para estos parámetros."""
+    marca = carpeta / "generado.json"
+    if marca.exists():
+        datos = json.loads(marca.read_text(encoding="utf-8"))
+        # ficheros de otra versión del generador (formato, sumas...): se regeneran
+        if datos.get("version") == sinteticos.VERSION and all(
+            Path(i["ruta"]).exists() for ds in ("viajes", "pernoctaciones") for i in datos[ds]
+        ):
+            return datos
+    print(f"Generando datos sintéticos en {carpeta} ({dias} días, escala {escala:g})...")
+    datos = sinteticos.generar(carpeta, dias=dias, escala=escala, semilla=semilla)
+    datos["semilla"] = semilla
+    datos["version"] = sinteticos.VERSION
+    marca.write_text(json.dumps(datos, indent=1), encoding="utf-8")
+    return datos
+
+
+def _commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def cargar_historial(path: Path) -> List[Dict]:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+
+
+def anterior_comparable(historial: List[Dict], parametros: Dict, caso: str) -> Optional[Dict]:
+    """Último resultado del caso con los mismos datos (días, escala, semilla)."""
+    for ejec in reversed(historial):
+        p = ejec["parametros"]
+        if all(p.get(k) == parametros[k] for k in ("dias", "escala", "semilla")) and caso in ejec["casos"]:
+            return ejec["casos"][caso]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dias", type=int, default=7, help="días sintéticos (>= 6 cubre todas las variantes)")
+    parser.add_argument("--escala", type=float, default=0.05, help="fracción de sinteticos.FILAS_DIA")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--casos", default=",".join(CASOS), help=f"de: {','.join(CASOS)}")
+    parser.add_argument("--datos", type=Path, default=None, help="carpeta de los sintéticos (por defecto en el temporal)")
+    parser.add_argument("--historial", type=Path, default=None, help=f"por defecto <datos>/{HISTORIAL_NAME}")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION)
+    args = parser.parse_args()
+
+    casos = [c.strip() for c in args.casos.split(",") if c.strip()]
+    desconocidos = [c for c in casos if c not in CASOS]
+    if desconocidos:
+        parser.error(f"casos desconocidos: {desconocidos}")
+    if args.dias < 2:
+        parser.error("--dias debe ser >= 2 (impacto usa el último día como evento)")
+
+    from dialecto_mitma import GZIP_BACKEND
+
+    carpeta = args.datos or carpeta_datos(args.dias, args.escala, args.semilla)
+    args.historial = args.historial or carpeta / HISTORIAL_NAME
+    datos = preparar_datos(carpeta, args.dias, args.escala, args.semilla)
+    parametros = {"dias": args.dias, "escala": args.escala, "semilla": args.semilla, "repeticiones": args.repeticiones}
+    historial = cargar_historial(args.historial)
+
+    resultados = {}
+    print(f"{'caso':<27}{'s':>9}{'filas/s':>13}{'MB/s gz':>9}{'pico MB':>9}{'vs ant.':>9}")
+    for caso in casos:
+        # proceso nuevo por caso (spawn): el pico de RSS no arrastra lo de otros casos
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as ex:
+            res = ex.submit(_ejecutar_caso, caso, datos, args.repeticiones).result()
+        resultados[caso] = res
+        prev = anterior_comparable(historial, parametros, caso)
+        cambio = ""
+        if prev and prev.get("segundos"):
+            delta = res["segundos"] / prev["segundos"] - 1
+            cambio = f"{delta:+.0%}" + (" ⚠️" if delta > args.umbral else "")
+        fmt = lambda v, f: format(v, f) if v is not None else "-"
+        print(f"{caso:<27}{res['segundos']:>9.3f}{fmt(res['filas_s'], ',.0f'):>13}{fmt(res['mb_s'], '.1f'):>9}"
+              f"{fmt(res['pico_rss_mb'], '.0f'):>9}{cambio:>9}")
+
+    historial.append({
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "gzip": GZIP_BACKEND,
+        "parametros": parametros,
+        "casos": resultados,
+    })
+    args.historial.parent.mkdir(parents=True, exist_ok=True)
+    args.historial.write_text(json.dumps(historial, indent=1), encoding="utf-8")
+    print(f"✓ Historial: {args.historial} ({len(historial)} ejecuciones)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Ficheros diarios sintéticos con la forma de los del MITMA (para benchmarks)
+==========================================================================
+Genera *_Viajes_distritos.csv.gz y *_Pernoctaciones_distritos.csv.gz deterministas
+(misma semilla -> mismos bytes, gzip con mtime=0) con:
+  - cabeceras en español e inglés y los tres separadores ('|', ';', ','): el día i
+    usa la variante i % 6, así que 6 días consecutivos las cubren todas
+  - viajes / viajes_km en formato español ('1.234,567'; los parsea numeros.py); con
+    ',' como separador los decimales no caben sin comillas, así que ahí solo van
+    enteros con '.' de miles ('2.788')
+  - personas con '.' decimal y sin miles ('58.701'; esquema/cubos/éxodo la leen con
+    pd.to_numeric); con ',' como separador, enteros
+  - IDs de distrito como los reales ('2807920', '1103103_AD'), con los distritos de
+    las capitales de full.py y el de Wanda (pie.py) entre los orígenes con más viajes
+  - la suma de viajes / personas tal y como debe quedar al leerla (viajes redondeado
+    a entero, como en el catálogo), para comprobar que los lectores parsean los
+    números y no solo cuentan filas
+
+    python benchmarks/sinteticos.py <carpeta> [--dias 7] [--escala 0.05] [--semilla 0]
+"""
+
+import argparse
+import gzip
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dialecto_mitma import SEPARADORES  # noqa: E402
+from full import CAPITALES  # noqa: E402
+from pie import DISTRITO_WANDA  # noqa: E402
+
+# Filas de un día completo (orden de magnitud de los ficheros por distritos); --escala las reduce
+FILAS_DIA = {"viajes": 8_000_000, "pernoctaciones": 1_500_000}
+N_ZONAS = 3_600
+VERSION = 2  # cambia cuando cambia el formato de los ficheros (invalida los ya generados)
+BLOQUE = 500_000  # filas generadas y escritas de cada vez (memoria acotada con --escala 1)
+DISTRITOS_POR_CAPITAL = 21
+
+COLUMNAS = {
+    "viajes": {
+        "es": ["fecha", "periodo", "origen", "destino", "distancia", "actividad_origen", "actividad_destino",
+               "estudio_origen_posible", "estudio_destino_posible", "residencia", "renta", "edad", "sexo",
+               "viajes", "viajes_km"],
+        "en": ["date", "period", "origin", "destination", "distance", "activity_origin", "activity_destination",
+               "study_possible_origin", "study_possible_destination", "residence", "income", "age", "sex",
+               "trips", "trips_km"],
+    },
+    "pernoctaciones": {
+        "es": ["fecha", "zona_residencia", "zona_pernoctacion", "personas"],
+        "en": ["date", "residence_area", "overnight_stay_area", "people"],
+    },
+}
+NOMBRE = {"viajes": "Viajes_distritos", "pernoctaciones": "Pernoctaciones_distritos"}
+_CATEGORIAS = {
+    "distancia": ["0.5-2", "2-10", "10-50", "50-100", ">100"],
+    "actividad": ["casa", "trabajo_estudio", "frecuente", "no_frecuente"],
+    "estudio": ["si", "no"],
+    "renta": ["<10", "10-15", ">15"],
+    "edad": ["0-25", "25-45", "45-65", "65-100", "NA"],
+    "sexo": ["hombre", "mujer", "NA"],
+}
+_ES = str.maketrans(",.", ".,")
+
+
+def variante(i: int) -> Tuple[str, str]:
+    """(idioma de cabecera, separador) del día i: recorre las 6 combinaciones."""
+    return ("es", "en")[i % 2], SEPARADORES[i % 3]
+
+
+def zonas_sinteticas(n: int = N_ZONAS, semilla: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """(IDs de distrito, pesos de origen tipo Zipf); Wanda con el peso máximo."""
+    rng = np.random.default_rng([semilla, 0])
+    ids = [f"{c}{k:02d}" for c in CAPITALES.values() for k in range(1, DISTRITOS_POR_CAPITAL + 1)]
+    vistos = set(CAPITALES.values())
+    while len(ids) < n:
+        muni = f"{rng.integers(1, 53):02d}{rng.integers(1, 999):03d}"
+        if muni in vistos:
+            continue
+        vistos.add(muni)
+        ids.append(f"{muni}{rng.integers(1, 4):02d}" + ("_AD" if rng.random() < 0.05 else ""))
+    ids = np.array(ids[:n], dtype=object)
+    pesos = 1.0 / np.arange(1, n + 1) ** 0.8
+    rng.shuffle(pesos)
+    pesos[np.flatnonzero(ids == DISTRITO_WANDA)] = pesos.max()
+    return ids, pesos / pesos.sum()
+
+
+def formato_es(valores: np.ndarray, decimales: int) -> List[str]:
+    """1234.5678 -> '1.234,568' (miles con '.', decimales con ',')."""
+    return [f"{v:,.{decimales}f}".translate(_ES) for v in valores]
+
+
+def formato_punto(valores: np.ndarray, decimales: int) -> List[str]:
+    """1234.5678 -> '1234.568' (sin miles, '.' decimal)."""
+    return [f"{v:.{decimales}f}" for v in valores]
+
+
+def _tabla_viajes(rng, ids, pesos, fecha: date, filas: int, sep: str) -> Tuple[Dict[str, object], float]:
+    o = rng.choice(len(ids), size=filas, p=pesos)
+    d = rng.choice(len(ids), size=filas, p=pesos)
+    viajes = rng.lognormal(mean=1.0, sigma=1.5, size=filas)
+    km = viajes * rng.gamma(2.0, 8.0, size=filas)
+    dec = 0 if sep == "," else 3
+    cat = lambda nombre: np.asarray(_CATEGORIAS[nombre], dtype=object)[rng.integers(0, len(_CATEGORIAS[nombre]), filas)]
+    tabla = {
+        "fecha": np.full(filas, fecha.strftime("%Y%m%d"), dtype=object),
+        "periodo": np.char.zfill(rng.integers(0, 24, filas).astype(str), 2),
+        "origen": ids[o],
+        "destino": ids[d],
+        "distancia": cat("distancia"),
+        "actividad_origen": cat("actividad"),
+        "actividad_destino": cat("actividad"),
+        "estudio_origen_posible": cat("estudio"),
+        "estudio_destino_posible": cat("estudio"),
+        "residencia": np.char.zfill(rng.integers(1, 53, filas).astype(str), 2),
+        "renta": cat("renta"),
+        "edad": cat("edad"),
+        "sexo": cat("sexo"),
+        "viajes": formato_es(viajes, dec),
+        "viajes_km": formato_es(km, dec),
+    }
+    # viajes es entero en el catálogo (esquema.py): se suma como lo deja parse_miles_int
+    return tabla, float(np.rint(np.round(viajes, dec)).sum())
+
+
+def _tabla_pernoctaciones(rng, ids, pesos, fecha: date, filas: int, sep: str) -> Tuple[Dict[str, object], float]:
+    r = rng.choice(len(ids), size=filas, p=pesos)
+    # la mitad duerme en su propia zona; el resto en cualquier otra
+    p = np.where(rng.random(filas) < 0.5, r, rng.choice(len(ids), size=filas, p=pesos))
+    personas = rng.lognormal(mean=2.0, sigma=1.8, size=filas)
+    dec = 0 if sep == "," else 3
+    tabla = {
+        "fecha": np.full(filas, fecha.strftime("%Y%m%d"), dtype=object),
+        "zona_residencia": ids[r],
+        "zona_pernoctacion": ids[p],
+        "personas": formato_punto(personas, dec),
+    }
+    return tabla, float(np.round(personas, dec).sum())
+
+
+def escribir_gz(bloques: Iterable[Dict[str, object]], columnas: List[str], path: Path, sep: str) -> int:
+    """
+    csv.gz determinista (mtime=0) escrito por bloques de filas. Ningún valor contiene
+    el separador, así que las líneas se unen sin comillas. Devuelve los bytes escritos.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=6, mtime=0) as gz:
+        gz.write((sep.join(columnas) + "\n").encode("utf-8"))
+        for tabla in bloques:
+            filas = zip(*(np.asarray(v, dtype=object) for v in tabla.values()))
+            gz.write(("\n".join(map(sep.join, filas)) + "\n").encode("utf-8"))
+    tmp.replace(path)
+    return path.stat().st_size
+
+
+MEDIDA = {"viajes": "viajes", "pernoctaciones": "personas"}
+
+
+def generar_dia(carpeta: Path, dataset: str, fecha: date, i: int, escala: float = 0.05, semilla: int = 0) -> Dict[str, object]:
+    """Un fichero del día; devuelve {ruta, filas, bytes, idioma, sep, suma} (suma de MEDIDA[dataset])."""
+    idioma, sep = variante(i)
+    ids, pesos = zonas_sinteticas(semilla=semilla)
+    rng = np.random.default_rng([semilla, 1 + list(NOMBRE).index(dataset), i])
+    filas = max(1, int(FILAS_DIA[dataset] * escala))
+    hacer = _tabla_viajes if dataset == "viajes" else _tabla_pernoctaciones
+    suma = 0.0
+
+    def bloques():
+        nonlocal suma
+        for ini in range(0, filas, BLOQUE):
+            tabla, s = hacer(rng, ids, pesos, fecha, min(BLOQUE, filas - ini), sep)
+            suma += s
+            yield tabla
+
+    path = Path(carpeta) / f"{fecha.strftime('%Y%m%d')}_{NOMBRE[dataset]}.csv.gz"
+    n_bytes = escribir_gz(bloques(), COLUMNAS[dataset][idioma], path, sep)
+    return {"ruta": str(path), "filas": filas, "bytes": n_bytes, "idioma": idioma, "sep": sep, "suma": suma}
+
+
+def generar(carpeta: Path, dias: int = 7, escala: float = 0.05, semilla: int = 0, inicio: date = date(2025, 3, 3)) -> Dict[str, List[Dict]]:
+    """Viajes y Pernoctaciones de `dias` días consecutivos desde `inicio`."""
+    out = {dataset: [] for dataset in NOMBRE}
+    for i in range(dias):
+        fecha = inicio + timedelta(days=i)
+        for dataset in NOMBRE:
+            info = generar_dia(carpeta, dataset, fecha, i, escala=escala, semilla=semilla)
+            info["fecha"] = fecha.isoformat()
+            out[dataset].append(info)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("carpeta", type=Path)
+    parser.add_argument("--dias", type=int, default=7)
+    parser.add_argument("--escala", type=float, default=0.05, help="fracción de FILAS_DIA (1 = tamaño real)")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    for dataset, dias in generar(args.carpeta, args.dias, args.escala, args.semilla).items():
+        for info in dias:
+            print(f"✓ {Path(info['ruta']).name}: {info['filas']:,} filas, {info['bytes'] / 1e6:.1f} MB "
+                  f"(cabecera {info['idioma']}, sep {info['sep']!r})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Catálogo de parquets MITMA en layout Hive (estudio/year=YYYY/month=MM/day=DD)
+=============================================================================
+Cada estudio (p.ej. "viajes_distritos", "pernoctaciones_distritos") es un dataset
+particionado por fecha bajo una carpeta base:
+
+    <base>/<estudio>/year=2025/month=03/day=01/20250301.parquet
+
+- ruta_particion(): dónde escribe cada día el descargador
+- abrir_rango()/abrir_dias(): dataset pyarrow perezoso que solo abre los ficheros
+  de las fechas pedidas (poda de particiones), con filtros/columnas opcionales
+- importar_planos(): mueve parquets antiguos planos (20250301*.parquet) al layout
+
+    python catalogo.py importar <carpeta_planos> <estudio> [--base <carpeta_base>]
+    python catalogo.py listar <base> <estudio>
+"""
+
+import argparse
+import re
+import shutil
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+ESTUDIOS = {
+    "viajes": "viajes_distritos",
+    "pernoctaciones": "pernoctaciones_distritos",
+}
+
+PARTICIONADO = ds.partitioning(
+    pa.schema([("year", pa.int16()), ("month", pa.int8()), ("day", pa.int8())]),
+    flavor="hive",
+)
+
+Fecha = Union[str, date, datetime]
+
+_RE_DIA = re.compile(r"^(\d{8})")
+
+
+def _a_fecha(f: Fecha) -> date:
+    if isinstance(f, datetime):
+        return f.date()
+    if isinstance(f, date):
+        return f
+    f = str(f)
+    fmt = "%Y-%m-%d" if "-" in f else "%Y%m%d"
+    return datetime.strptime(f, fmt).date()
+
+
+def ruta_particion(base: Path, estudio: str, fecha: Fecha) -> Path:
+    """Ruta del parquet de un día dentro del dataset del estudio."""
+    d = _a_fecha(fecha)
+    return (
+        Path(base) / estudio
+        / f"year={d.year:04d}" / f"month={d.month:02d}" / f"day={d.day:02d}"
+        / f"{d.strftime('%Y%m%d')}.parquet"
+    )
+
+
+def ficheros_dias(base: Path, estudio: str, fechas: Iterable[Fecha]) -> List[Path]:
+    """Parquets existentes para esas fechas (las que faltan se ignoran)."""
+    out = []
+    for f in fechas:
+        dia_dir = ruta_particion(base, estudio, f).parent
+        if dia_dir.is_dir():
+            out.extend(sorted(dia_dir.glob("*.parquet")))
+    return out
+
+
+def fechas_disponibles(base: Path, estudio: str) -> List[date]:
+    """Días con datos en el catálogo (según las carpetas de partición)."""
+    raiz = Path(base) / estudio
+    out = []
+    for dia_dir in raiz.glob("year=*/month=*/day=*"):
+        if any(dia_dir.glob("*.parquet")):
+            y = int(dia_dir.parent.parent.name.split("=")[1])
+            m = int(dia_dir.parent.name.split("=")[1])
+            d = int(dia_dir.name.split("=")[1])
+            out.append(date(y, m, d))
+    return sorted(out)
+
+
+def abrir_dias(base: Path, estudio: str, fechas: Iterable[Fecha]) -> ds.Dataset:
+    """
+    Dataset perezoso con SOLO los ficheros de esas fechas. Las columnas year/month/day
+    vienen de la partición. Lanza FileNotFoundError si no hay ninguno.
+    """
+    fechas = list(fechas)
+    files = ficheros_dias(base, estudio, fechas)
+    if not files:
+        raise FileNotFoundError(f"No hay parquets de {estudio} en {base} para {len(fechas)} fecha(s) pedida(s)")
+    return ds.dataset(
+        [str(p) for p in files],
+        format="parquet",
+        partitioning=PARTICIONADO,
+        partition_base_dir=str(Path(base) / estudio),
+    )
+
+
+def abrir_rango(base: Path, estudio: str, inicio: Fecha, fin: Fecha) -> ds.Dataset:
+    """Dataset perezoso para el rango [inicio, fin] (ambos incluidos)."""
+    d0, d1 = _a_fecha(inicio), _a_fecha(fin)
+    fechas = [d0 + timedelta(days=i) for i in range((d1 - d0).days + 1)]
+    return abrir_dias(base, estudio, fechas)
+
+
+def importar_planos(carpeta: Path, estudio: str, base: Optional[Path] = None, mover: bool = True) -> int:
+    """
+    Pasa parquets planos con nombre 'YYYYMMDD*.parquet' (p.ej. 20250301.parquet o
+    20250215_Viajes_distritos.parquet) al layout particionado. Devuelve cuántos.
+    """
+    carpeta = Path(carpeta)
+    base = Path(base) if base is not None else carpeta
+    n = 0
+    for path in sorted(carpeta.glob("*.parquet")):
+        m = _RE_DIA.match(path.name)
+        if not m:
+            continue
+        destino = ruta_particion(base, estudio, m.group(1))
+        if destino.exists():
+            print(f"  Ya en el catálogo: {destino}")
+            continue
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        (shutil.move if mover else shutil.copy2)(str(path), str(destino))
+        n += 1
+        print(f"  ✓ {path.name} -> {destino.relative_to(base)}")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catálogo particionado de parquets MITMA")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_imp = sub.add_parser("importar", help="mueve parquets planos YYYYMMDD*.parquet al layout year/month/day")
+    p_imp.add_argument("carpeta", type=Path)
+    p_imp.add_argument("estudio")
+    p_imp.add_argument("--base", type=Path, default=None)
+    p_imp.add_argument("--copiar", action="store_true", help="copiar en vez de mover")
+
+    p_lst = sub.add_parser("listar", help="días disponibles de un estudio")
+    p_lst.add_argument("base", type=Path)
+    p_lst.add_argument("estudio")
+
+    args = parser.parse_args()
+    if args.cmd == "importar":
+        n = importar_planos(args.carpeta, args.estudio, args.base, mover=not args.copiar)
+        print(f"Importados: {n}")
+    elif args.cmd == "listar":
+        fechas = fechas_disponibles(args.base, args.estudio)
+        print(f"{args.estudio}: {len(fechas)} días")
+        if fechas:
+            print(f"  desde {fechas[0]} hasta {fechas[-1]}")
+
+
+if __name__ == "__main__":
+    main()
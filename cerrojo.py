@@ -0,0 +1,40 @@
+"""
+Cerrojo por fichero entre procesos (sin dependencias)
+=====================================================
+Lo usan el manifest de descargas (descargas.py) y el diccionario de zonas del
+almacén de matrices OD (matriz_od.py): escrituras leer-modificar-escribir que
+pueden llegar a la vez desde varios procesos de un pool.
+
+    with bloqueo(path):          # crea <path>.lock con O_EXCL y lo borra al salir
+        ...
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def bloqueo(path: Path, espera: float = 0.05, caduca: float = 300.0):
+    """Cerrojo por fichero (O_EXCL) entre procesos; se rompe si lleva más de `caduca` segundos."""
+    path = Path(path)
+    lock = path.with_name(path.name + ".lock")
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock.stat().st_mtime > caduca:
+                    lock.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(espera)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        lock.unlink(missing_ok=True)
@@ -0,0 +1,311 @@
+"""
+Consultas sobre el catálogo de parquets con DuckDB (fuera de memoria, multihilo)
+===============================================================================
+Para cada pregunta nueva se escribía un script pandas que cargaba días enteros y
+hacía groupby. Aquí los parquets convertidos (catalogo.py) se consultan con DuckDB
+embebido: lee solo las columnas y row groups necesarios (filtros por zona como
+rangos min/max, ver lectura_zonas.py), agrega en streaming con todos los núcleos
+y, si no cabe, desborda a disco (temp_dir). Solo el resultado llega a pandas.
+
+Consultas preparadas:
+- top_destinos / top_origenes: top-N de destinos u orígenes de un conjunto de zonas
+- exodo_ciudades: éxodo y visitantes por ciudad y día (como exodo.calcular_exodo);
+  usa el cubo mun_mun de cubos.py si está para todo el rango
+- interanual: pivot zona x mes con una columna por año y la variación %
+
+    con = conectar(threads=8, memoria="4GB")
+    top = top_destinos(BASE, "2025-03-01", "2025-03-31", prefijos=["28079"], nivel="municipio", con=con)
+
+    python consultas.py top <base> --desde 2025-03-01 --hasta 2025-03-31 --prefijos 28079 [--entrada] [--nivel municipio]
+    python consultas.py exodo <base> --desde 2025-03-01 --hasta 2025-05-01
+    python consultas.py interanual <base> --desde 2025-03-01 --hasta 2025-03-31 --nivel provincia [--anios 2]
+"""
+
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from catalogo import ESTUDIOS, Fecha, _a_fecha, fechas_disponibles, ficheros_dias
+from cubos import NIVELES, elegir_cubo, estudio_cubo
+from lectura_zonas import _rangos
+
+try:
+    import duckdb
+except ImportError:  # opcional
+    duckdb = None
+
+# columnas de zona (salida, entrada) y medida de cada dataset
+ZONAS = {"viajes": ("origen", "destino"), "pernoctaciones": ("zona_residencia", "zona_pernoctacion")}
+MEDIDA = {"viajes": "viajes", "pernoctaciones": "personas"}
+
+
+def conectar(threads: Optional[int] = None, memoria: Optional[str] = None, temp_dir: Optional[Path] = None):
+    """
+    Conexión DuckDB en memoria. threads: nº de hilos (por defecto todos);
+    memoria: límite (p. ej. "4GB"); temp_dir: dónde desbordar agregados grandes.
+    """
+    if duckdb is None:
+        raise ImportError("Para las consultas instala la librería opcional: pip install duckdb")
+    con = duckdb.connect()
+    if threads:
+        con.execute(f"SET threads = {int(threads)}")
+    if memoria:
+        con.execute(f"SET memory_limit = {_lit(memoria)}")
+    if temp_dir:
+        con.execute(f"SET temp_directory = {_lit(str(temp_dir))}")
+    # el orden de llegada no importa en agregados: menos memoria en los scans
+    con.execute("SET preserve_insertion_order = false")
+    return con
+
+
+def _lit(s) -> str:
+    return "'" + str(s).replace("'", "''") + "'"
+
+
+def _dias(desde: Fecha, hasta: Fecha) -> List[date]:
+    d, fin = _a_fecha(desde), _a_fecha(hasta)
+    out = []
+    while d <= fin:
+        out.append(d)
+        d += timedelta(days=1)
+    return out
+
+
+def _fuente(base: Path, estudio: str, fechas: Iterable[Fecha]) -> str:
+    """read_parquet() solo sobre los ficheros de esas fechas (poda por partición)."""
+    files = ficheros_dias(base, estudio, fechas)
+    if not files:
+        raise FileNotFoundError(f"No hay parquets de {estudio} para esas fechas en {base}")
+    return f"read_parquet([{', '.join(_lit(p.as_posix()) for p in files)}])"
+
+
+def _filtro_zonas(col: str, zonas: Optional[Iterable[str]], prefijos: Optional[Iterable[str]]) -> str:
+    """Condición SQL por rangos de strings: DuckDB la contrasta con min/max de cada row group."""
+    rangos = _rangos(zonas, prefijos)
+    if not rangos:
+        return "TRUE"
+    partes = [f"{col} = {_lit(lo)}" if lo == hi else f"({col} >= {_lit(lo)} AND {col} <= {_lit(hi)})" for lo, hi in rangos]
+    return "(" + " OR ".join(partes) + ")"
+
+
+def _nivel(col: str, nivel: str) -> str:
+    n = NIVELES[nivel]
+    return col if n is None else f"substr({col}, 1, {n})"
+
+
+def _con(con):
+    return con if con is not None else conectar()
+
+
+# =========================
+# Top-N de flujos
+# =========================
+def top_flujos(
+    base: Path,
+    desde: Fecha,
+    hasta: Fecha,
+    zonas: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+    sentido: str = "salida",
+    n: int = 20,
+    nivel: str = "distrito",
+    periodos: Optional[Iterable[int]] = None,
+    con=None,
+) -> pd.DataFrame:
+    """
+    Viajes entre [desde, hasta] que salen de (sentido="salida") o llegan a
+    (sentido="entrada") las zonas/prefijos dados; top-N del otro extremo agregado a
+    `nivel`. Sin los viajes internos al conjunto.
+    Devuelve DF: zona, viajes, viajes_km, dias, pct (sobre el total fuera del conjunto).
+    """
+    if sentido not in ("salida", "entrada"):
+        raise ValueError(f"sentido desconocido: {sentido} (salida | entrada)")
+    if not zonas and not prefijos:
+        raise ValueError("Indica zonas o prefijos")
+    propia, otra = ZONAS["viajes"] if sentido == "salida" else ZONAS["viajes"][::-1]
+    cond = _filtro_zonas(propia, zonas, prefijos)
+    cond_periodo = f"AND periodo IN ({', '.join(str(int(p)) for p in periodos)})" if periodos else ""
+    sql = f"""
+        WITH f AS (
+            SELECT fecha, {_nivel(otra, nivel)} AS zona, viajes, viajes_km
+            FROM {_fuente(base, ESTUDIOS["viajes"], _dias(desde, hasta))}
+            WHERE {cond} AND NOT {_filtro_zonas(otra, zonas, prefijos)} {cond_periodo}
+        )
+        SELECT zona,
+               SUM(viajes) AS viajes,
+               SUM(viajes_km) AS viajes_km,
+               COUNT(DISTINCT fecha) AS dias,
+               100.0 * SUM(viajes) / SUM(SUM(viajes)) OVER () AS pct
+        FROM f
+        GROUP BY zona
+        ORDER BY viajes DESC, zona
+        LIMIT {int(n)}
+    """
+    return _con(con).execute(sql).df()
+
+
+def top_destinos(base: Path, desde: Fecha, hasta: Fecha, **kw) -> pd.DataFrame:
+    """Top-N destinos de los viajes que salen de las zonas dadas (ver top_flujos)."""
+    return top_flujos(base, desde, hasta, sentido="salida", **kw)
+
+
+def top_origenes(base: Path, desde: Fecha, hasta: Fecha, **kw) -> pd.DataFrame:
+    """Top-N orígenes de los viajes que llegan a las zonas dadas (ver top_flujos)."""
+    return top_flujos(base, desde, hasta, sentido="entrada", **kw)
+
+
+# =========================
+# Éxodo por ciudad
+# =========================
+def exodo_ciudades(
+    base: Path,
+    desde: Fecha,
+    hasta: Fecha,
+    ciudades: Dict[str, str],
+    con=None,
+) -> pd.DataFrame:
+    """
+    ciudades: {nombre: prefijo INE de 5 dígitos}. Por día y ciudad:
+    exodo_personas (residentes que duermen fuera) y visitantes_personas
+    (duermen en la ciudad sin residir en ella), igual que exodo.calcular_exodo.
+    Devuelve DF: fecha, ciudad, exodo_personas, visitantes_personas.
+    """
+    disponibles = set(fechas_disponibles(base, ESTUDIOS["pernoctaciones"]))
+    fechas = [f for f in _dias(desde, hasta) if f in disponibles]
+    prefijos = list(ciudades.values())
+    cubo = elegir_cubo(base, fechas, "municipio", "municipio", prefijos, None)
+    estudio = estudio_cubo(cubo) if cubo else ESTUDIOS["pernoctaciones"]
+    res, per = ZONAS["pernoctaciones"]
+    valores = ", ".join(f"({_lit(c)}, {_lit(p)}, {i})" for i, (c, p) in enumerate(ciudades.items()))
+    sql = f"""
+        WITH c(ciudad, prefijo, orden) AS (VALUES {valores}),
+        p AS (
+            SELECT fecha, substr({res}, 1, 5) AS mr, substr({per}, 1, 5) AS mp, personas
+            FROM {_fuente(base, estudio, fechas)}
+            WHERE {_filtro_zonas(res, None, prefijos)} OR {_filtro_zonas(per, None, prefijos)}
+        ),
+        e AS (
+            SELECT fecha, ciudad, orden, personas AS exodo, 0.0 AS visitantes FROM p JOIN c ON p.mr = c.prefijo WHERE p.mp <> c.prefijo
+            UNION ALL
+            SELECT fecha, ciudad, orden, 0.0, personas FROM p JOIN c ON p.mp = c.prefijo WHERE p.mr <> c.prefijo
+        )
+        SELECT fecha, ciudad, SUM(exodo) AS exodo_personas, SUM(visitantes) AS visitantes_personas
+        FROM e
+        GROUP BY fecha, ciudad, orden
+        ORDER BY fecha, orden
+    """
+    return _con(con).execute(sql).df()
+
+
+# =========================
+# Interanual
+# =========================
+def _mismo_dia(d: date, anio: int) -> date:
+    try:
+        return d.replace(year=anio)
+    except ValueError:  # 29 de febrero
+        return d.replace(year=anio, day=28)
+
+
+def interanual(
+    base: Path,
+    desde: Fecha,
+    hasta: Fecha,
+    dataset: str = "viajes",
+    columna: Optional[str] = None,
+    nivel: str = "provincia",
+    zonas: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+    anios: int = 1,
+    con=None,
+) -> pd.DataFrame:
+    """
+    El rango [desde, hasta] y el mismo rango `anios` años antes, agregados por
+    zona (`columna` a `nivel`, por defecto la zona de salida) y mes.
+    Devuelve DF pivotado: zona, mes, una columna por año y var_pct (último vs anterior).
+    Solo entran los días convertidos de cada año.
+    """
+    columna = columna or ZONAS[dataset][0]
+    d0, d1 = _a_fecha(desde), _a_fecha(hasta)
+    fechas = []
+    for k in range(anios + 1):
+        fechas += _dias(_mismo_dia(d0, d0.year - k), _mismo_dia(d1, d1.year - k))
+    sql = f"""
+        WITH f AS (
+            SELECT year(fecha) AS anio, month(fecha) AS mes, {_nivel(columna, nivel)} AS zona, {MEDIDA[dataset]} AS v
+            FROM {_fuente(base, ESTUDIOS[dataset], fechas)}
+            WHERE {_filtro_zonas(columna, zonas, prefijos)}
+        ),
+        a AS (SELECT zona, mes, anio, SUM(v) AS v FROM f GROUP BY ALL)
+        PIVOT a ON anio USING SUM(v) GROUP BY zona, mes ORDER BY zona, mes
+    """
+    df = _con(con).execute(sql).df()
+    anios_cols = sorted(c for c in df.columns if c not in ("zona", "mes"))
+    if len(anios_cols) >= 2:
+        ult, ant = df[anios_cols[-1]], df[anios_cols[-2]]
+        df["var_pct"] = ((ult / ant.where(ant != 0)) - 1) * 100
+    return df
+
+
+def _guardar_o_mostrar(df: pd.DataFrame, salida: Optional[Path]) -> None:
+    if salida is None:
+        print(df.to_string(index=False))
+    elif salida.suffix.lower() == ".parquet":
+        df.to_parquet(salida, index=False)
+        print(f"✓ Guardado: {salida}")
+    else:
+        df.to_csv(salida, index=False)
+        print(f"✓ Guardado: {salida}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas DuckDB sobre el catálogo MITMA")
+    comun = argparse.ArgumentParser(add_help=False)
+    comun.add_argument("base", type=Path)
+    comun.add_argument("--desde", required=True)
+    comun.add_argument("--hasta", required=True)
+    comun.add_argument("--threads", type=int, default=None)
+    comun.add_argument("--memoria", default=None, help='límite de memoria de DuckDB, p. ej. "4GB"')
+    comun.add_argument("--salida", type=Path, default=None, help=".csv o .parquet (si no, se imprime)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_t = sub.add_parser("top", parents=[comun], help="top-N destinos (u orígenes con --entrada) de unas zonas")
+    p_t.add_argument("--zonas", default="", help="IDs de distrito separados por comas")
+    p_t.add_argument("--prefijos", default="", help="prefijos INE (municipio 5, provincia 2) separados por comas")
+    p_t.add_argument("--entrada", action="store_true", help="orígenes de los viajes que llegan a las zonas")
+    p_t.add_argument("--nivel", choices=list(NIVELES), default="distrito")
+    p_t.add_argument("--n", type=int, default=20)
+
+    sub.add_parser("exodo", parents=[comun], help="éxodo/visitantes por capital (full.CAPITALES)")
+
+    p_i = sub.add_parser("interanual", parents=[comun], help="pivot zona x mes por año")
+    p_i.add_argument("--dataset", choices=list(ZONAS), default="viajes")
+    p_i.add_argument("--columna", default=None)
+    p_i.add_argument("--nivel", choices=list(NIVELES), default="provincia")
+    p_i.add_argument("--prefijos", default="")
+    p_i.add_argument("--anios", type=int, default=1)
+    args = parser.parse_args()
+
+    lista = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    con = conectar(threads=args.threads, memoria=args.memoria)
+    if args.cmd == "top":
+        df = top_flujos(
+            args.base, args.desde, args.hasta, zonas=lista(args.zonas), prefijos=lista(args.prefijos),
+            sentido="entrada" if args.entrada else "salida", n=args.n, nivel=args.nivel, con=con,
+        )
+    elif args.cmd == "exodo":
+        from full import CAPITALES
+        df = exodo_ciudades(args.base, args.desde, args.hasta, CAPITALES, con=con)
+    else:
+        df = interanual(
+            args.base, args.desde, args.hasta, dataset=args.dataset, columna=args.columna,
+            nivel=args.nivel, prefijos=lista(args.prefijos), anios=args.anios, con=con,
+        )
+    _guardar_o_mostrar(df, args.salida)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Cubos diarios precalculados de Pernoctaciones
+=============================================
+Al convertir cada día se guardan también totales de `personas` a niveles más gruesos
+(mismas columnas que el parquet de distritos, con la zona ya agregada):
+
+    dist_mun : distrito de residencia  -> municipio de pernoctación
+    mun_mun  : municipio               -> municipio
+    prov_prov: provincia               -> provincia
+
+Municipio = 5 primeros dígitos INE de la zona, provincia = 2 primeros.
+Cada cubo es un estudio más del catálogo (catalogo.py): "pernoctaciones_distritos_cubo_mun_mun", ...
+
+consultar() responde desde el cubo más pequeño que pueda servir la petición
+(niveles pedidos + longitud de los prefijos de filtro) y si ninguno vale, desde
+los distritos.
+
+Reconstruir los cubos de días ya convertidos:
+    python cubos.py construir <base> --desde 2025-03-01 --hasta 2025-05-01
+"""
+
+import argparse
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalogo import ESTUDIOS, Fecha, _a_fecha, fechas_disponibles, ficheros_dias, ruta_particion
+from esquema import escribir_parquet
+from lectura_zonas import leer_dias_zonas, mascara_zonas
+from metricas import etapa
+
+
+# nivel -> nº de caracteres del código (None = zona completa)
+NIVELES: Dict[str, Optional[int]] = {"distrito": None, "municipio": 5, "provincia": 2}
+_ORDEN_NIVEL = {"distrito": 0, "municipio": 1, "provincia": 2}
+
+# nombre -> (nivel residencia, nivel pernoctación); de más pequeño a más grande
+CUBOS: Dict[str, Tuple[str, str]] = {
+    "prov_prov": ("provincia", "provincia"),
+    "mun_mun": ("municipio", "municipio"),
+    "dist_mun": ("distrito", "municipio"),
+}
+
+ESTUDIO_BASE = ESTUDIOS["pernoctaciones"]
+
+
+def estudio_cubo(nombre: str) -> str:
+    return f"{ESTUDIO_BASE}_cubo_{nombre}"
+
+
+def a_nivel(zonas: pd.Series, nivel: str) -> pd.Series:
+    """Recorta los códigos de zona al nivel pedido (en categóricas el recorte se hace sobre las categorías)."""
+    n = NIVELES[nivel]
+    if not isinstance(zonas.dtype, pd.CategoricalDtype):
+        zonas = zonas.astype(str).astype("category")
+    cats = pd.Index(zonas.cat.categories.astype(str))
+    if n is not None:
+        cats = cats.str[:n]
+    # el código -1 (nulo) cae en la última posición
+    tabla = np.append(cats.to_numpy(dtype=object), None)
+    return pd.Series(tabla[zonas.cat.codes.to_numpy()], index=zonas.index, dtype=object)
+
+
+def agregar(df: pd.DataFrame, nivel_residencia: str, nivel_pernoctacion: str) -> pd.DataFrame:
+    """Suma personas por (fecha, zona_residencia, zona_pernoctacion) a los niveles pedidos."""
+    out = pd.DataFrame({
+        "fecha": df["fecha"],
+        "zona_residencia": a_nivel(df["zona_residencia"], nivel_residencia),
+        "zona_pernoctacion": a_nivel(df["zona_pernoctacion"], nivel_pernoctacion),
+        "personas": pd.to_numeric(df["personas"], errors="coerce").fillna(0.0),
+    })
+    return out.groupby(["fecha", "zona_residencia", "zona_pernoctacion"], as_index=False, sort=False)["personas"].sum()
+
+
+def escribir_cubos(df: pd.DataFrame, base: Path, fecha: Fecha) -> None:
+    """Materializa todos los cubos de un día (df = pernoctaciones de distritos normalizadas)."""
+    dia = _a_fecha(fecha).strftime("%Y%m%d")
+    for nombre, (nr, npern) in CUBOS.items():
+        with etapa("agregacion_cubos", dia=dia, filas=len(df), cubo=nombre):
+            cubo = agregar(df, nr, npern)
+        escribir_parquet(cubo, ruta_particion(base, estudio_cubo(nombre), fecha), "pernoctaciones")
+
+
+def asegurar_cubos(base: Path, fecha: Fecha) -> None:
+    """Genera los cubos de un día ya convertido si falta alguno (p. ej. días anteriores a los cubos)."""
+    if all(ruta_particion(base, estudio_cubo(n), fecha).exists() for n in CUBOS):
+        return
+    files = ficheros_dias(base, ESTUDIO_BASE, [fecha])
+    if not files:
+        raise FileNotFoundError(f"No hay parquet de {ESTUDIO_BASE} para {fecha} en {base}")
+    escribir_cubos(pd.concat([pd.read_parquet(p) for p in files], ignore_index=True), base, fecha)
+
+
+def _nivel_filtro(prefijos: Optional[Iterable[str]]) -> str:
+    """Nivel más grueso en el que se puede evaluar un filtro por prefijos."""
+    prefijos = [str(p) for p in (prefijos or [])]
+    if not prefijos:
+        return "provincia"
+    largo = max(len(p) for p in prefijos)
+    if largo <= NIVELES["provincia"]:
+        return "provincia"
+    if largo <= NIVELES["municipio"]:
+        return "municipio"
+    return "distrito"
+
+
+def _mas_fino(a: str, b: str) -> str:
+    return a if _ORDEN_NIVEL[a] <= _ORDEN_NIVEL[b] else b
+
+
+def elegir_cubo(
+    base: Path,
+    fechas: List[Fecha],
+    nivel_residencia: str,
+    nivel_pernoctacion: str,
+    residencia: Optional[Iterable[str]] = None,
+    pernoctacion: Optional[Iterable[str]] = None,
+) -> Optional[str]:
+    """Nombre del cubo más pequeño que sirve la petición para TODAS las fechas, o None (usar distritos)."""
+    need_r = _mas_fino(nivel_residencia, _nivel_filtro(residencia))
+    need_p = _mas_fino(nivel_pernoctacion, _nivel_filtro(pernoctacion))
+    for nombre, (cr, cp) in CUBOS.items():
+        if _ORDEN_NIVEL[cr] <= _ORDEN_NIVEL[need_r] and _ORDEN_NIVEL[cp] <= _ORDEN_NIVEL[need_p]:
+            if len(ficheros_dias(base, estudio_cubo(nombre), fechas)) == len(fechas):
+                return nombre
+    return None
+
+
+def consultar(
+    base: Path,
+    fechas: Iterable[Fecha],
+    nivel_residencia: str = "municipio",
+    nivel_pernoctacion: str = "municipio",
+    residencia: Optional[Iterable[str]] = None,
+    pernoctacion: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    Totales de personas por (fecha, zona_residencia, zona_pernoctacion) a los niveles pedidos,
+    filtrando por prefijos INE de residencia y/o pernoctación. Lee el cubo más pequeño posible.
+    """
+    fechas = [_a_fecha(f) for f in fechas]
+    residencia = [str(p) for p in (residencia or [])]
+    pernoctacion = [str(p) for p in (pernoctacion or [])]
+
+    cubo = elegir_cubo(base, fechas, nivel_residencia, nivel_pernoctacion, residencia, pernoctacion)
+    estudio = estudio_cubo(cubo) if cubo else ESTUDIO_BASE
+    print(f"  consulta servida desde: {estudio}")
+
+    df = leer_dias_zonas(
+        base, estudio, fechas, "zona_residencia", prefijos=residencia or None,
+        columns=["fecha", "zona_residencia", "zona_pernoctacion", "personas"],
+    )
+    if pernoctacion:
+        df = df[mascara_zonas(df["zona_pernoctacion"], prefijos=pernoctacion)]
+    return agregar(df, nivel_residencia, nivel_pernoctacion)
+
+
+def construir(base: Path, desde: Optional[Fecha] = None, hasta: Optional[Fecha] = None) -> int:
+    """Genera los cubos de los días de distritos ya convertidos en el catálogo. Devuelve cuántos días."""
+    n = 0
+    for d in fechas_disponibles(base, ESTUDIO_BASE):
+        if (desde and d < _a_fecha(desde)) or (hasta and d > _a_fecha(hasta)):
+            continue
+        for nombre in CUBOS:
+            ruta_particion(base, estudio_cubo(nombre), d).unlink(missing_ok=True)
+        asegurar_cubos(base, d)
+        n += 1
+        print(f"  ✓ cubos {d}")
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cubos diarios de Pernoctaciones")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("construir", help="genera los cubos de los días ya convertidos")
+    p_c.add_argument("base", type=Path)
+    p_c.add_argument("--desde", default=None)
+    p_c.add_argument("--hasta", default=None)
+    args = parser.parse_args()
+    if args.cmd == "construir":
+        print(f"Días procesados: {construir(args.base, args.desde, args.hasta)}")
+
+
+if __name__ == "__main__":
+    main()
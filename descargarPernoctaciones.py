@@ -3,7 +3,13 @@ from pathlib import Path
 from datetime import datetime, timedelta
 
 import pandas as pd
-import requests
+
+from catalogo import ESTUDIOS, ruta_particion
+from cubos import asegurar_cubos, escribir_cubos
+from descargas import download_many
+from dialecto_mitma import read_mitma_csv
+from esquema import escribir_parquet
+from metricas import configurar, etapa, imprimir_resumen, log_por_defecto
 
 
 OUTPUT_DIR = Path(r"C:\Users\khora\Downloads")
@@ -16,6 +22,13 @@ BASE_URL = (
 START_DATE = "2025-02-17"
 END_DATE   = "2025-02-17"
 
+# Descargas en paralelo (ver descargas.py)
+MAX_DESCARGAS = 4
+MAX_POR_HOST = 4
+
+# Dataset particionado OUTPUT_DIR/<ESTUDIO>/year=/month=/day= (ver catalogo.py)
+ESTUDIO = ESTUDIOS["pernoctaciones"]
+
 
 def daterange(start: str, end: str):
     d0 = datetime.strptime(start, "%Y-%m-%d").date()
@@ -26,50 +39,20 @@ def daterange(start: str, end: str):
         d += timedelta(days=1)
 
 
-def download_file(url: str, dest: Path) -> None:
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with open(dest, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-
-
 def read_mitma_csv_gz(path: Path) -> pd.DataFrame:
     """
-    Lee el CSV.gz probando separadores típicos del MITMA: '|', ';', ','.
-    Se queda con el separador que produzca MÁS columnas.
+    Lee el CSV.gz detectando el separador ('|', ';', ',') con los primeros KB
+    (cacheado por dataset/mes, ver dialecto_mitma.py) y parseando el fichero UNA sola vez.
+    Lanza ValueError si el separador no encaja.
     """
-    best_df = None
-    best_cols = 0
-    best_sep = None
-
-    for sep in ["|", ";", ","]:
-        try:
-            df = pd.read_csv(path, compression="gzip", sep=sep, dtype=str)
-            ncols = df.shape[1]
-            if ncols > best_cols:
-                best_df = df
-                best_cols = ncols
-                best_sep = sep
-        except Exception:
-            continue
-
-    if best_df is None or best_cols < 4:
-        raise ValueError(
-            f"No se pudo leer {path.name} con separadores esperados. "
-            f"Columnas obtenidas: {best_cols}. Último sep probado: {best_sep}"
-        )
-
-    return best_df
+    return read_mitma_csv(path, dataset="Pernoctaciones_distritos", dtype=str)
 
 
 def normalize_columns(df: pd.DataFrame, yyyymmdd: str) -> pd.DataFrame:
     """
     Deja el dataframe con columnas:
       fecha, zona_residencia, zona_pernoctacion, personas
-    (todas como string, como tus parquets existentes).
+    (todas como string; el tipado final lo aplica esquema.py al escribir).
     """
     colmap = {
         "date": "fecha",
@@ -101,34 +84,63 @@ def normalize_columns(df: pd.DataFrame, yyyymmdd: str) -> pd.DataFrame:
 
 def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    configurar(log_por_defecto(OUTPUT_DIR, "descargarPernoctaciones"))
 
+    dias = []
+    pendientes = []
     for d in daterange(START_DATE, END_DATE):
         yyyymm = d.strftime("%Y-%m")
         yyyymmdd = d.strftime("%Y%m%d")
 
         url = f"{BASE_URL}/{yyyymm}/{yyyymmdd}_Pernoctaciones_distritos.csv.gz"
         gz_path = OUTPUT_DIR / f"{yyyymmdd}_Pernoctaciones_distritos.csv.gz"
-        parquet_path = OUTPUT_DIR / f"{yyyymmdd}_Pernoctaciones_distritos.parquet"
-
-        if not gz_path.exists():
-            print(f"Descargando {url}")
-            download_file(url, gz_path)
-            print(f"Guardado: {gz_path}")
-        else:
-            print(f"Ya existe: {gz_path}")
+        parquet_path = ruta_particion(OUTPUT_DIR, ESTUDIO, d)
+        dias.append((yyyymmdd, gz_path, parquet_path))
 
+        # download_many se salta los gz ya completos y repite los truncados
         if not parquet_path.exists():
-            print(f"Convirtiendo a parquet: {parquet_path.name}")
-            df = read_mitma_csv_gz(gz_path)
-            df = normalize_columns(df, yyyymmdd)
-            df.to_parquet(parquet_path, index=False)
-            print(f"OK: {parquet_path}")
-            if gz_path.exists():
-                gz_path.unlink()
-                print(f"Eliminado: {gz_path.name}")
+            pendientes.append((url, gz_path))
         else:
-            print(f"Ya existe: {parquet_path}")
+            print(f"Ya existe parquet para {yyyymmdd}")
+
+    # 1) Descarga de todos los días pendientes con el pool compartido
+    errores = {}
+    if pendientes:
+        print(f"Comprobando/descargando {len(pendientes)} ficheros ({MAX_DESCARGAS} en paralelo)")
+        errores = download_many(pendientes, max_workers=MAX_DESCARGAS, max_por_host=MAX_POR_HOST)
+
+    # 2) Conversión día a día; un día que falla se anota y se sigue con el resto
+    fallidos = []
+    for yyyymmdd, gz_path, parquet_path in dias:
+        if errores.get(gz_path) is not None:
+            print(f"No se pudo descargar {yyyymmdd}. Puede que no exista ese día o el nombre cambie.")
+            fallidos.append(yyyymmdd)
+            continue
 
+        try:
+            if not parquet_path.exists():
+                print(f"Convirtiendo a parquet: {parquet_path.name}")
+                df = read_mitma_csv_gz(gz_path)
+                with etapa("normalizacion", dia=yyyymmdd, filas=len(df)):
+                    df = normalize_columns(df, yyyymmdd)
+                escribir_parquet(df, parquet_path, "pernoctaciones")
+                # Totales por municipio/provincia del mismo día (cubos.py)
+                escribir_cubos(df, OUTPUT_DIR, yyyymmdd)
+                print(f"OK: {parquet_path}")
+                if gz_path.exists():
+                    gz_path.unlink()
+                    print(f"Eliminado: {gz_path.name}")
+            else:
+                asegurar_cubos(OUTPUT_DIR, yyyymmdd)
+                print(f"Ya existe: {parquet_path}")
+        except Exception as e:
+            # se queda el gz para reintentar en la siguiente ejecución
+            print(f"⚠️ Error procesando {yyyymmdd}: {e}")
+            fallidos.append(yyyymmdd)
+
+    imprimir_resumen()
+    if fallidos:
+        print(f"⚠️ Días sin procesar ({len(fallidos)}): {', '.join(fallidos)}")
     print("Terminado.")
 
 
@@ -1,9 +1,25 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
 
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from catalogo import ESTUDIOS, ruta_particion
+from descargas import download_many
+from dialecto_mitma import abrir_gz, detectar_dialecto
+from esquema import COMPRESION, aplicar_esquema, escribir_parquet
+from matriz_od import asegurar_matriz
+from metricas import configurar, dia_de, etapa, imprimir_resumen, log_por_defecto
+from numeros import parse_miles_float, parse_miles_int
+
+try:
+    import psutil
+except ImportError:
+    psutil = None  # opcional: sin él, MAX_CONVERSIONES_SIN_STREAMING fijo
 
 
 OUTPUT_DIR = Path(r"C:\Users\khora\Downloads")
@@ -16,6 +32,28 @@ BASE_URL = (
 START_DATE = "2025-02-15"
 END_DATE   = "2025-02-15"
 
+# Descargas en paralelo (ver descargas.py)
+MAX_DESCARGAS = 4
+MAX_POR_HOST = 4
+
+# Dataset particionado OUTPUT_DIR/<ESTUDIO>/year=/month=/day= (ver catalogo.py)
+ESTUDIO = ESTUDIOS["viajes"]
+
+# Conversión gz -> parquet: un proceso por fichero, tantos como núcleos
+MAX_CONVERSIONES = os.cpu_count() or 1
+# Sin streaming cada proceso carga el día entero en pandas: los procesos se limitan por la
+# memoria disponible (psutil) a razón de MEMORIA_DIA_SIN_STREAMING, o a este tope sin psutil
+MAX_CONVERSIONES_SIN_STREAMING = 1
+MEMORIA_DIA_SIN_STREAMING = 8 * 1024**3  # estimación para un día de distritos (~15-20M filas)
+
+# Conversión en streaming: memoria acotada por BATCH_SIZE/ROW_GROUP_SIZE, no por el tamaño del día
+MODO_STREAMING = True
+BATCH_SIZE = 500_000        # filas leídas del gz por lote
+ROW_GROUP_SIZE = 1_000_000  # filas por row group en el parquet
+
+# Matriz OD memory-mapped del día tras convertir (matriz_od.py; la usan pie.py/eventos.py con OD_DIR)
+MATRIZ_OD = False
+
 
 def daterange(start: str, end: str):
     d0 = datetime.strptime(start, "%Y-%m-%d").date()
@@ -26,78 +64,26 @@ def daterange(start: str, end: str):
         d += timedelta(days=1)
 
 
-def download_file(url: str, dest: Path) -> None:
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=120) as r:
-        r.raise_for_status()
-        with open(dest, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-
-
 def read_mitma_csv_gz(path: Path) -> pd.DataFrame:
-    return pd.read_csv(
-        path,
-        compression="gzip",
-        sep="|",
-        dtype="string",
-        low_memory=False,
-    )
-
-
-
-def parse_miles_int(series: pd.Series) -> pd.Series:
-    """
-    Para conteos tipo '2.788' => 2788
-    Si viene con coma decimal (raro en viajes), lo redondea.
-    """
-    s = series.astype("string").fillna("0").str.strip()
-    has_comma = s.str.contains(",", na=False)
-
-    s_comma = (
-        s.where(has_comma, "0")
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-    )
-
-    s_nocomma = (
-        s.where(~has_comma, "0")
-        .str.replace(r"[^\d\-]", "", regex=True)
-    )
-
-    merged = s_nocomma.where(~has_comma, s_comma)
-    num = pd.to_numeric(merged, errors="coerce").fillna(0)
-    return num.round().astype("int64")
-
+    sep, _ = detectar_dialecto(path, "Viajes_distritos")
+    with etapa("lectura_csv", dia=dia_de(path), bytes_in=Path(path).stat().st_size) as m, abrir_gz(path) as f:
+        df = pd.read_csv(
+            f,
+            sep=sep,
+            dtype="string",
+            low_memory=False,
+        )
+        m["filas"] = len(df)
+    return df
 
-def parse_miles_float(series: pd.Series) -> pd.Series:
-    """
-    Para km tipo '4.678' => 4678 (si fueran km enteros) o '1.234,56' => 1234.56
-    Lo devuelve float.
-    """
-    s = series.astype("string").fillna("0").str.strip()
-    has_comma = s.str.contains(",", na=False)
-
-    s_comma = (
-        s.where(has_comma, "0")
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-    )
-    s_nocomma = (
-        s.where(~has_comma, "0")
-        .str.replace(".", "", regex=False)   # en km suele ser miles con punto
-        .str.replace(r"[^\d\-]", "", regex=True)
-    )
-    merged = s_nocomma.where(~has_comma, s_comma)
-    return pd.to_numeric(merged, errors="coerce").fillna(0.0).astype(float)
 
 
 def normalize_columns(df: pd.DataFrame, yyyymmdd: str) -> pd.DataFrame:
     """
     Deja el dataframe con columnas estándar:
       fecha, origen, destino, periodo, residencia, renta, edad, sexo, viajes, viajes_km
-    Todas como string salvo viajes(int) y viajes_km(float).
+    Todas como string salvo viajes(int) y viajes_km(float); el tipado final
+    (categorías, int8, date) lo aplica esquema.py al escribir.
     """
     colmap = {
         # fecha
@@ -163,9 +149,161 @@ def normalize_columns(df: pd.DataFrame, yyyymmdd: str) -> pd.DataFrame:
     return df[cols]
 
 
+def stream_gz_to_parquet(
+    gz_path: Path,
+    parquet_path: Path,
+    yyyymmdd: str,
+    batch_size: int = BATCH_SIZE,
+    row_group_size: int = ROW_GROUP_SIZE,
+    compression: str = COMPRESION,
+) -> int:
+    """
+    Convierte el csv.gz a parquet por lotes: lee batch_size filas, las pasa por
+    normalize_columns (mismo mapeo de columnas) + esquema canónico (esquema.py) y las
+    escribe con un ParquetWriter incremental en row groups de row_group_size filas.
+    Escribe a un .tmp y renombra al final. Devuelve el nº de filas escritas.
+    Las filas se escriben en el orden del gz (no hay orden global por origen como en
+    escribir_parquet), así que la poda por row groups depende de cómo venga el fichero.
+    """
+    parquet_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = parquet_path.with_name(parquet_path.name + ".tmp")
+    sep, _ = detectar_dialecto(gz_path, "Viajes_distritos")
+    with abrir_gz(gz_path) as f:
+        chunks = pd.read_csv(
+            f,
+            sep=sep,
+            dtype="string",
+            chunksize=batch_size,
+            low_memory=True,
+        )
+
+        writer = None
+        pendientes = []
+        n_pendientes = 0
+        total = 0
+
+        def _flush(final: bool = False):
+            # escribe solo row groups completos; el resto espera al siguiente lote
+            nonlocal pendientes, n_pendientes
+            if not pendientes:
+                return
+            t = pa.concat_tables(pendientes)
+            n = t.num_rows if final else (t.num_rows // row_group_size) * row_group_size
+            with etapa("parquet", dia=yyyymmdd, filas=n):
+                writer.write_table(t.slice(0, n), row_group_size=row_group_size)
+            resto = t.slice(n)
+            pendientes, n_pendientes = ([resto], resto.num_rows) if resto.num_rows else ([], 0)
+
+        try:
+            while True:
+                with etapa("lectura_csv", dia=yyyymmdd) as m:
+                    ch = next(chunks, None)
+                    m["filas"] = 0 if ch is None else len(ch)
+                if ch is None:
+                    break
+                with etapa("normalizacion", dia=yyyymmdd, filas=len(ch)):
+                    df = normalize_columns(ch, yyyymmdd)
+                with etapa("esquema", dia=yyyymmdd, filas=len(df)):
+                    table = aplicar_esquema(df, "viajes")
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression=compression)
+
+                pendientes.append(table)
+                n_pendientes += table.num_rows
+                total += table.num_rows
+                if n_pendientes >= row_group_size:
+                    _flush()
+
+            if writer is None:
+                # fichero sin filas: parquet vacío con las columnas estándar
+                with abrir_gz(gz_path) as g:
+                    empty = normalize_columns(pd.read_csv(g, sep=sep, dtype="string", nrows=0), yyyymmdd)
+                pq.write_table(aplicar_esquema(empty, "viajes"), tmp_path, compression=compression)
+            else:
+                _flush(final=True)
+                writer.close()
+                writer = None
+        finally:
+            if writer is not None:
+                writer.close()
+                tmp_path.unlink(missing_ok=True)
+
+    tmp_path.replace(parquet_path)
+    return total
+
+
+def convertir_dia(gz_path: Path, parquet_path: Path, yyyymmdd: str, streaming: bool = MODO_STREAMING) -> int:
+    """Un gz -> parquet del catálogo, sin csv descomprimido en disco. Devuelve el nº de filas."""
+    with etapa("conversion", dia=yyyymmdd, bytes_in=gz_path.stat().st_size) as m:
+        if streaming:
+            n = stream_gz_to_parquet(gz_path, parquet_path, yyyymmdd)
+        else:
+            df = read_mitma_csv_gz(gz_path)
+            with etapa("normalizacion", dia=yyyymmdd, filas=len(df)):
+                df = normalize_columns(df, yyyymmdd)
+            escribir_parquet(df, parquet_path, "viajes")
+            n = len(df)
+        m["filas"] = n
+        m["bytes_out"] = parquet_path.stat().st_size
+    return n
+
+
+def procesos_conversion(n_tareas: int, max_workers: int = MAX_CONVERSIONES, streaming: bool = MODO_STREAMING) -> int:
+    """Procesos para convertir n_tareas días: por núcleos en streaming, por memoria si no."""
+    workers = min(max_workers, n_tareas)
+    if not streaming:
+        if psutil is not None:
+            tope = psutil.virtual_memory().available // MEMORIA_DIA_SIN_STREAMING
+        else:
+            tope = MAX_CONVERSIONES_SIN_STREAMING
+        workers = min(workers, tope)
+    return max(1, int(workers))
+
+
+def convertir_en_paralelo(
+    tareas: Iterable[Tuple[Path, Path, str]],
+    max_workers: int = MAX_CONVERSIONES,
+    streaming: bool = MODO_STREAMING,
+    borrar_gz: bool = True,
+) -> Dict[Path, Optional[Exception]]:
+    """
+    Convierte una lista de (gz_path, parquet_path, yyyymmdd) en un pool de procesos
+    (uno por fichero; en streaming cada uno con memoria acotada por BATCH_SIZE, sin
+    streaming tantos como quepan en memoria, ver procesos_conversion).
+    Devuelve {gz_path: None si OK, o la excepción si falló}; nunca lanza por un fichero suelto.
+    """
+    tareas = list(tareas)
+    resultados: Dict[Path, Optional[Exception]] = {}
+    if not tareas:
+        return resultados
+    with ProcessPoolExecutor(max_workers=procesos_conversion(len(tareas), max_workers, streaming)) as ex:
+        futuros = {
+            ex.submit(convertir_dia, gz_path, parquet_path, yyyymmdd, streaming): (gz_path, parquet_path)
+            for gz_path, parquet_path, yyyymmdd in tareas
+        }
+        for fut in as_completed(futuros):
+            gz_path, parquet_path = futuros[fut]
+            try:
+                n = fut.result()
+            except Exception as e:
+                print(f"⚠️ Error convirtiendo {gz_path.name}: {e}")
+                resultados[gz_path] = e
+                continue
+            resultados[gz_path] = None
+            print(f"OK: {parquet_path} ({n:,} filas)")
+            # borra gz para ahorrar espacio
+            if borrar_gz and gz_path.exists():
+                gz_path.unlink()
+                print(f"Eliminado: {gz_path.name}")
+    return resultados
+
+
 def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    configurar(log_por_defecto(OUTPUT_DIR, "descargarViajes"))
 
+    dias = []
+    pendientes = []
     for d in daterange(START_DATE, END_DATE):
         yyyymm = d.strftime("%Y-%m")
         yyyymmdd = d.strftime("%Y%m%d")
@@ -174,33 +312,41 @@ def main():
         url = f"{BASE_URL}/{yyyymm}/{yyyymmdd}_Viajes_distritos.csv.gz"
 
         gz_path = OUTPUT_DIR / f"{yyyymmdd}_Viajes_distritos.csv.gz"
-        parquet_path = OUTPUT_DIR / f"{yyyymmdd}_Viajes_distritos.parquet"
-
-        if not gz_path.exists() and not parquet_path.exists():
-            print(f"Descargando {url}")
-            try:
-                download_file(url, gz_path)
-            except requests.HTTPError as e:
-                print(f"No se pudo descargar ({e}). Puede que no exista ese día o el nombre cambie.")
-                continue
-            print(f"Guardado: {gz_path}")
-        else:
-            print(f"Ya existe (gz o parquet) para {yyyymmdd}")
+        parquet_path = ruta_particion(OUTPUT_DIR, ESTUDIO, d)
+        dias.append((yyyymmdd, gz_path, parquet_path))
 
+        # download_many se salta los gz ya completos y repite los truncados
         if not parquet_path.exists():
-            print(f"Convirtiendo a parquet: {parquet_path.name}")
-            df = read_mitma_csv_gz(gz_path)
-            df = normalize_columns(df, yyyymmdd)
-            df.to_parquet(parquet_path, index=False)
-            print(f"OK: {parquet_path}")
-
-            # borra gz para ahorrar espacio
-            if gz_path.exists():
-                gz_path.unlink()
-                print(f"Eliminado: {gz_path.name}")
+            pendientes.append((url, gz_path))
         else:
+            print(f"Ya existe parquet para {yyyymmdd}")
+
+    # 1) Descarga de todos los días pendientes con el pool compartido
+    errores = {}
+    if pendientes:
+        print(f"Comprobando/descargando {len(pendientes)} ficheros ({MAX_DESCARGAS} en paralelo)")
+        errores = download_many(pendientes, max_workers=MAX_DESCARGAS, max_por_host=MAX_POR_HOST)
+
+    # 2) Conversión: un proceso por fichero (gz -> parquet sin csv intermedio)
+    tareas = []
+    for yyyymmdd, gz_path, parquet_path in dias:
+        if errores.get(gz_path) is not None:
+            print(f"No se pudo descargar {yyyymmdd}. Puede que no exista ese día o el nombre cambie.")
+        elif parquet_path.exists():
             print(f"Ya existe: {parquet_path}")
-
+        else:
+            tareas.append((gz_path, parquet_path, yyyymmdd))
+    if tareas:
+        print(f"Convirtiendo a parquet {len(tareas)} ficheros ({procesos_conversion(len(tareas))} procesos)")
+        convertir_en_paralelo(tareas)
+
+    if MATRIZ_OD:
+        for yyyymmdd, _, parquet_path in dias:
+            if parquet_path.exists():
+                asegurar_matriz(OUTPUT_DIR, "viajes", yyyymmdd)
+                print(f"OK: matriz OD {yyyymmdd}")
+
+    imprimir_resumen()
     print("Terminado.")
 
 
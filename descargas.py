@@ -0,0 +1,288 @@
+"""
+Motor de descarga compartido para los ficheros diarios del MITMA
+================================================================
+- Sesión HTTP reutilizada por hilo (keep-alive: un solo handshake TLS por worker)
+- Pool de workers acotado (MAX_WORKERS) y límite de conexiones simultáneas por host
+- Descarga a "<fichero>.part" y renombrado atómico al terminar
+- Reanudación con cabecera Range (+ If-Range con el ETag) si se corta a medias
+- Verificación de tamaño (Content-Length) y de integridad gzip antes de dar un fichero por bueno
+- Manifest JSON por carpeta (manifest_descargas.json) con tamaño/ETag de cada descarga
+- Lo usan descargarViajes.py, descargarPernoctaciones.py y full.py
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cerrojo import bloqueo
+from metricas import dia_de, etapa
+
+
+MAX_WORKERS = 4      # descargas simultáneas en total
+MAX_POR_HOST = 4     # conexiones simultáneas contra un mismo host
+TIMEOUT = 120
+CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_NAME = "manifest_descargas.json"
+PART_SUFFIX = ".part"
+
+_local = threading.local()
+_manifest_lock = threading.Lock()
+
+
+def get_session(max_por_host: int = MAX_POR_HOST) -> requests.Session:
+    """
+    Devuelve la sesión del hilo actual (la crea la primera vez).
+    Cada worker mantiene su conexión abierta entre ficheros, así que
+    no se repite el handshake TLS por cada día descargado.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        retry = Retry(
+            total=3,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_por_host, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+
+# =========================
+# Manifest
+# =========================
+def leer_manifest(directorio: Path) -> Dict[str, dict]:
+    """Devuelve {nombre_fichero: entrada} del manifest de la carpeta (vacío si no existe)."""
+    path = Path(directorio) / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _registrar(dest: Path, **entrada) -> None:
+    """
+    Actualiza la entrada de dest en el manifest (escritura atómica). Segura entre hilos
+    y entre procesos (pipeline.py, convertir_en_paralelo): leer-modificar-escribir bajo
+    un cerrojo de fichero y .tmp con nombre único.
+    """
+    path = dest.parent / MANIFEST_NAME
+    with _manifest_lock, bloqueo(path):
+        manifest = leer_manifest(dest.parent)
+        entrada["actualizado"] = datetime.now().isoformat(timespec="seconds")
+        manifest[dest.name] = entrada
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=dest.parent, prefix=MANIFEST_NAME + ".", suffix=".tmp", delete=False
+        ) as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(f.name, path)
+
+
+# =========================
+# Verificación
+# =========================
+def gzip_ok(path: Path) -> bool:
+    """Descomprime el fichero entero en streaming (sin guardarlo) para detectar gz truncados/corruptos."""
+    try:
+        with gzip.open(path, "rb") as f:
+            while f.read(CHUNK_SIZE):
+                pass
+        return True
+    except (OSError, EOFError, zlib.error):
+        return False
+
+
+def descarga_completa(dest: Path, comprobar_gzip: bool = True) -> bool:
+    """
+    True si dest es una descarga completa y válida:
+    - registrada en el manifest con el mismo tamaño, o
+    - (ficheros antiguos sin registrar) pasa la comprobación gzip; en ese caso se registra.
+    """
+    dest = Path(dest)
+    if not dest.exists():
+        return False
+
+    entrada = leer_manifest(dest.parent).get(dest.name)
+    size = dest.stat().st_size
+    if entrada and entrada.get("estado") == "completo":
+        return entrada.get("bytes") == size
+
+    if not (comprobar_gzip and dest.name.endswith(".gz")):
+        return True
+
+    if gzip_ok(dest):
+        _registrar(dest, estado="completo", bytes=size, etag=None, url=None, verificado="gzip")
+        return True
+    return False
+
+
+def _total_desde_respuesta(r: requests.Response, offset: int) -> Optional[int]:
+    """Tamaño total esperado del fichero según Content-Range (206) o Content-Length (200)."""
+    if r.status_code == 206:
+        rango = r.headers.get("Content-Range", "")
+        total = rango.rsplit("/", 1)[-1]
+        if total.isdigit():
+            return int(total)
+        largo = r.headers.get("Content-Length")
+        return offset + int(largo) if largo and largo.isdigit() else None
+    largo = r.headers.get("Content-Length")
+    return int(largo) if largo and largo.isdigit() else None
+
+
+# =========================
+# Descarga
+# =========================
+def download_file(
+    url: str,
+    dest: Path,
+    session: Optional[requests.Session] = None,
+    timeout: int = TIMEOUT,
+    comprobar_gzip: bool = True,
+) -> None:
+    """
+    Descarga url -> dest de forma reanudable y atómica.
+    Escribe en dest + '.part'; si ya existe un .part de una ejecución anterior pide solo
+    los bytes que faltan (Range). Al terminar comprueba tamaño y gzip, renombra a dest
+    y lo anota en el manifest. Lanza requests.HTTPError / IOError si falla.
+    """
+    with etapa("descarga", dia=dia_de(dest)) as m:
+        _descargar(url, dest, session, timeout, comprobar_gzip)
+        m["bytes_out"] = Path(dest).stat().st_size
+
+
+def _descargar(url: str, dest: Path, session: Optional[requests.Session], timeout: int, comprobar_gzip: bool) -> None:
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + PART_SUFFIX)
+    session = session or get_session()
+
+    offset = part.stat().st_size if part.exists() else 0
+    previa = leer_manifest(dest.parent).get(dest.name, {})
+
+    headers = {}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        # si el fichero remoto cambió desde el .part, el servidor devuelve 200 con el fichero entero
+        if previa.get("estado") == "parcial" and previa.get("etag"):
+            headers["If-Range"] = previa["etag"]
+
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 416:
+            # Range fuera del fichero: lo normal es que el .part ya esté completo
+            # (Content-Range: bytes */N con N == offset). Si no encaja, de cero.
+            total = r.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if total.isdigit() and int(total) == offset:
+                try:
+                    return _finalizar(part, dest, url, previa.get("etag"), comprobar_gzip)
+                except IOError:
+                    pass  # gzip corrupto: _finalizar ya borró el .part
+            part.unlink(missing_ok=True)
+            return _descargar(url, dest, session, timeout, comprobar_gzip)
+        r.raise_for_status()
+
+        if r.status_code != 206:
+            offset = 0
+        total = _total_desde_respuesta(r, offset)
+        etag = r.headers.get("ETag")
+        _registrar(dest, estado="parcial", bytes=total, etag=etag, url=url)
+
+        with open(part, "ab" if offset else "wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+
+    size = part.stat().st_size
+    if total is not None and size != total:
+        # se queda el .part para reanudar en la siguiente ejecución
+        raise IOError(f"Descarga incompleta de {dest.name}: {size} de {total} bytes")
+    _finalizar(part, dest, url, etag, comprobar_gzip)
+
+
+def _finalizar(part: Path, dest: Path, url: str, etag: Optional[str], comprobar_gzip: bool) -> None:
+    """Verifica el .part (gzip), lo renombra a dest y lo anota como completo."""
+    size = part.stat().st_size
+    if comprobar_gzip and dest.name.endswith(".gz"):
+        with etapa("verificacion_gzip", dia=dia_de(dest), bytes_in=size):
+            ok = gzip_ok(part)
+        if not ok:
+            part.unlink(missing_ok=True)
+            raise IOError(f"gzip corrupto tras descargar {dest.name}; se borra para repetirlo")
+
+    os.replace(part, dest)
+    _registrar(dest, estado="completo", bytes=size, etag=etag, url=url, verificado="gzip" if comprobar_gzip else "tamaño")
+
+
+def download_many(
+    tareas: Iterable[Tuple[str, Path]],
+    max_workers: int = MAX_WORKERS,
+    max_por_host: int = MAX_POR_HOST,
+    timeout: int = TIMEOUT,
+    verbose: bool = True,
+) -> Dict[Path, Optional[Exception]]:
+    """
+    Descarga en paralelo una lista de (url, dest), saltándose las que ya están completas.
+    Si dest existe pero está truncado o corrupto se borra y se vuelve a pedir.
+    Devuelve {dest: None si OK, o la excepción si falló}; nunca lanza por un fichero suelto.
+    """
+    resultados: Dict[Path, Optional[Exception]] = {}
+    pendientes = []
+    for url, dest in tareas:
+        dest = Path(dest)
+        if descarga_completa(dest):
+            resultados[dest] = None
+            if verbose:
+                print(f"Ya descargado: {dest.name}")
+            continue
+        if dest.exists():
+            if verbose:
+                print(f"Fichero incompleto o corrupto, se repite: {dest.name}")
+            dest.unlink()
+        pendientes.append((url, dest))
+
+    if not pendientes:
+        return resultados
+
+    # Un semáforo por host para no abrir más de max_por_host conexiones contra el mismo servidor
+    semaforos = {
+        urlparse(url).netloc: threading.BoundedSemaphore(max_por_host)
+        for url, _ in pendientes
+    }
+
+    def _worker(url: str, dest: Path) -> None:
+        with semaforos[urlparse(url).netloc]:
+            download_file(url, dest, session=get_session(max_por_host), timeout=timeout)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futuros = {pool.submit(_worker, url, dest): (url, dest) for url, dest in pendientes}
+        for fut in as_completed(futuros):
+            url, dest = futuros[fut]
+            try:
+                fut.result()
+                resultados[dest] = None
+                if verbose:
+                    print(f"Guardado: {dest}")
+            except Exception as e:
+                resultados[dest] = e
+                if verbose:
+                    print(f"No se pudo descargar {url} ({e})")
+
+    return resultados
@@ -1,17 +1,49 @@
-import gzip
-import shutil
+"""
+Convierte todos los .gz de Viajes de un directorio al catálogo parquet
+=====================================================================
+Antes se descomprimía cada .gz a .csv en disco (~10x el tamaño) para volver a
+parsearlo después. Ahora cada gz se lee en streaming y se escribe directamente el
+parquet canónico (descargarViajes.convertir_en_paralelo), un proceso por fichero y
+con el inflado más rápido instalado (isal / zlib-ng, ver dialecto_mitma.abrir_gz).
+"""
+
 from pathlib import Path
 
-# Cambia esta ruta por tu directorio
+from catalogo import ruta_particion
+from descargarViajes import ESTUDIO, convertir_en_paralelo, procesos_conversion
+from dialecto_mitma import GZIP_BACKEND
+from metricas import configurar, imprimir_resumen, log_por_defecto
+
+# Cambia estas rutas por tus directorios
 directorio = Path(r"C:\Users\khora\Downloads\viajes")
+salida = directorio  # base del catálogo: <salida>/viajes_distritos/year=/month=/day=
+
+BORRAR_GZ = False
+
+
+def tareas_directorio(directorio: Path, salida: Path):
+    """(gz, parquet, yyyymmdd) de los .gz del directorio que aún no tienen parquet."""
+    for gz_file in sorted(directorio.glob("*.gz")):
+        yyyymmdd = gz_file.name[:8]
+        if not yyyymmdd.isdigit():
+            print(f"⚠️ Sin fecha YYYYMMDD en el nombre, se salta: {gz_file.name}")
+            continue
+        parquet_path = ruta_particion(salida, ESTUDIO, yyyymmdd)
+        if parquet_path.exists():
+            print(f"Ya existe: {parquet_path}")
+            continue
+        yield gz_file, parquet_path, yyyymmdd
 
-for gz_file in directorio.glob("*.gz"):
-    output_file = gz_file.with_suffix("")  # quita el .gz (ej: .csv.gz -> .csv)
 
-    print(f"Descomprimiendo: {gz_file.name} -> {output_file.name}")
+def main():
+    configurar(log_por_defecto(salida, "descomprimirViajes"))
+    tareas = list(tareas_directorio(directorio, salida))
+    print(f"Convirtiendo {len(tareas)} .gz a parquet ({procesos_conversion(max(len(tareas), 1))} procesos, inflado: {GZIP_BACKEND})")
+    resultados = convertir_en_paralelo(tareas, borrar_gz=BORRAR_GZ)
+    fallos = sum(e is not None for e in resultados.values())
+    print(f" Listo: {len(resultados) - fallos} convertidos, {fallos} con error.")
+    imprimir_resumen()
 
-    with gzip.open(gz_file, "rb") as f_in:
-        with open(output_file, "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
 
-print(" Listo: todos los .gz han sido descomprimidos.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Esquema canónico (versionado) de los parquets normalizados del MITMA
+====================================================================
+- Zonas y desagregaciones como diccionario (categorical en pandas)
+- periodo int8, fecha como date, conteos numéricos
+- Versión del esquema guardada en los metadatos del parquet (mitma_esquema_version)
+- Compresión configurable (COMPRESION)
+- Filas ordenadas por la zona principal y row groups de FILAS_POR_GRUPO filas
+
+Migrar parquets antiguos (todo str) al esquema actual (recorre subcarpetas):
+    python esquema.py migrar <carpeta> [--dataset viajes|pernoctaciones] [--compression zstd]
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metricas import dia_de, etapa
+
+
+ESQUEMA_VERSION = 1
+COMPRESION = "zstd"
+
+_ZONA = pa.dictionary(pa.int32(), pa.string())
+_CAT = pa.dictionary(pa.int8(), pa.string())
+
+ESQUEMAS: Dict[str, pa.Schema] = {
+    "viajes": pa.schema([
+        ("fecha", pa.date32()),
+        ("origen", _ZONA),
+        ("destino", _ZONA),
+        ("periodo", pa.int8()),
+        ("residencia", _ZONA),
+        ("renta", _CAT),
+        ("edad", _CAT),
+        ("sexo", _CAT),
+        ("viajes", pa.int32()),
+        ("viajes_km", pa.float64()),
+    ]),
+    "pernoctaciones": pa.schema([
+        ("fecha", pa.date32()),
+        ("zona_residencia", _ZONA),
+        ("zona_pernoctacion", _ZONA),
+        ("personas", pa.float64()),
+    ]),
+}
+
+# Orden de escritura: con los días ordenados por la zona principal, las estadísticas
+# min/max de cada row group permiten saltarse casi todo al filtrar una ciudad (lectura_zonas.py)
+ORDEN: Dict[str, list] = {
+    "viajes": ["origen", "destino", "periodo"],
+    "pernoctaciones": ["zona_residencia", "zona_pernoctacion"],
+}
+FILAS_POR_GRUPO = 128_000
+
+_META_VERSION = b"mitma_esquema_version"
+_META_DATASET = b"mitma_dataset"
+# lo que queda de un nulo tras astype(str): no cuenta como valor perdido
+_NULOS = ["", "nan", "none", "null", "<na>"]
+
+
+def _tipar(df: pd.DataFrame, schema: pa.Schema, invalidos: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """
+    Convierte las columnas del df (normalizado, posiblemente todo str) a los tipos del esquema.
+    Los conteos se leen con pd.to_numeric ('.' decimal); viajes ya llega parseado del
+    formato español desde normalize_columns. Si se pasa `invalidos`, anota por columna
+    cuántos valores no nulos y no numéricos se han quedado en 0.
+    """
+    out = {}
+    for field in schema:
+        s = df[field.name]
+        if pa.types.is_date32(field.type):
+            s = pd.to_datetime(s.astype(str).str.replace("-", "", regex=False), format="%Y%m%d").dt.date
+        elif pa.types.is_dictionary(field.type):
+            s = s.astype(str).astype("category")
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            num = pd.to_numeric(s, errors="coerce")
+            if invalidos is not None:
+                nulo = s.isna() | s.astype(str).str.strip().str.lower().isin(_NULOS)
+                n_invalidos = int((num.isna() & ~nulo).sum())
+                if n_invalidos:
+                    invalidos[field.name] = n_invalidos
+            s = num.fillna(0).astype(field.type.to_pandas_dtype())
+        out[field.name] = s
+    return pd.DataFrame(out)
+
+
+def aplicar_esquema(df: pd.DataFrame, dataset: str, estricto: bool = False) -> pa.Table:
+    """
+    df normalizado (salida de normalize_columns) -> pa.Table con el esquema canónico y su versión.
+    Con estricto=True lanza ValueError si algún conteo no es numérico (en vez de dejarlo en 0).
+    """
+    schema = ESQUEMAS[dataset]
+    missing = [f.name for f in schema if f.name not in df.columns]
+    if missing:
+        raise KeyError(f"Faltan columnas del esquema {dataset}: {missing}. Columnas presentes: {list(df.columns)}")
+    invalidos: Optional[Dict[str, int]] = {} if estricto else None
+    tipado = _tipar(df, schema, invalidos)
+    if invalidos:
+        raise ValueError(f"Valores no numéricos (quedarían a 0) en {dataset}: {invalidos}")
+    table = pa.Table.from_pandas(tipado, schema=schema, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[_META_VERSION] = str(ESQUEMA_VERSION).encode()
+    meta[_META_DATASET] = dataset.encode()
+    return table.replace_schema_metadata(meta)
+
+
+def escribir_parquet(
+    df: pd.DataFrame, path: Path, dataset: str, compression: str = COMPRESION, estricto: bool = False
+) -> None:
+    """
+    Escribe df con el esquema canónico, ordenado por ORDEN[dataset] (a .tmp y renombrado al final).
+    estricto: ver aplicar_esquema.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with etapa("esquema", dia=dia_de(path), filas=len(df)):
+        tabla = aplicar_esquema(df.sort_values(ORDEN[dataset], kind="stable"), dataset, estricto=estricto)
+    with etapa("parquet", dia=dia_de(path), filas=len(df)) as m:
+        pq.write_table(tabla, tmp, compression=compression, row_group_size=FILAS_POR_GRUPO)
+        os.replace(tmp, path)
+        m["bytes_out"] = path.stat().st_size
+
+
+def version_esquema(path: Path) -> int:
+    """Versión del esquema de un parquet (0 = formato antiguo sin versionar)."""
+    meta = pq.read_schema(path).metadata or {}
+    return int(meta.get(_META_VERSION, b"0"))
+
+
+def detectar_dataset(path: Path) -> Optional[str]:
+    """
+    Deduce el dataset por el nombre del fichero ('..._Viajes_...') o, en el layout
+    particionado de catalogo.py, por la carpeta del estudio ('viajes_distritos/year=...').
+    """
+    nombre = "/".join(Path(path).parts[-5:]).lower()
+    if "viajes" in nombre:
+        return "viajes"
+    if "pernoctaciones" in nombre:
+        return "pernoctaciones"
+    return None
+
+
+def migrar_parquet(path: Path, dataset: str, compression: str = COMPRESION) -> bool:
+    """
+    Reescribe un parquet al esquema actual. Devuelve False si ya estaba al día.
+    Lanza ValueError (sin tocar el fichero) si algún conteo no se puede parsear.
+    """
+    path = Path(path)
+    if version_esquema(path) == ESQUEMA_VERSION:
+        return False
+
+    df = pd.read_parquet(path)
+    if dataset == "pernoctaciones":
+        # parquets antiguos de full.py / notebooks: nombres en inglés sin normalizar
+        df = df.rename(columns={
+            "date": "fecha",
+            "residence_area": "zona_residencia",
+            "overnight_stay_area": "zona_pernoctacion",
+            "people": "personas",
+        })
+    if "fecha" not in df.columns:
+        df["fecha"] = path.name[:8]
+    for opt in ["residencia", "renta", "edad", "sexo"]:
+        if dataset == "viajes" and opt not in df.columns:
+            df[opt] = ""
+    if dataset == "viajes" and "viajes_km" not in df.columns:
+        df["viajes_km"] = 0.0
+
+    escribir_parquet(df, path, dataset, compression=compression, estricto=True)
+    return True
+
+
+def migrar_directorio(directorio: Path, dataset: Optional[str] = None, compression: str = COMPRESION) -> None:
+    directorio = Path(directorio)
+    n_ok = n_skip = n_error = 0
+    for path in sorted(directorio.rglob("*.parquet")):
+        ds = dataset or detectar_dataset(path)
+        if ds is None:
+            print(f"  ⚠️ No sé qué dataset es {path.name}; usa --dataset")
+            continue
+        antes = path.stat().st_size
+        try:
+            migrado = migrar_parquet(path, ds, compression=compression)
+        except ValueError as e:
+            n_error += 1
+            print(f"  ⚠️ {path.relative_to(directorio)} no se migra: {e}")
+            continue
+        if migrado:
+            n_ok += 1
+            print(f"  ✓ {path.relative_to(directorio)}: {antes/1e6:.1f} MB -> {path.stat().st_size/1e6:.1f} MB")
+        else:
+            n_skip += 1
+    print(f"Migrados: {n_ok} | ya al día: {n_skip} | con errores (sin tocar): {n_error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esquema canónico de los parquets MITMA")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_mig = sub.add_parser("migrar", help="reescribe los parquets de una carpeta al esquema actual")
+    p_mig.add_argument("carpeta", type=Path)
+    p_mig.add_argument("--dataset", choices=sorted(ESQUEMAS), default=None)
+    p_mig.add_argument("--compression", default=COMPRESION)
+    args = parser.parse_args()
+
+    if args.cmd == "migrar":
+        migrar_directorio(args.carpeta, args.dataset, args.compression)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Estudio de eventos en lote (pie.py para muchos partidos / estadios)
+==================================================================
+pie.py analiza un derbi: una fecha, un distrito origen y controles a mano. Aquí
+se pasa una tabla de eventos (zona del estadio, fecha[, evento]) y:
+
+1. Controles automáticos: mismo día de la semana, ±1..MAX_SEMANAS semanas
+   alrededor de cada evento (los más cercanos primero), sin fechas futuras, sin
+   días con evento en esa misma zona y sin las fechas de `excluir` (festivos...)
+2. Plan por día: cada fecha (evento o control) se descarga y se lee UNA vez,
+   agregando en la misma pasada todos los orígenes que la necesitan
+   (pie.read_mitma_zonas_agg). Los agregados quedan por (día, origen) en
+   DATA_DIR, así que otra ejecución con eventos que compartan fechas no repite nada
+3. Los controles entran en la línea base incremental (linea_base.py) por origen;
+   el esperado de cada evento usa solo los controles que le tocan en el plan (no los
+   demás días guardados para esa zona, ni otros eventos ni las fechas de `excluir`)
+4. Esperado + impacto + mapa de cada evento en paralelo (procesos)
+
+Salida:
+    ANALYSIS_DIR/eventos/impacto_eventos.parquet   impacto de todos los eventos (columna evento)
+    ANALYSIS_DIR/eventos/resumen_eventos.csv       una fila por evento
+    MAP_DIR/eventos/<evento>/                      visor por evento
+
+    python eventos.py partidos.csv [--controles 6] [--excluir 2025-04-17,2025-04-18] [--workers 4]
+
+La tabla (csv o parquet) necesita columnas zona y fecha; evento es opcional.
+"""
+
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import pandas as pd
+
+from catalogo import _a_fecha
+from descargas import descarga_completa, download_many
+from linea_base import actualizar_linea_base, fechas_linea_base, leer_linea_base
+from metricas import configurar, imprimir_resumen, log_por_defecto
+from pie import (
+    ANALYSIS_DIR,
+    BASE_GEOJSON,
+    DATA_DIR,
+    DISTRITO_WANDA,
+    GEO_ID_COL,
+    LINEA_BASE,
+    MAP_DIR,
+    MAPA_TESELAS,
+    MIN_N,
+    TESELAS_ZOOM,
+    build_url,
+    expected_stats,
+    exportar_mapa_impacto,
+    impacto_derbi,
+    leer_dia_evento,
+    load_geo_ids,
+    read_mitma_zonas_agg,
+    yyyymmdd,
+)
+from zonas import normalizar_ids
+
+N_CONTROLES = 6
+MAX_SEMANAS = 8
+EVENTOS_ANALYSIS_DIR = ANALYSIS_DIR / "eventos"
+EVENTOS_MAP_DIR = MAP_DIR / "eventos"
+
+
+# =========================
+# Tabla de eventos y controles
+# =========================
+def leer_eventos(path: Path) -> pd.DataFrame:
+    """Tabla de eventos (csv o parquet) -> zona (str), fecha (date), evento (str, único)."""
+    path = Path(path)
+    df = pd.read_parquet(path) if path.suffix.lower() == ".parquet" else pd.read_csv(path, sep=None, engine="python", dtype=str)
+    df.columns = [c.strip().lower() for c in df.columns]
+    faltan = {"zona", "fecha"} - set(df.columns)
+    if faltan:
+        raise ValueError(f"{path.name}: faltan columnas {sorted(faltan)}")
+    eventos = pd.DataFrame({
+        "zona": normalizar_ids(df["zona"]).to_numpy(),
+        "fecha": [_a_fecha(f) for f in df["fecha"]],
+    })
+    if "evento" in df.columns:
+        eventos["evento"] = df["evento"].astype(str).str.strip().to_numpy()
+    else:
+        eventos["evento"] = [f"{z}_{f:%Y%m%d}" for z, f in zip(eventos["zona"], eventos["fecha"])]
+    eventos = eventos.drop_duplicates(["zona", "fecha"]).reset_index(drop=True)
+    if eventos["evento"].duplicated().any():
+        raise ValueError("Nombres de evento repetidos: la columna evento debe ser única")
+    return eventos
+
+
+def elegir_controles(
+    fecha: date,
+    excluir: Iterable[date] = (),
+    n: int = N_CONTROLES,
+    max_semanas: int = MAX_SEMANAS,
+    hasta: Optional[date] = None,
+) -> List[date]:
+    """
+    Hasta n días del mismo día de la semana, alternando antes/después del evento
+    (los más cercanos primero). Se saltan las fechas de `excluir` y las posteriores a `hasta`.
+    """
+    excluir = set(excluir)
+    hasta = hasta or date.today()
+    controles = []
+    for k in range(1, max_semanas + 1):
+        for signo in (-1, 1):
+            d = fecha + timedelta(weeks=signo * k)
+            if d in excluir or d > hasta:
+                continue
+            controles.append(d)
+            if len(controles) == n:
+                return controles
+    return controles
+
+
+def planificar(
+    eventos: pd.DataFrame,
+    excluir: Iterable[date] = (),
+    n_controles: int = N_CONTROLES,
+    max_semanas: int = MAX_SEMANAS,
+) -> pd.DataFrame:
+    """
+    Una fila por (evento, fecha, rol): rol = "evento" | "control".
+    Los controles de una zona nunca caen en días con evento en esa misma zona.
+    """
+    excluir = set(excluir)
+    dias_evento: Dict[str, Set[date]] = eventos.groupby("zona")["fecha"].agg(set).to_dict()
+    filas = []
+    for ev in eventos.itertuples(index=False):
+        filas.append((ev.evento, ev.zona, ev.fecha, "evento"))
+        for c in elegir_controles(ev.fecha, excluir | dias_evento[ev.zona], n_controles, max_semanas):
+            filas.append((ev.evento, ev.zona, c, "control"))
+    return pd.DataFrame(filas, columns=["evento", "zona", "fecha", "rol"])
+
+
+# =========================
+# Descarga + agregado por día (una pasada por fichero)
+# =========================
+def ruta_agregado(fecha: date, origen: str) -> Path:
+    """Agregado de un día para un origen (el de Wanda con el nombre que usa pie.py)."""
+    fnum = yyyymmdd(fecha.isoformat())
+    if origen == DISTRITO_WANDA:
+        return DATA_DIR / f"{fnum}_wanda_agg.parquet"
+    return DATA_DIR / f"{fnum}_origen_{origen}_agg.parquet"
+
+
+def ruta_gz(fecha: date) -> Path:
+    """Fichero diario de viajes por distritos tal como se descarga."""
+    return DATA_DIR / f"{yyyymmdd(fecha.isoformat())}_Viajes_distritos.csv.gz"
+
+
+def agregar_dia(fecha: date, origenes: Iterable[str], valid_ids: Set[str]) -> Dict[str, Path]:
+    """
+    Asegura el agregado del día para cada origen; los que faltan se sacan en una
+    sola lectura del fichero. Devuelve {origen: parquet} de los que hay.
+    """
+    fecha_str = fecha.isoformat()
+    fnum = yyyymmdd(fecha_str)
+    rutas = {o: ruta_agregado(fecha, o) for o in sorted(set(origenes))}
+    faltan = [o for o, p in rutas.items() if not p.exists()]
+    if faltan:
+        gz_path = ruta_gz(fecha)
+        if not descarga_completa(gz_path):
+            print(f"  ⚠️ {fecha_str}: sin fichero completo, se omite")
+            return {o: p for o, p in rutas.items() if p.exists()}
+        print(f"  {fecha_str}: agregando {len(faltan)} origen(es) en una pasada...")
+        agg = read_mitma_zonas_agg(gz_path, origenes=faltan, valid_ids=valid_ids)
+        agg["origen"] = normalizar_ids(agg["origen"])
+        for o in faltan:
+            sub = agg.loc[agg["origen"] == o, ["destino", "periodo", "viajes"]].copy()
+            sub["fecha"] = fnum
+            tmp = rutas[o].with_suffix(".tmp")
+            sub.to_parquet(tmp, index=False)
+            os.replace(tmp, rutas[o])
+        gz_path.unlink(missing_ok=True)
+    return rutas
+
+
+def preparar_dias(plan: pd.DataFrame, valid_ids: Set[str], workers: int = 4) -> Dict[date, Dict[str, Path]]:
+    """
+    Descarga/agrega cada fecha del plan una sola vez, con todos sus orígenes.
+    Los controles ya incorporados a la línea base para ese origen no se vuelven a leer.
+    """
+    ya_en_base = {z: fechas_linea_base(LINEA_BASE, origen=z) for z in plan["zona"].unique()}
+    nuevo = pd.Series([f not in ya_en_base[z] for z, f in zip(plan["zona"], plan["fecha"])], index=plan.index)
+    necesita = plan[(plan["rol"] == "evento") | nuevo]
+    por_dia = necesita.groupby("fecha")["zona"].agg(set).to_dict()
+    print(f"📅 {len(por_dia)} días a preparar ({len(plan)} filas evento/control en el plan)")
+
+    # Descarga reanudable y verificada (descargas.py) de los días a los que les falta algún agregado
+    tareas = [
+        (build_url(f.isoformat()), ruta_gz(f))
+        for f, zs in sorted(por_dia.items())
+        if any(not ruta_agregado(f, z).exists() for z in zs)
+    ]
+    if tareas:
+        download_many(tareas, max_workers=workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futuros = {f: ex.submit(agregar_dia, f, zs, valid_ids) for f, zs in sorted(por_dia.items())}
+    return {f: fut.result() for f, fut in futuros.items()}
+
+
+def actualizar_controles(plan: pd.DataFrame, rutas: Dict[date, Dict[str, Path]]) -> None:
+    """Incorpora a la línea base los controles nuevos (una escritura por día, todos sus orígenes)."""
+    controles = plan[plan["rol"] == "control"].drop_duplicates(["zona", "fecha"])
+    for fecha, sub in controles.groupby("fecha"):
+        partes = []
+        for z in sub["zona"]:
+            p = rutas.get(fecha, {}).get(z)
+            if p is not None:
+                partes.append(pd.read_parquet(p).assign(origen=z))
+        if partes and actualizar_linea_base(LINEA_BASE, pd.concat(partes, ignore_index=True), fecha):
+            print(f"  ✓ Línea base: {fecha} ({len(partes)} origen(es))")
+
+
+# =========================
+# Esperado + impacto + mapa por evento (en paralelo)
+# =========================
+def _nombre_fichero(evento: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", evento).strip("_") or "evento"
+
+
+def analizar_evento(
+    evento: str, zona: str, fecha: date, controles: Iterable[date], dia_pq: Optional[Path], mapas: Optional[str]
+) -> Dict:
+    """
+    Esperado (línea base del origen y día de la semana, solo con `controles`) e impacto
+    de un evento; opcionalmente su mapa.
+    """
+    resumen = {"evento": evento, "zona": zona, "fecha": fecha, "n_controles": 0, "filas": 0,
+               "impactos_significativos": 0, "destinos_afectados": 0, "viajes_extra": 0.0, "mapa": None}
+    if dia_pq is None or not Path(dia_pq).exists():
+        resumen["error"] = "sin datos del día del evento"
+        return {"resumen": resumen, "impacto": None}
+
+    # solo los controles del plan: ni otros días guardados para la zona ni el del evento
+    try:
+        linea_base = leer_linea_base(LINEA_BASE, dia_semana=fecha.weekday(), origen=zona, fechas=set(controles) - {fecha})
+    except ValueError as e:
+        resumen["error"] = str(e)
+        return {"resumen": resumen, "impacto": None}
+    resumen["n_controles"] = int(linea_base["n"].max()) if len(linea_base) else 0
+
+    imp = impacto_derbi(leer_dia_evento(dia_pq), expected_stats(linea_base))
+    sig = imp[imp["significativo"] & (imp["diff_abs"] > 0)]
+    resumen.update({
+        "filas": len(imp),
+        "impactos_significativos": len(sig),
+        "destinos_afectados": sig["destino"].nunique(),
+        "viajes_extra": float(sig["diff_abs"].sum()),
+    })
+
+    if mapas and len(imp):
+        d = EVENTOS_MAP_DIR / _nombre_fichero(evento)
+        resumen["mapa"] = exportar_mapa_impacto(
+            imp,
+            out_geojson=str(d / "distritos_impacto_por_hora.geojson"),
+            out_valores=str(d / "valores_impacto_por_hora.json"),
+            out_html=str(d / "visor_impacto_por_hora.html"),
+            out_html_teselas=str(d / "visor_impacto_por_hora_teselas.html"),
+            teselas=(mapas == "teselas"),
+            value_label=f"impacto {evento} (viajes extra)",
+        )
+
+    imp.insert(0, "evento", evento)
+    imp.insert(1, "zona", zona)
+    imp.insert(2, "fecha_evento", fecha)
+    return {"resumen": resumen, "impacto": imp}
+
+
+def ejecutar_eventos(
+    eventos: pd.DataFrame,
+    excluir: Iterable[date] = (),
+    n_controles: int = N_CONTROLES,
+    max_semanas: int = MAX_SEMANAS,
+    workers: Optional[int] = None,
+    mapas: Optional[str] = "teselas" if MAPA_TESELAS else "geojson",
+) -> pd.DataFrame:
+    """
+    Corre el estudio para todos los eventos. mapas: "geojson" | "teselas" | None.
+    Devuelve el resumen por evento (y escribe impacto_eventos.parquet + resumen_eventos.csv).
+    """
+    workers = workers or os.cpu_count() or 1
+    EVENTOS_ANALYSIS_DIR.mkdir(parents=True, exist_ok=True)
+
+    print("="*70)
+    print(f"PASO 1: PLAN + DESCARGA/AGREGADO ({len(eventos)} eventos)")
+    print("="*70)
+    plan = planificar(eventos, excluir, n_controles, max_semanas)
+    plan.to_csv(EVENTOS_ANALYSIS_DIR / "plan_eventos.csv", index=False)
+    valid_ids = load_geo_ids(BASE_GEOJSON, GEO_ID_COL)
+    rutas = preparar_dias(plan, valid_ids, workers=min(workers, 4))
+    actualizar_controles(plan, rutas)
+
+    # lo que comparten todos los mapas se prepara antes de repartir (caché de geometrías / teselas)
+    if mapas == "teselas":
+        from teselas import pmtiles_zonificacion
+        pmtiles_zonificacion(BASE_GEOJSON, id_col=GEO_ID_COL, crs_origen="EPSG:3042",
+                             zoom_min=TESELAS_ZOOM[0], zoom_max=TESELAS_ZOOM[1])
+    elif mapas == "geojson":
+        from geometrias import cargar_zonas
+        cargar_zonas(BASE_GEOJSON, crs="EPSG:4326", crs_origen="EPSG:3042", id_col=GEO_ID_COL)
+
+    print("="*70)
+    print(f"PASO 2: ESPERADO + IMPACTO + MAPAS ({workers} procesos)")
+    print("="*70)
+    controles = plan[plan["rol"] == "control"].groupby("evento")["fecha"].agg(list).to_dict()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futuros = [
+            ex.submit(analizar_evento, ev.evento, ev.zona, ev.fecha, controles.get(ev.evento, []),
+                      rutas.get(ev.fecha, {}).get(ev.zona), mapas)
+            for ev in eventos.itertuples(index=False)
+        ]
+        resultados = [f.result() for f in futuros]
+
+    resumen = pd.DataFrame([r["resumen"] for r in resultados])
+    impactos = [r["impacto"] for r in resultados if r["impacto"] is not None]
+    if impactos:
+        pd.concat(impactos, ignore_index=True).to_parquet(EVENTOS_ANALYSIS_DIR / "impacto_eventos.parquet", index=False)
+    resumen.to_csv(EVENTOS_ANALYSIS_DIR / "resumen_eventos.csv", index=False)
+
+    pocos = resumen[resumen["n_controles"] < MIN_N]
+    if len(pocos):
+        print(f"⚠️ {len(pocos)} evento(s) con menos de MIN_N={MIN_N} controles: {', '.join(pocos['evento'])}")
+    print(resumen.drop(columns=["mapa"]).to_string(index=False))
+    print(f"✅ Listo: {EVENTOS_ANALYSIS_DIR}")
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estudio de impacto de muchos eventos (zona del estadio + fecha)")
+    parser.add_argument("eventos", type=Path, help="csv/parquet con columnas zona, fecha[, evento]")
+    parser.add_argument("--controles", type=int, default=N_CONTROLES, help="nº de días control por evento")
+    parser.add_argument("--semanas", type=int, default=MAX_SEMANAS, help="máx. semanas antes/después para buscar controles")
+    parser.add_argument("--excluir", default="", help="fechas a no usar como control, separadas por comas (festivos...)")
+    parser.add_argument("--workers", type=int, default=None, help="procesos para el análisis (por defecto, nº de CPUs)")
+    parser.add_argument("--mapas", choices=["geojson", "teselas", "ninguno"], default="teselas" if MAPA_TESELAS else "geojson")
+    args = parser.parse_args()
+
+    excluir = {_a_fecha(f) for f in args.excluir.split(",") if f.strip()}
+    configurar(log_por_defecto(EVENTOS_ANALYSIS_DIR, "eventos"))
+    ejecutar_eventos(
+        leer_eventos(args.eventos),
+        excluir=excluir,
+        n_controles=args.controles,
+        max_semanas=args.semanas,
+        workers=args.workers,
+        mapas=None if args.mapas == "ninguno" else args.mapas,
+    )
+    imprimir_resumen()
+
+
+if __name__ == "__main__":
+    main()
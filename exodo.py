@@ -0,0 +1,64 @@
+"""
+Éxodo / visitantes de varias ciudades en una sola pasada
+========================================================
+En vez de hacer str.startswith(prefijo) dos veces por ciudad sobre todo el día:
+- se saca el municipio (5 primeros dígitos INE de la zona) una vez por categoría
+- se traduce municipio -> índice de ciudad con una tabla de búsqueda
+- exodo_personas (residentes que duermen fuera de su municipio) y
+  visitantes_personas (duermen en la ciudad sin residir en ella) salen de
+  un único np.bincount para todas las ciudades a la vez
+
+Añadir ciudades solo agranda la tabla de búsqueda.
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+
+def indice_ciudad(zonas: pd.Series, ciudades: Dict[str, str]) -> np.ndarray:
+    """
+    Para cada fila, índice (0..n-1) de la ciudad cuyo prefijo INE coincide con el
+    municipio de la zona, o -1 si no es ninguna. El trabajo de strings se hace
+    sobre las categorías, no sobre las filas.
+    """
+    lookup = {str(prefijo): i for i, prefijo in enumerate(ciudades.values())}
+    if not isinstance(zonas.dtype, pd.CategoricalDtype):
+        zonas = zonas.astype(str).astype("category")
+    cats = pd.Index(zonas.cat.categories.astype(str))
+    idx_cat = cats.str[:5].map(lambda m: lookup.get(m, -1)).to_numpy(dtype=np.int64)
+    # código -1 (nulo) -> -1
+    idx_cat = np.append(idx_cat, -1)
+    return idx_cat[zonas.cat.codes.to_numpy()]
+
+
+def calcular_exodo(
+    df: pd.DataFrame,
+    ciudades: Dict[str, str],
+    col_residencia: str = "zona_residencia",
+    col_pernoctacion: str = "zona_pernoctacion",
+    col_personas: str = "personas",
+) -> pd.DataFrame:
+    """
+    df: pernoctaciones de un día. ciudades: {nombre: prefijo INE de 5 dígitos}.
+    Devuelve DF: ciudad, exodo_personas, visitantes_personas (int, en el orden de `ciudades`).
+    """
+    n = len(ciudades)
+    res = indice_ciudad(df[col_residencia], ciudades)
+    per = indice_ciudad(df[col_pernoctacion], ciudades)
+    personas = pd.to_numeric(df[col_personas], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+    # mismo municipio de ciudad <=> mismo índice (cada ciudad tiene un prefijo distinto)
+    fuera = res != per
+    m_exodo = (res >= 0) & fuera
+    m_visit = (per >= 0) & fuera
+
+    exodo = np.bincount(res[m_exodo], weights=personas[m_exodo], minlength=n)
+    visitantes = np.bincount(per[m_visit], weights=personas[m_visit], minlength=n)
+
+    return pd.DataFrame({
+        "ciudad": list(ciudades),
+        "exodo_personas": exodo.astype("int64"),
+        "visitantes_personas": visitantes.astype("int64"),
+    })
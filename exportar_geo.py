@@ -0,0 +1,219 @@
+"""
+Exportación ligera de GeoJSON/TopoJSON para el visor Leaflet
+============================================================
+El geojson nacional de distritos a resolución completa pesa decenas de MB; para
+el visor basta con mucho menos:
+
+- recorte: solo las zonas con algún valor distinto de 0 y/o dentro de un bbox
+- simplificación en metros (CRS métrico) conservando topología: con la librería
+  opcional `topojson` las fronteras compartidas se simplifican una sola vez (sin
+  huecos ni solapes entre vecinos); si no está, shapely simplify(preserve_topology)
+  por geometría
+- cuantización: coordenadas redondeadas a `decimales` (5 ≈ 1 m) y valores a 2
+- salida GeoJSON o TopoJSON (requiere `topojson`), opcionalmente precomprimida .gz
+- valores por zona y hora fuera de las geometrías: matriz Float32 binaria (.f32,
+  zona x hora) + índice JSON con los IDs; el visor la carga en un Float32Array
+
+exportar_geo() devuelve (y muestra) el tamaño final: bytes, bytes gzip y nº de zonas.
+"""
+
+import gzip
+import json
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import topojson as tp
+except ImportError:  # opcional
+    tp = None
+
+CRS_METRICO = "EPSG:25830"
+CRS_WEB = "EPSG:4326"
+
+
+def recortar(gdf, columna_valores: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None):
+    """
+    Filtra zonas: las que tienen algún valor > 0 en `columna_valores` (dict hora->valor
+    o número) y/o las que intersectan `bbox` (minx, miny, maxx, maxy en el CRS del gdf).
+    """
+    if columna_valores is not None:
+        def _con_valor(v) -> bool:
+            if isinstance(v, dict):
+                return any(x for x in v.values())
+            return bool(v)
+        gdf = gdf[gdf[columna_valores].map(_con_valor)]
+    if bbox is not None:
+        gdf = gdf.cx[bbox[0]:bbox[2], bbox[1]:bbox[3]]
+    return gdf
+
+
+def simplificar(gdf, tolerancia_m: float, crs_metrico: str = CRS_METRICO):
+    """Simplifica con tolerancia en metros y devuelve el gdf en su CRS original."""
+    if not tolerancia_m or gdf.empty:
+        return gdf
+    crs = gdf.crs
+    gm = gdf.to_crs(crs_metrico)
+    if tp is not None:
+        # fronteras compartidas -> arcos simplificados una vez (topología intacta)
+        gm = tp.Topology(gm, prequantize=False, toposimplify=tolerancia_m).to_gdf()
+        gm = gm.set_crs(crs_metrico, allow_override=True)
+    else:
+        gm = gm.copy()
+        gm["geometry"] = gm.geometry.simplify(tolerancia_m, preserve_topology=True)
+    gm = gm[~gm.geometry.is_empty]
+    return gm.to_crs(crs)
+
+
+def cuantizar(gdf, decimales: int):
+    """Redondea las coordenadas a `decimales` y descarta lo que quede vacío."""
+    import shapely
+    gdf = gdf.copy()
+    gdf["geometry"] = shapely.transform(gdf.geometry.values, lambda c: np.round(c, decimales))
+    gdf["geometry"] = gdf.geometry.make_valid() if hasattr(gdf.geometry, "make_valid") else gdf.geometry.buffer(0)
+    return gdf[~gdf.geometry.is_empty]
+
+
+def _redondear_valores(props: Dict) -> Dict:
+    out = {}
+    for k, v in props.items():
+        if isinstance(v, float):
+            v = round(v, 2)
+        elif isinstance(v, dict):
+            v = {kk: (round(vv, 2) if isinstance(vv, float) else vv) for kk, vv in v.items()}
+        out[k] = v
+    return out
+
+
+def a_geojson(gdf, decimales: Optional[int] = None) -> Dict:
+    """FeatureCollection (dict) en EPSG:4326 con valores redondeados."""
+    gdf = gdf.to_crs(CRS_WEB)
+    if decimales is not None:
+        gdf = cuantizar(gdf, decimales)
+    geo = json.loads(gdf.to_json(drop_id=True))
+    for feat in geo["features"]:
+        feat["properties"] = _redondear_valores(feat["properties"])
+    return geo
+
+
+def a_topojson(gdf, decimales: Optional[int] = None) -> Dict:
+    """Topology (dict) con un objeto "zonas"; necesita la librería `topojson`."""
+    if tp is None:
+        raise ImportError("Para TopoJSON instala la librería opcional: pip install topojson")
+    gdf = gdf.to_crs(CRS_WEB).copy()
+    for col in gdf.columns:
+        if col != "geometry" and gdf[col].map(lambda v: isinstance(v, dict)).any():
+            gdf[col] = gdf[col].map(_redondear_valores)
+    # cuantización propia de TopoJSON: rejilla de 10^decimales por grado aprox.
+    q = int(360 * 10 ** decimales) if decimales is not None else False
+    topo = tp.Topology(gdf, object_name="zonas", prequantize=q)
+    return json.loads(topo.to_json())
+
+
+def escribir(geo: Dict, out_path: str, comprimir: bool = False) -> Dict:
+    """Escribe el JSON compacto (y .gz si se pide). Devuelve tamaños en bytes."""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    data = json.dumps(geo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    out_path.write_bytes(data)
+    comprimido = gzip.compress(data, compresslevel=9)
+    informe = {"ruta": str(out_path), "bytes": len(data), "bytes_gzip": len(comprimido)}
+    if comprimir:
+        gz_path = out_path.with_name(out_path.name + ".gz")
+        gz_path.write_bytes(comprimido)
+        informe["ruta_gzip"] = str(gz_path)
+    return informe
+
+
+def exportar_geo(
+    gdf,
+    out_path: str,
+    columna_valores: Optional[str] = None,
+    solo_con_valores: bool = False,
+    bbox: Optional[Sequence[float]] = None,
+    tolerancia_m: float = 0.0,
+    decimales: Optional[int] = None,
+    formato: str = "geojson",
+    comprimir: bool = False,
+    propiedades: Optional[Dict] = None,
+) -> Dict:
+    """
+    Recorta, simplifica, cuantiza y escribe gdf como GeoJSON o TopoJSON.
+    propiedades: miembros extra a nivel raíz (p. ej. max_value para el visor).
+    Devuelve informe: ruta, bytes, bytes_gzip, zonas (y ruta_gzip si comprimir).
+    """
+    n0 = len(gdf)
+    gdf = recortar(gdf, columna_valores if solo_con_valores else None, tuple(bbox) if bbox else None)
+    gdf = simplificar(gdf, tolerancia_m)
+
+    if formato == "topojson":
+        geo = a_topojson(gdf, decimales)
+    elif formato == "geojson":
+        geo = a_geojson(gdf, decimales)
+    else:
+        raise ValueError(f"formato desconocido: {formato} (geojson | topojson)")
+    geo["properties"] = {**geo.get("properties", {}), **(propiedades or {})}
+
+    informe = escribir(geo, out_path, comprimir=comprimir)
+    informe["zonas"] = len(gdf)
+    print(
+        f"  {formato}: {len(gdf):,}/{n0:,} zonas, {informe['bytes'] / 1e6:.2f} MB "
+        f"({informe['bytes_gzip'] / 1e6:.2f} MB gzip) -> {informe['ruta']}"
+    )
+    return informe
+
+
+def matriz_zona_hora(
+    df: pd.DataFrame,
+    zone_col: str,
+    hour_col: str,
+    value_col: str,
+    horas: int = 24,
+    solo_con_valores: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pivot zona x hora sumando value_col (filas repetidas incluidas), sin dicts por zona.
+    Devuelve (ids str ordenados, matriz float32 [n_zonas, horas]); con solo_con_valores
+    se quitan las zonas con todo 0.
+    """
+    codigos, ids = pd.factorize(df[zone_col].astype(str), sort=True)
+    h = pd.to_numeric(df[hour_col], errors="coerce").fillna(-1).to_numpy().astype(np.int64)
+    v = pd.to_numeric(df[value_col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    ok = (codigos >= 0) & (h >= 0) & (h < horas)
+    plano = np.bincount(codigos[ok] * horas + h[ok], weights=v[ok], minlength=len(ids) * horas)
+    matriz = plano.reshape(len(ids), horas).astype(np.float32)
+    ids = np.asarray(ids, dtype=object)
+    if solo_con_valores:
+        con = (matriz != 0).any(axis=1)
+        ids, matriz = ids[con], matriz[con]
+    return ids, matriz
+
+
+def escribir_valores(ids: np.ndarray, matriz: np.ndarray, out_path: str, propiedades: Optional[Dict] = None) -> Dict:
+    """
+    out_path (.json): índice {"ids", "horas", "max_value", "valores", ...propiedades};
+    al lado, "valores" = <nombre>.f32 con la matriz float32 little-endian fila a fila.
+    El visor: valores[fila(ID) * horas + hora].
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    bin_path = out_path.with_suffix(".f32")
+    matriz = np.ascontiguousarray(matriz, dtype="<f4")
+    bin_path.write_bytes(matriz.tobytes())
+    indice = {
+        "ids": [str(z) for z in ids],
+        "horas": int(matriz.shape[1]) if matriz.ndim == 2 else 0,
+        "max_value": float(matriz.max()) if matriz.size else 0.0,
+        "valores": bin_path.name,
+        **(propiedades or {}),
+    }
+    out_path.write_text(json.dumps(indice, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    return {
+        "ruta": str(out_path),
+        "ruta_valores": str(bin_path),
+        "bytes": out_path.stat().st_size + bin_path.stat().st_size,
+        "zonas": len(ids),
+        "max_value": indice["max_value"],
+    }
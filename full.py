@@ -1,15 +1,33 @@
 import os
 import pandas as pd
-import requests
 from pathlib import Path
 from datetime import datetime, timedelta
 
+from descargas import descarga_completa, download_file, get_session
+from catalogo import ESTUDIOS, ruta_particion
+from cubos import asegurar_cubos, escribir_cubos, estudio_cubo
+from descargarPernoctaciones import normalize_columns
+from dialecto_mitma import read_mitma_csv
+from esquema import escribir_parquet
+from exodo import calcular_exodo
+from matriz_od import asegurar_matriz, exodo_od
+from metricas import configurar, etapa, imprimir_resumen, log_por_defecto
+from pipeline import MAX_PROCESOS, ejecutar_por_dias
+
 # --- CONFIGURACIÓN ---
 OUTPUT_DIR = Path(r"C:\Users\khora\Downloads\EstudioExodo2025")
 BASE_URL = "https://movilidad-opendata.mitma.es/estudios_basicos/por-distritos/pernoctaciones/ficheros-diarios"
 START_DATE = "2025-03-01"
 END_DATE = "2025-05-01"
 
+# Descargas en paralelo (ver descargas.py) y procesos de conversión/agregado (pipeline.py)
+MAX_DESCARGAS = 4
+MAX_POR_HOST = 4
+
+# Éxodo desde matrices OD memory-mapped (matriz_od.py) en vez del cubo mun_mun:
+# lee solo las filas/columnas de los distritos de cada capital
+MATRIZ_OD = False
+
 # Diccionario de capitales (Prefijo INE de 5 dígitos)
 CAPITALES = {
     "Madrid": "28079", "Barcelona": "08019", "Valencia": "46250", 
@@ -30,82 +48,102 @@ def daterange(start: str, end: str):
         yield curr
         curr += timedelta(days=1)
 
-def download_and_convert(d: datetime.date):
+def rutas_dia(d: datetime.date):
     yyyymm = d.strftime("%Y-%m")
     yyyymmdd = d.strftime("%Y%m%d")
     url = f"{BASE_URL}/{yyyymm}/{yyyymmdd}_Pernoctaciones_distritos.csv.gz"
     gz_path = OUTPUT_DIR / f"{yyyymmdd}.csv.gz"
-    parquet_path = OUTPUT_DIR / f"{yyyymmdd}.parquet"
+    parquet_path = ruta_particion(OUTPUT_DIR, ESTUDIOS["pernoctaciones"], d)
+    return url, gz_path, parquet_path
+
+def descargar_dia(d: datetime.date) -> bool:
+    """Etapa de red del pipeline: deja el gz completo en disco (si aún no hay parquet)."""
+    url, gz_path, parquet_path = rutas_dia(d)
+    if parquet_path.exists() or descarga_completa(gz_path):
+        return True
+    download_file(url, gz_path, session=get_session(MAX_POR_HOST), timeout=60)
+    return True
+
+def download_and_convert(d: datetime.date):
+    yyyymmdd = d.strftime("%Y%m%d")
+    url, gz_path, parquet_path = rutas_dia(d)
 
     if parquet_path.exists():
         return parquet_path
 
     try:
-        response = requests.get(url, stream=True, timeout=60)
-        response.raise_for_status()
-        with open(gz_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=1024*1024):
-                f.write(chunk)
+        if not descarga_completa(gz_path):
+            download_file(url, gz_path, timeout=60)
         
-        # Lectura flexible (basada en tu código)
-        df = None
-        for sep in ["|", ";", ","]:
-            try:
-                df = pd.read_csv(gz_path, compression="gzip", sep=sep, dtype=str)
-                if df.shape[1] >= 4: break
-            except: continue
-        
-        if df is not None:
-            # Normalizar nombres de columnas
-            col_map = {"date":"fecha", "residence_area":"zona_residencia", 
-                       "overnight_stay_area":"zona_pernoctacion", "people":"personas"}
-            df.rename(columns=lambda x: col_map.get(x, x), inplace=True)
-            
-            # Guardar y limpiar
-            df.to_parquet(parquet_path, index=False)
-            gz_path.unlink()
-            return parquet_path
+        # Separador detectado con los primeros KB y una sola lectura completa
+        df = read_mitma_csv(gz_path, dataset="Pernoctaciones_distritos")
+
+        # Normalizar nombres de columnas y guardar con el esquema tipado (esquema.py)
+        with etapa("normalizacion", dia=yyyymmdd, filas=len(df)):
+            df = normalize_columns(df, yyyymmdd)
+        escribir_parquet(df, parquet_path, "pernoctaciones")
+        escribir_cubos(df, OUTPUT_DIR, d)
+        gz_path.unlink()
+        return parquet_path
     except Exception as e:
         print(f"Error procesando {yyyymmdd}: {e}")
         return None
 
+def procesar_dia(d: datetime.date):
+    """Etapa de CPU del pipeline (corre en otro proceso): gz -> parquet + éxodo de todas las capitales."""
+    path_pq = download_and_convert(d)
+    if not path_pq:
+        return None
+    if MATRIZ_OD:
+        asegurar_matriz(OUTPUT_DIR, "pernoctaciones", d)
+        with etapa("agregacion_exodo", dia=d.strftime("%Y%m%d")):
+            res_dia = exodo_od(OUTPUT_DIR, d, CAPITALES)
+    else:
+        # El éxodo es municipio -> municipio: basta el cubo mun_mun (cubos.py), no los distritos
+        asegurar_cubos(OUTPUT_DIR, d)
+        path_cubo = ruta_particion(OUTPUT_DIR, estudio_cubo("mun_mun"), d)
+        with etapa("agregacion_exodo", dia=d.strftime("%Y%m%d"), bytes_in=path_cubo.stat().st_size) as m:
+            # Solo las 3 columnas necesarias; todas las capitales en una pasada (exodo.py)
+            df = pd.read_parquet(path_cubo, columns=["zona_residencia", "zona_pernoctacion", "personas"])
+            res_dia = calcular_exodo(df, CAPITALES)
+            m["filas"] = len(df)
+    res_dia.insert(0, "fecha", d)
+
+    # Opcional: Borrar parquets tras analizar para no llenar el disco
+    # path_pq.unlink()
+    return res_dia
+
 # --- PROCESO PRINCIPAL ---
 
 def ejecutar_estudio():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    resultados = []
+    configurar(log_por_defecto(OUTPUT_DIR, "full"))
 
     print(f"Iniciando estudio desde {START_DATE} hasta {END_DATE}...")
 
-    for dia in daterange(START_DATE, END_DATE):
-        path_pq = download_and_convert(dia)
-        if path_pq:
-            print(f"Analizando día: {dia}")
-            df = pd.read_parquet(path_pq)
-            df['personas'] = pd.to_numeric(df['personas'], errors='coerce').fillna(0)
-            
-            for ciudad, prefijo in CAPITALES.items():
-                # 1. Residentes de la ciudad
-                residentes = df[df['zona_residencia'].str.startswith(prefijo)]
-                # 2. Pernoctan fuera (no empieza por el mismo prefijo)
-                exodo = residentes[~residentes['zona_pernoctacion'].str.startswith(prefijo)]
-                
-                total_exodo = int(exodo['personas'].sum())
-                
-                resultados.append({
-                    "fecha": dia,
-                    "ciudad": ciudad,
-                    "exodo_personas": total_exodo
-                })
-            
-            # Opcional: Borrar parquets tras analizar para no llenar el disco
-            # path_pq.unlink() 
+    # Descargas (hilos) y conversión + agregado (procesos) solapados (pipeline.py)
+    por_dia = {}
+    dias = daterange(START_DATE, END_DATE)
+    for dia, res_dia in ejecutar_por_dias(dias, descargar_dia, procesar_dia,
+                                          max_descargas=MAX_DESCARGAS, max_procesos=MAX_PROCESOS):
+        if res_dia is not None:
+            print(f"Analizado día: {dia}")
+            por_dia[dia] = res_dia
+
+    if not por_dia:
+        print("No se pudo analizar ningún día.")
+        imprimir_resumen()
+        return
 
     # --- GENERAR INFORME FINAL ---
-    df_final = pd.DataFrame(resultados)
+    # Los días llegan en orden de finalización: se reordenan por fecha para que
+    # idxmax desempate igual que el bucle secuencial
+    df_final = pd.concat([por_dia[d] for d in sorted(por_dia)], ignore_index=True)
+    
+    df_final.to_csv(OUTPUT_DIR / "exodo_visitantes_diario_2025.csv", index=False)
     
     # Encontrar el día de máximo éxodo por ciudad
-    maximos = df_final.loc[df_final.groupby('ciudad')['exodo_personas'].idxmax()]
+    maximos = df_final.loc[df_final.groupby('ciudad')['exodo_personas'].idxmax(), ["fecha", "ciudad", "exodo_personas"]]
     
     print("\n--- RESULTADOS: DÍAS DE MÁXIMO ÉXODO POR CIUDAD ---")
     print(maximos.sort_values(by="exodo_personas", ascending=False))
@@ -113,6 +151,7 @@ def ejecutar_estudio():
     # Guardar a CSV para tu noticia
     maximos.to_csv(OUTPUT_DIR / "maximos_exodos_2025.csv", index=False)
     print(f"\nInforme guardado en: {OUTPUT_DIR / 'maximos_exodos_2025.csv'}")
+    imprimir_resumen()
 
 if __name__ == "__main__":
     ejecutar_estudio()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Caché de la zonificación MITMA (geometrías + atributos)
+=======================================================
+Leer el geojson nacional de distritos, arreglar geometrías y reproyectar cuesta
+más que muchos análisis pequeños. Aquí se hace una vez y se guarda en GeoParquet:
+
+    <CACHE_DIR>/<nombre>_<hash>_<crs>.parquet         geometrías validadas y reproyectadas
+    <CACHE_DIR>/<nombre>_<hash>_atributos.parquet     solo atributos (sin geometría)
+
+La clave es el hash del contenido del fichero fuente (si cambia la zonificación se
+regenera) y el CRS pedido. El hash se recuerda por (tamaño, mtime) en un índice
+para no releer el fichero en cada ejecución.
+
+    gdf = cargar_zonas(BASE_GEOJSON, crs="EPSG:4326")
+    ids = ids_zonas(BASE_GEOJSON)                    # sin tocar geometrías
+    attrs = atributos_zonas(BASE_GEOJSON, ["ID", "provincia"])
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional, Set
+
+import pandas as pd
+
+from zonas import normalizar_ids
+
+CACHE_DIR = Path(os.environ.get("MITMA_CACHE_ZONAS", Path.home() / ".cache" / "datosMITMA" / "zonas"))
+INDICE_NAME = "indice_hashes.json"
+ID_COL = "ID"
+
+_lock = threading.Lock()
+
+
+def _hash_fichero(path: Path, cache_dir: Path) -> str:
+    """sha1 del contenido; se reutiliza mientras no cambien tamaño ni mtime."""
+    path = Path(path).resolve()
+    st = path.stat()
+    firma = f"{st.st_size}:{st.st_mtime_ns}"
+    indice_path = cache_dir / INDICE_NAME
+    with _lock:
+        indice = json.loads(indice_path.read_text(encoding="utf-8")) if indice_path.exists() else {}
+        previo = indice.get(str(path))
+        if previo and previo.get("firma") == firma:
+            return previo["hash"]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    digest = h.hexdigest()[:16]
+
+    with _lock:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        indice = json.loads(indice_path.read_text(encoding="utf-8")) if indice_path.exists() else {}
+        indice[str(path)] = {"firma": firma, "hash": digest}
+        tmp = indice_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(indice, indent=1), encoding="utf-8")
+        os.replace(tmp, indice_path)
+    return digest
+
+
+def _ruta_cache(path: Path, sufijo: str, cache_dir: Path) -> Path:
+    return cache_dir / f"{Path(path).stem}_{_hash_fichero(path, cache_dir)}_{sufijo}.parquet"
+
+
+def _validar(gdf):
+    """Arregla geometrías inválidas (make_valid si existe; buffer(0) como fallback)."""
+    gdf = gdf.copy()
+    try:
+        gdf["geometry"] = gdf.geometry.make_valid()
+    except AttributeError:
+        gdf["geometry"] = gdf.geometry.buffer(0)
+    return gdf
+
+
+def _escribir(df, destino: Path) -> None:
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, destino)
+
+
+def cargar_zonas(
+    path: Path,
+    crs: str = "EPSG:4326",
+    crs_origen: Optional[str] = None,
+    id_col: str = ID_COL,
+    cache_dir: Path = CACHE_DIR,
+):
+    """
+    Zonificación con geometrías válidas en `crs` (GeoDataFrame). La primera vez
+    lee el fichero fuente; después, el GeoParquet cacheado.
+    crs_origen: CRS a asumir si el fichero no lo declara (si None, error).
+    """
+    import geopandas as gpd
+
+    cache_dir = Path(cache_dir)
+    destino = _ruta_cache(path, crs.replace(":", "").lower(), cache_dir)
+    if destino.exists():
+        return gpd.read_parquet(destino)
+
+    print(f"  Cacheando zonificación {Path(path).name} ({crs})...")
+    gdf = gpd.read_file(path)
+    if gdf.crs is None:
+        if crs_origen is None:
+            raise ValueError(f"{Path(path).name} no tiene CRS definido: indica crs_origen")
+        gdf = gdf.set_crs(crs_origen)
+    if id_col in gdf.columns:
+        gdf[id_col] = normalizar_ids(gdf[id_col])
+    gdf = _validar(gdf).to_crs(crs)
+    _escribir(gdf, destino)
+
+    # de paso, los atributos (si aún no están)
+    attrs = _ruta_cache(path, "atributos", cache_dir)
+    if not attrs.exists():
+        _escribir(pd.DataFrame(gdf.drop(columns="geometry")), attrs)
+    return gdf
+
+
+def atributos_zonas(
+    path: Path,
+    columns: Optional[List[str]] = None,
+    id_col: str = ID_COL,
+    cache_dir: Path = CACHE_DIR,
+) -> pd.DataFrame:
+    """Atributos de la zonificación (sin geometría); la primera vez se leen ignorando geometrías."""
+    cache_dir = Path(cache_dir)
+    destino = _ruta_cache(path, "atributos", cache_dir)
+    if not destino.exists():
+        import geopandas as gpd
+        df = pd.DataFrame(gpd.read_file(path, ignore_geometry=True))
+        if id_col in df.columns:
+            df[id_col] = normalizar_ids(df[id_col])
+        _escribir(df, destino)
+    return pd.read_parquet(destino, columns=columns)
+
+
+def ids_zonas(path: Path, id_col: str = ID_COL, cache_dir: Path = CACHE_DIR) -> Set[str]:
+    """Conjunto de IDs de zona (sin cargar geometrías)."""
+    return set(atributos_zonas(path, [id_col], id_col=id_col, cache_dir=cache_dir)[id_col])
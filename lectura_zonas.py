@@ -0,0 +1,132 @@
+"""
+Lectura de parquets MITMA filtrando por zonas (pushdown de predicado y columnas)
+===============================================================================
+En vez de pd.read_parquet(día entero) + str.startswith sobre toda España:
+- se leen solo las columnas pedidas
+- se descartan los row groups cuyo min/max (estadísticas del parquet) no puede
+  contener ninguna de las zonas pedidas; como esquema.py escribe los días
+  ordenados por la zona principal (zona_residencia / origen), una ciudad cae en
+  uno o dos row groups
+- el filtro exacto (IDs o prefijos INE) se aplica después solo a esas filas
+
+Ejemplo:
+    df = leer_parquet_zonas(path, "zona_residencia", prefijos=["41091"],
+                            columns=["zona_residencia", "zona_pernoctacion", "personas"])
+"""
+
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from catalogo import Fecha, ficheros_dias
+
+
+def _rangos(ids: Optional[Iterable[str]], prefijos: Optional[Iterable[str]]) -> List[Tuple[str, str]]:
+    """Zonas pedidas como rangos [lo, hi] de strings (un prefijo cubre todo lo que empieza por él)."""
+    rangos = [(str(i), str(i)) for i in (ids or [])]
+    rangos += [(str(p), str(p) + "\uffff") for p in (prefijos or [])]
+    return rangos
+
+
+def _stat_str(v) -> str:
+    return v.decode("utf-8", errors="replace") if isinstance(v, bytes) else str(v)
+
+
+def row_groups_candidatos(
+    pf: pq.ParquetFile,
+    columna: str,
+    ids: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+) -> List[int]:
+    """Índices de los row groups que PUEDEN contener alguna de las zonas (según min/max)."""
+    md = pf.metadata
+    nombres = [md.schema.column(j).name for j in range(md.num_columns)]
+    rangos = _rangos(ids, prefijos)
+    if columna not in nombres or not rangos:
+        return list(range(md.num_row_groups))
+    j = nombres.index(columna)
+
+    out = []
+    for rg in range(md.num_row_groups):
+        st = md.row_group(rg).column(j).statistics
+        if st is None or not st.has_min_max:
+            out.append(rg)
+            continue
+        mn, mx = _stat_str(st.min), _stat_str(st.max)
+        if any(lo <= mx and hi >= mn for lo, hi in rangos):
+            out.append(rg)
+    return out
+
+
+def mascara_zonas(
+    serie: pd.Series,
+    ids: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+) -> pd.Series:
+    """True donde la zona está en ids o empieza por algún prefijo (en categóricas se evalúa sobre las categorías)."""
+    ids = [str(i) for i in (ids or [])]
+    prefijos = tuple(str(p) for p in (prefijos or []))
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        cats = pd.Series(serie.cat.categories.astype(str))
+        ok = cats.isin(ids)
+        if prefijos:
+            ok |= cats.str.startswith(prefijos)
+        return serie.isin(serie.cat.categories[ok.to_numpy()])
+    s = serie.astype(str)
+    ok = s.isin(ids)
+    if prefijos:
+        ok |= s.str.startswith(prefijos)
+    return ok
+
+
+def leer_parquet_zonas(
+    path: Path,
+    columna: str,
+    ids: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Lee de un parquet solo las filas cuya `columna` está en `ids` o empieza por
+    alguno de `prefijos`, y solo las `columns` pedidas (todas si None).
+    """
+    ids = list(ids or [])
+    prefijos = list(prefijos or [])
+    pf = pq.ParquetFile(path)
+
+    leer = None if columns is None else list(dict.fromkeys(list(columns) + [columna]))
+    rgs = row_groups_candidatos(pf, columna, ids, prefijos)
+    if not rgs:
+        vacio = pf.schema_arrow.empty_table()
+        df = (vacio.select(leer) if leer else vacio).to_pandas()
+    else:
+        df = pf.read_row_groups(rgs, columns=leer).to_pandas()
+        if ids or prefijos:
+            df = df[mascara_zonas(df[columna], ids, prefijos)]
+
+    if columns is not None and columna not in columns:
+        df = df.drop(columns=[columna])
+    return df.reset_index(drop=True)
+
+
+def leer_dias_zonas(
+    base: Path,
+    estudio: str,
+    fechas: Iterable[Fecha],
+    columna: str,
+    ids: Optional[Iterable[str]] = None,
+    prefijos: Optional[Iterable[str]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """leer_parquet_zonas sobre los días del catálogo (catalogo.py) que existan para esas fechas."""
+    ids = list(ids or [])
+    prefijos = list(prefijos or [])
+    dfs = [
+        leer_parquet_zonas(p, columna, ids=ids, prefijos=prefijos, columns=columns)
+        for p in ficheros_dias(base, estudio, fechas)
+    ]
+    if not dfs:
+        raise FileNotFoundError(f"No hay parquets de {estudio} en {base} para las fechas pedidas")
+    return pd.concat(dfs, ignore_index=True)
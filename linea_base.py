@@ -0,0 +1,195 @@
+"""
+Línea base incremental para los análisis de impacto (pie.py)
+===========================================================
+En vez de recalcular media/desviación sobre todos los días de control en cada
+ejecución, se guarda un parquet con estadísticos suficientes por
+(origen, destino, periodo, dia_semana):
+
+    n     : nº de días de control con viajes en esa clave
+    media : media de viajes
+    m2    : suma de cuadrados de las desviaciones a la media (Welford)
+
+Cada día de control nuevo se fusiona con la fórmula de Chan/Welford para
+conjuntos (estable numéricamente, a diferencia de suma/suma de cuadrados), así
+que añadir un control solo requiere su agregado del día, nunca los anteriores.
+Las fechas ya incorporadas (por origen) se guardan en los metadatos del parquet:
+volver a añadir un día no hace nada.
+
+La aportación de cada día (por origen) se guarda aparte en <linea_base>_dias/, así
+que una línea base con solo algunos controles (los elegidos para un evento, sin
+festivos ni el propio día del evento) se calcula leyendo solo esos días.
+
+    actualizar_linea_base(path, df_dia, "2025-03-19", origen="2807920")
+    base = leer_linea_base(path)  # n, media, m2, suma, suma_cuadrados, std
+    base = leer_linea_base(path, origen="2807920", fechas=["2025-03-05", "2025-03-19"])
+"""
+
+import json
+import os
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from catalogo import Fecha, _a_fecha
+
+
+CLAVES = ["origen", "destino", "periodo", "dia_semana"]
+COLUMNAS = CLAVES + ["n", "media", "m2"]
+META_FECHAS = b"linea_base_fechas"
+
+
+def _vacia() -> pd.DataFrame:
+    return pd.DataFrame({
+        "origen": pd.Series(dtype=str), "destino": pd.Series(dtype=str),
+        "periodo": pd.Series(dtype="int64"), "dia_semana": pd.Series(dtype="int64"),
+        "n": pd.Series(dtype="int64"), "media": pd.Series(dtype=float), "m2": pd.Series(dtype=float),
+    })
+
+
+def _fechas_por_origen(path: Path) -> Dict[str, Set[date]]:
+    if not path.exists():
+        return {}
+    meta = pq.read_schema(path).metadata or {}
+    return {o: {_a_fecha(f) for f in fs} for o, fs in json.loads(meta.get(META_FECHAS, b"{}")).items()}
+
+
+def fechas_linea_base(path: Path, origen: Optional[str] = None) -> Set[date]:
+    """Días de control ya incorporados a la línea base (de un origen, o de cualquiera)."""
+    por_origen = _fechas_por_origen(Path(path))
+    if origen is not None:
+        return por_origen.get(str(origen), set())
+    return set().union(*por_origen.values()) if por_origen else set()
+
+
+def ruta_aportacion(path: Path, origen: str, fecha: Fecha) -> Path:
+    """Aportación (filas con n=1) de un día de control a la línea base de un origen."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}_dias") / str(origen) / f"{_a_fecha(fecha):%Y%m%d}.parquet"
+
+
+def leer_linea_base(
+    path: Path,
+    dia_semana: Optional[int] = None,
+    origen: Optional[str] = None,
+    fechas: Optional[Iterable[Fecha]] = None,
+) -> pd.DataFrame:
+    """
+    Línea base (opcionalmente de un día de la semana / origen) con columnas derivadas:
+    suma, suma_cuadrados y std (muestral, ddof=1; 0 si n=1).
+    Con `fechas`, solo con esos días de control (los que estén incorporados), calculada
+    desde sus aportaciones. Lanza ValueError si alguno no tiene la aportación guardada
+    (línea base anterior a guardarlas).
+    """
+    path = Path(path)
+    if fechas is None:
+        df = pd.read_parquet(path) if path.exists() else _vacia()
+    else:
+        df = _desde_aportaciones(path, {_a_fecha(f) for f in fechas}, origen)
+    if dia_semana is not None:
+        df = df[df["dia_semana"] == int(dia_semana)]
+    if origen is not None:
+        df = df[df["origen"] == str(origen)]
+    df = df.reset_index(drop=True)
+    df["suma"] = df["n"] * df["media"]
+    df["suma_cuadrados"] = df["m2"] + df["n"] * df["media"] ** 2
+    df["std"] = np.sqrt(np.where(df["n"] > 1, df["m2"] / (df["n"] - 1).clip(lower=1), 0.0))
+    return df
+
+
+def estadisticos_dia(df_dia: pd.DataFrame, fecha: Fecha, origen: Optional[str] = None) -> pd.DataFrame:
+    """Agregado de un día (destino, periodo, viajes[, origen]) -> filas de línea base con n=1."""
+    d = df_dia.copy()
+    if "origen" not in d.columns:
+        if origen is None:
+            raise ValueError("El agregado no trae columna 'origen': indica origen=")
+        d["origen"] = origen
+    d["origen"] = d["origen"].astype(str)
+    d["destino"] = d["destino"].astype(str)
+    d["periodo"] = pd.to_numeric(d["periodo"], errors="coerce").fillna(0).astype("int64")
+    d["viajes"] = pd.to_numeric(d["viajes"], errors="coerce").fillna(0.0).astype(float)
+    d = d.groupby(["origen", "destino", "periodo"], as_index=False)["viajes"].sum()
+    d["dia_semana"] = _a_fecha(fecha).weekday()
+    d["n"] = 1
+    d["media"] = d["viajes"]
+    d["m2"] = 0.0
+    return d[COLUMNAS]
+
+
+def combinar(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Fusión de Chan/Welford de dos líneas base por CLAVES (vectorizada)."""
+    m = a[COLUMNAS].merge(b[COLUMNAS], on=CLAVES, how="outer", suffixes=("_a", "_b"))
+    na = m["n_a"].fillna(0).astype("int64")
+    nb = m["n_b"].fillna(0).astype("int64")
+    ma = m["media_a"].fillna(0.0)
+    mb = m["media_b"].fillna(0.0)
+    n = na + nb
+    delta = mb - ma
+    m["n"] = n
+    m["media"] = ma + delta * nb / n
+    m["m2"] = m["m2_a"].fillna(0.0) + m["m2_b"].fillna(0.0) + delta ** 2 * na * nb / n
+    return m[COLUMNAS]
+
+
+def _desde_aportaciones(path: Path, fechas: Set[date], origen: Optional[str]) -> pd.DataFrame:
+    """
+    Línea base recalculada con las aportaciones (n=1) de `fechas` que estén incorporadas:
+    n, media y m2 directamente por clave, sin tocar el acumulado.
+    """
+    por_origen = _fechas_por_origen(path)
+    if origen is not None:
+        por_origen = {str(origen): por_origen.get(str(origen), set())}
+    partes = []
+    for o, incluidas in sorted(por_origen.items()):
+        for f in sorted(fechas & incluidas):
+            p = ruta_aportacion(path, o, f)
+            if not p.exists():
+                raise ValueError(
+                    f"{path.name} incluye {f} para el origen {o} pero no guarda su aportación: "
+                    f"regenera la línea base (borra {path.name} y vuelve a añadir los controles)"
+                )
+            partes.append(pd.read_parquet(p))
+    if not partes:
+        return _vacia()
+    g = pd.concat(partes, ignore_index=True).groupby(CLAVES, as_index=False)["media"]
+    df = g.agg(n="count", media="mean")
+    df["m2"] = g.var(ddof=0)["media"].to_numpy() * df["n"]
+    return df[COLUMNAS]
+
+
+def _escribir(df: pd.DataFrame, path: Path, fechas: Dict[str, Set[date]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tabla = pa.Table.from_pandas(df[COLUMNAS].sort_values(CLAVES), preserve_index=False)
+    meta = dict(tabla.schema.metadata or {})
+    meta[META_FECHAS] = json.dumps({o: sorted(f.isoformat() for f in fs) for o, fs in sorted(fechas.items())}).encode()
+    tabla = tabla.replace_schema_metadata(meta)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    pq.write_table(tabla, tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def actualizar_linea_base(path: Path, df_dia: pd.DataFrame, fecha: Fecha, origen: Optional[str] = None) -> bool:
+    """
+    Incorpora un día de control a la línea base. Devuelve False si ese día ya
+    estaba para todos sus orígenes.
+    df_dia: agregado del día con destino, periodo, viajes (y origen, o pasar origen=).
+    """
+    path = Path(path)
+    fecha = _a_fecha(fecha)
+    fechas = _fechas_por_origen(path)
+    dia = estadisticos_dia(df_dia, fecha, origen=origen)
+    dia = dia[[fecha not in fechas.get(o, set()) for o in dia["origen"]]]
+    if dia.empty:
+        return False
+    actual = pd.read_parquet(path) if path.exists() else _vacia()
+    for o, sub in dia.groupby("origen", sort=False):
+        fechas.setdefault(o, set()).add(fecha)
+        p = ruta_aportacion(path, o, fecha)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        sub.to_parquet(p, index=False)
+    _escribir(combinar(actual, dia), path, fechas)
+    return True
@@ -0,0 +1,446 @@
+"""
+Matrices OD por día en disco (memory-mapped), indexadas por código de zona y hora
+================================================================================
+Viajes de un día = matriz distrito x distrito (~3.700 x 3.700) por periodo, pero se
+guarda y reprocesa como decenas de millones de filas largas con strings. Aquí cada
+día se escribe una vez como arrays numpy (.npy) que se abren con mmap, sin copiar:
+
+    <base>/<estudio>_od/diccionario_zonas.parquet        código entero <-> ID (zonas.py, append-only)
+    <base>/<estudio>_od/year=/month=/day=/<YYYYMMDD>/
+        cabecera.json                                    formato, n_zonas, periodos, nnz...
+        indptr.npy, indices.npy, data.npy                CSR: fila = periodo * n + origen
+        t_indptr.npy, t_indices.npy, t_data.npy          la traspuesta (fila = periodo * n + destino)
+      o bien
+        denso.npy                                        float64 [periodos, n, n] (días muy densos y pequeños)
+
+"Viajes que salen de Wanda a las 22h" es un slice de indices/data (microsegundos);
+60 días son 60 slices. Pernoctaciones usa lo mismo con un solo periodo.
+
+    escribir_matriz(base, "viajes", fecha, df)          # df del día (origen, destino, periodo, viajes)
+    m = abrir_matriz(base, "viajes", fecha)
+    destinos, viajes = salidas(m, codigo_wanda, 22)
+    df = flujos(base, "viajes", fechas, origenes=["2807920"], periodos=[22])
+
+    python matriz_od.py construir <base> --dataset viajes [--desde --hasta]
+    python matriz_od.py flujos <base> --origenes 2807920 --periodos 22 --desde --hasta
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalogo import ESTUDIOS, Fecha, _a_fecha, fechas_disponibles, ficheros_dias, ruta_particion
+from cerrojo import bloqueo
+from metricas import etapa
+from zonas import (
+    DICCIONARIO_NAME,
+    Diccionario,
+    cargar_diccionario,
+    codificar,
+    codificar_ids,
+    construir_diccionario,
+    decodificar,
+    guardar_diccionario,
+)
+
+# origen, destino, periodo (None = un solo periodo), medida
+COLUMNAS = {
+    "viajes": ("origen", "destino", "periodo", "viajes"),
+    "pernoctaciones": ("zona_residencia", "zona_pernoctacion", None, "personas"),
+}
+PERIODOS = {"viajes": 24, "pernoctaciones": 1}
+# por encima de esta fracción de celdas no nulas, denso (8 B/celda) ocupa menos que
+# CSR + traspuesta (2 x (8 + 4) B por celda no nula)
+DENSIDAD_DENSO = 1 / 3
+# tope del denso: a nivel distrito 24 x 3.700 x 3.700 x 8 B son ~2,6 GB por día
+MAX_BYTES_DENSO = 512 * 1024**2
+# 2: valores en float64 (la 1 los guardaba en float32 y perdía precisión en los totales)
+FORMATO_VERSION = 2
+CABECERA_NAME = "cabecera.json"
+
+MatrizOD = Dict[str, object]
+
+
+def estudio_od(dataset: str) -> str:
+    return f"{ESTUDIOS[dataset]}_od"
+
+
+def ruta_matriz(base: Path, dataset: str, fecha: Fecha) -> Path:
+    """Carpeta del día (mismo layout Hive que el catálogo)."""
+    return ruta_particion(base, estudio_od(dataset), fecha).with_suffix("")
+
+
+def existe_matriz(base: Path, dataset: str, fecha: Fecha) -> bool:
+    """Hay matriz del día en el formato actual (las de versiones anteriores se reconstruyen)."""
+    path = ruta_matriz(base, dataset, fecha) / CABECERA_NAME
+    if not path.exists():
+        return False
+    return json.loads(path.read_text(encoding="utf-8")).get("version") == FORMATO_VERSION
+
+
+# =========================
+# Diccionario de zonas del almacén
+# =========================
+def ruta_diccionario(base: Path, dataset: str) -> Path:
+    return Path(base) / estudio_od(dataset) / DICCIONARIO_NAME
+
+
+def diccionario_od(base: Path, dataset: str) -> Diccionario:
+    return cargar_diccionario(ruta_diccionario(base, dataset))
+
+
+def _ampliar_diccionario(base: Path, dataset: str, ids: Iterable[str]) -> Diccionario:
+    """Añade IDs nuevos al diccionario del almacén (append-only, con cerrojo entre procesos)."""
+    path = ruta_diccionario(base, dataset)
+    ids = pd.unique(np.asarray(list(ids), dtype=object))
+    with bloqueo(path):
+        previo = cargar_diccionario(path) if path.exists() else None
+        dic = construir_diccionario(ids, previo=previo)
+        if previo is None or len(dic["ids"]) > len(previo["ids"]):
+            guardar_diccionario(dic, path)
+    return dic
+
+
+# =========================
+# Escritura
+# =========================
+def _csr(filas: np.ndarray, cols: np.ndarray, valores: np.ndarray, n_filas: int, n_cols: int):
+    """CSR (indptr, indices, data) sumando duplicados; columnas ordenadas dentro de cada fila."""
+    clave = filas.astype(np.int64) * n_cols + cols
+    unicas, inv = np.unique(clave, return_inverse=True)
+    data = np.bincount(inv, weights=valores, minlength=len(unicas))
+    f = unicas // n_cols
+    indptr = np.zeros(n_filas + 1, dtype=np.int64)
+    np.cumsum(np.bincount(f, minlength=n_filas), out=indptr[1:])
+    return indptr, (unicas % n_cols).astype(np.int32), data
+
+
+def escribir_matriz(base: Path, dataset: str, fecha: Fecha, df: pd.DataFrame, formato: str = "auto") -> Path:
+    """
+    Escribe la matriz del día desde el df normalizado (columnas de COLUMNAS[dataset]).
+    formato: "csr" | "denso" | "auto" (denso si la densidad supera DENSIDAD_DENSO y
+    el array cabe en MAX_BYTES_DENSO). Los valores se guardan en float64.
+    """
+    c_o, c_d, c_p, c_v = COLUMNAS[dataset]
+    periodos = PERIODOS[dataset]
+    dic = _ampliar_diccionario(base, dataset, pd.Index(df[c_o].unique()).append(pd.Index(df[c_d].unique())).astype(str))
+    n = len(dic["ids"])
+
+    o = codificar(df[c_o], dic).astype(np.int64)
+    d = codificar(df[c_d], dic).astype(np.int64)
+    p = pd.to_numeric(df[c_p], errors="coerce").fillna(-1).to_numpy().astype(np.int64) if c_p else np.zeros(len(df), np.int64)
+    v = pd.to_numeric(df[c_v], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+    ok = (o >= 0) & (d >= 0) & (p >= 0) & (p < periodos) & (v != 0)
+    o, d, p, v = o[ok], d[ok], p[ok], v[ok]
+
+    indptr, indices, data = _csr(p * n + o, d, v, periodos * n, n)
+    bytes_denso = periodos * n * n * np.dtype(np.float64).itemsize
+    if formato == "auto":
+        denso_ok = len(data) > DENSIDAD_DENSO * periodos * n * n and bytes_denso <= MAX_BYTES_DENSO
+        formato = "denso" if denso_ok else "csr"
+    elif formato == "denso" and bytes_denso > MAX_BYTES_DENSO:
+        raise ValueError(
+            f"matriz densa de {bytes_denso / 1024**2:,.0f} MB ({periodos} x {n} x {n}) supera "
+            f"MAX_BYTES_DENSO ({MAX_BYTES_DENSO / 1024**2:,.0f} MB); usa formato csr"
+        )
+
+    destino = ruta_matriz(base, dataset, fecha)
+    tmp = destino.with_name(destino.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    if formato == "denso":
+        denso = np.zeros((periodos, n, n), dtype=np.float64)
+        filas = np.repeat(np.arange(periodos * n), np.diff(indptr))
+        denso.reshape(periodos * n, n)[filas, indices] = data
+        np.save(tmp / "denso.npy", denso)
+    elif formato == "csr":
+        np.save(tmp / "indptr.npy", indptr)
+        np.save(tmp / "indices.npy", indices)
+        np.save(tmp / "data.npy", data)
+        t_indptr, t_indices, t_data = _csr(p * n + d, o, v, periodos * n, n)
+        np.save(tmp / "t_indptr.npy", t_indptr)
+        np.save(tmp / "t_indices.npy", t_indices)
+        np.save(tmp / "t_data.npy", t_data)
+    else:
+        raise ValueError(f"formato desconocido: {formato} (csr | denso | auto)")
+
+    cabecera = {
+        "version": FORMATO_VERSION,
+        "dataset": dataset,
+        "fecha": _a_fecha(fecha).isoformat(),
+        "formato": formato,
+        "n_zonas": n,
+        "periodos": periodos,
+        "nnz": int(len(data)),
+        "medida": c_v,
+        "total": float(data.sum()),
+    }
+    (tmp / CABECERA_NAME).write_text(json.dumps(cabecera, indent=1), encoding="utf-8")
+
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(tmp, destino)
+    _abrir.cache_clear()
+    return destino
+
+
+def asegurar_matriz(base: Path, dataset: str, fecha: Fecha, formato: str = "auto") -> Path:
+    """Matriz del día desde el parquet del catálogo (solo las columnas necesarias) si aún no existe."""
+    if existe_matriz(base, dataset, fecha):
+        return ruta_matriz(base, dataset, fecha)
+    files = ficheros_dias(base, ESTUDIOS[dataset], [fecha])
+    if not files:
+        raise FileNotFoundError(f"No hay parquet de {ESTUDIOS[dataset]} para {fecha} en {base}")
+    cols = [c for c in COLUMNAS[dataset] if c]
+    df = pd.concat([pd.read_parquet(p, columns=cols) for p in files], ignore_index=True)
+    with etapa("matriz_od", dia=_a_fecha(fecha).strftime("%Y%m%d"), filas=len(df)):
+        return escribir_matriz(base, dataset, fecha, df, formato=formato)
+
+
+# =========================
+# Lectura (mmap, sin copias)
+# =========================
+@lru_cache(maxsize=256)
+def _abrir(carpeta: str) -> MatrizOD:
+    carpeta = Path(carpeta)
+    m = json.loads((carpeta / CABECERA_NAME).read_text(encoding="utf-8"))
+    nombres = ["denso"] if m["formato"] == "denso" else ["indptr", "indices", "data", "t_indptr", "t_indices", "t_data"]
+    for nombre in nombres:
+        m[nombre] = np.load(carpeta / f"{nombre}.npy", mmap_mode="r")
+    return m
+
+
+def abrir_matriz(base: Path, dataset: str, fecha: Fecha) -> MatrizOD:
+    """Cabecera + arrays memory-mapped del día (se cachean los abiertos)."""
+    carpeta = ruta_matriz(base, dataset, fecha)
+    if not (carpeta / CABECERA_NAME).exists():
+        raise FileNotFoundError(f"No hay matriz OD de {dataset} para {fecha} en {base}")
+    return _abrir(str(carpeta))
+
+
+_VACIO = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64))
+
+
+def _fila(m: MatrizOD, zona: int, periodo: int, traspuesta: bool) -> Tuple[np.ndarray, np.ndarray]:
+    n = m["n_zonas"]
+    if not (0 <= zona < n and 0 <= periodo < m["periodos"]):
+        return _VACIO
+    if m["formato"] == "denso":
+        fila = m["denso"][periodo, :, zona] if traspuesta else m["denso"][periodo, zona, :]
+        nz = np.flatnonzero(fila)
+        return nz.astype(np.int32), fila[nz]
+    pre = "t_" if traspuesta else ""
+    r = periodo * n + zona
+    a, b = m[pre + "indptr"][r], m[pre + "indptr"][r + 1]
+    return m[pre + "indices"][a:b], m[pre + "data"][a:b]
+
+
+def salidas(m: MatrizOD, origen: int, periodo: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """(códigos de destino, valores) desde `origen` en `periodo`: vistas sobre el mmap (CSR)."""
+    return _fila(m, origen, periodo, traspuesta=False)
+
+
+def entradas(m: MatrizOD, destino: int, periodo: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """(códigos de origen, valores) hacia `destino` en `periodo`."""
+    return _fila(m, destino, periodo, traspuesta=True)
+
+
+def flujos_codigos(
+    m: MatrizOD,
+    origenes: Iterable[int] = (),
+    destinos: Iterable[int] = (),
+    periodos: Optional[Iterable[int]] = None,
+) -> pd.DataFrame:
+    """
+    Flujos de un día que salen de `origenes` o llegan a `destinos` (códigos), sin
+    duplicar los que cumplen ambas cosas. DF: periodo, origen, destino, valor (códigos).
+    """
+    origenes = [int(z) for z in origenes]
+    destinos = [int(z) for z in destinos]
+    set_o = np.asarray(origenes, dtype=np.int64)
+    periodos = list(range(m["periodos"])) if periodos is None else [int(p) for p in periodos]
+    partes = []
+    for p in periodos:
+        for z in origenes:
+            idx, val = salidas(m, z, p)
+            partes.append((p, np.full(len(idx), z), idx, val))
+        for z in destinos:
+            idx, val = entradas(m, z, p)
+            nuevo = ~np.isin(idx, set_o)
+            partes.append((p, idx[nuevo], np.full(int(nuevo.sum()), z), val[nuevo]))
+    if not partes:
+        partes = [(0, np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float64))]
+    return pd.DataFrame({
+        "periodo": np.concatenate([np.full(len(x[1]), x[0], dtype=np.int16) for x in partes]),
+        "origen": np.concatenate([x[1] for x in partes]).astype(np.int32),
+        "destino": np.concatenate([x[2] for x in partes]).astype(np.int32),
+        "valor": np.concatenate([x[3] for x in partes]).astype(np.float64),
+    })
+
+
+def flujos(
+    base: Path,
+    dataset: str,
+    fechas: Iterable[Fecha],
+    origenes: Iterable[str] = (),
+    destinos: Iterable[str] = (),
+    periodos: Optional[Iterable[int]] = None,
+) -> pd.DataFrame:
+    """
+    Flujos de varios días desde/hacia zonas (IDs); los días sin matriz se saltan.
+    DF: fecha, periodo, origen, destino, <medida> (IDs como str).
+    """
+    dic = diccionario_od(base, dataset)
+    cod_o = [c for c in codificar_ids(list(origenes), dic) if c >= 0]
+    cod_d = [c for c in codificar_ids(list(destinos), dic) if c >= 0]
+    medida = COLUMNAS[dataset][3]
+    out = []
+    for f in fechas:
+        if not existe_matriz(base, dataset, f):
+            continue
+        df = flujos_codigos(abrir_matriz(base, dataset, f), cod_o, cod_d, periodos)
+        df.insert(0, "fecha", _a_fecha(f))
+        out.append(df)
+    if not out:
+        return pd.DataFrame(columns=["fecha", "periodo", "origen", "destino", medida])
+    res = pd.concat(out, ignore_index=True).rename(columns={"valor": medida})
+    res["origen"] = decodificar(res["origen"].to_numpy(), dic)
+    res["destino"] = decodificar(res["destino"].to_numpy(), dic)
+    return res
+
+
+# =========================
+# Consultas de los análisis (pie.py, full.py)
+# =========================
+def agregado_zonas(
+    base: Path,
+    fecha: Fecha,
+    origenes: Iterable[str] = (),
+    destinos: Iterable[str] = (),
+    valid_ids: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    Lo mismo que pie.read_mitma_zonas_agg pero desde la matriz del día: viajes que
+    salen de `origenes` o llegan a `destinos`, sin intradistrito y con el otro
+    extremo filtrado a valid_ids. DF: origen, destino, periodo, viajes.
+    """
+    dic = diccionario_od(base, "viajes")
+    cod_o = codificar_ids(list(origenes), dic)
+    cod_d = codificar_ids(list(destinos), dic)
+    df = flujos_codigos(abrir_matriz(base, "viajes", fecha), cod_o[cod_o >= 0], cod_d[cod_d >= 0])
+    origen, destino = df["origen"].to_numpy(), df["destino"].to_numpy()
+    m_o = np.isin(origen, cod_o)
+    m_d = np.isin(destino, cod_d)
+    # Filtrar a IDs válidos del geojson en el extremo que no es la sede
+    if valid_ids is not None:
+        validos = codificar_ids(sorted(valid_ids), dic)
+        m_o &= np.isin(destino, validos)
+        m_d &= np.isin(origen, validos)
+    keep = (m_o | m_d) & (origen != destino)
+    df = df[keep]
+    return pd.DataFrame({
+        "origen": decodificar(df["origen"].to_numpy(), dic),
+        "destino": decodificar(df["destino"].to_numpy(), dic),
+        "periodo": df["periodo"].astype(int).to_numpy(),
+        "viajes": df["valor"].to_numpy(),
+    })
+
+
+def exodo_od(base: Path, fecha: Fecha, ciudades: Dict[str, str]) -> pd.DataFrame:
+    """
+    Éxodo y visitantes por ciudad desde la matriz de pernoctaciones del día, leyendo
+    solo las filas/columnas de las zonas de cada ciudad (misma salida que
+    exodo.calcular_exodo: ciudad, exodo_personas, visitantes_personas).
+    """
+    dic = diccionario_od(base, "pernoctaciones")
+    m = abrir_matriz(base, "pernoctaciones", fecha)
+    munis = pd.Index(dic["municipios"])
+    muni_zona = dic["municipio"]
+    exodo, visitantes = [], []
+    for prefijo in ciudades.values():
+        i_muni = munis.get_indexer([str(prefijo)])[0]
+        zonas_c = np.flatnonzero(muni_zona == i_muni) if i_muni >= 0 else np.empty(0, dtype=np.int64)
+        ex = vi = 0.0
+        for z in zonas_c:
+            idx, val = salidas(m, int(z))
+            ex += float(val[muni_zona[idx] != i_muni].sum(dtype=np.float64))
+            idx, val = entradas(m, int(z))
+            vi += float(val[muni_zona[idx] != i_muni].sum(dtype=np.float64))
+        exodo.append(ex)
+        visitantes.append(vi)
+    return pd.DataFrame({
+        "ciudad": list(ciudades),
+        "exodo_personas": np.asarray(exodo).astype("int64"),
+        "visitantes_personas": np.asarray(visitantes).astype("int64"),
+    })
+
+
+def construir(base: Path, dataset: str, desde: Optional[Fecha] = None, hasta: Optional[Fecha] = None, formato: str = "auto") -> int:
+    """Matrices de los días ya convertidos en el catálogo que aún no la tienen."""
+    dias = fechas_disponibles(base, ESTUDIOS[dataset])
+    if desde:
+        dias = [d for d in dias if d >= _a_fecha(desde)]
+    if hasta:
+        dias = [d for d in dias if d <= _a_fecha(hasta)]
+    hechos = 0
+    for d in dias:
+        if not existe_matriz(base, dataset, d):
+            asegurar_matriz(base, dataset, d, formato=formato)
+            m = abrir_matriz(base, dataset, d)
+            print(f"  ✓ {d}: {m['formato']}, {m['nnz']:,} celdas")
+            hechos += 1
+    return hechos
+
+
+def _dias(desde: Fecha, hasta: Fecha) -> List:
+    return list(pd.date_range(_a_fecha(desde), _a_fecha(hasta)).date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matrices OD diarias memory-mapped")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("construir", help="matrices de los días ya convertidos")
+    p_c.add_argument("base", type=Path)
+    p_c.add_argument("--dataset", choices=list(COLUMNAS), default="viajes")
+    p_c.add_argument("--desde", default=None)
+    p_c.add_argument("--hasta", default=None)
+    p_c.add_argument("--formato", choices=["auto", "csr", "denso"], default="auto")
+    p_f = sub.add_parser("flujos", help="flujos desde/hacia unas zonas en un rango de días")
+    p_f.add_argument("base", type=Path)
+    p_f.add_argument("--dataset", choices=list(COLUMNAS), default="viajes")
+    p_f.add_argument("--desde", required=True)
+    p_f.add_argument("--hasta", required=True)
+    p_f.add_argument("--origenes", default="")
+    p_f.add_argument("--destinos", default="")
+    p_f.add_argument("--periodos", default="", help="p. ej. 21,22,23 (por defecto todos)")
+    p_f.add_argument("--salida", type=Path, default=None, help=".csv o .parquet (si no, resumen por día)")
+    args = parser.parse_args()
+
+    lista = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    if args.cmd == "construir":
+        print(f"Días procesados: {construir(args.base, args.dataset, args.desde, args.hasta, args.formato)}")
+    elif args.cmd == "flujos":
+        t = time.perf_counter()
+        df = flujos(
+            args.base, args.dataset, _dias(args.desde, args.hasta),
+            origenes=lista(args.origenes), destinos=lista(args.destinos),
+            periodos=[int(p) for p in lista(args.periodos)] or None,
+        )
+        print(f"{len(df):,} flujos en {time.perf_counter() - t:.3f} s")
+        if args.salida is None:
+            print(df.groupby("fecha")[COLUMNAS[args.dataset][3]].sum().to_string())
+        elif args.salida.suffix.lower() == ".parquet":
+            df.to_parquet(args.salida, index=False)
+        else:
+            df.to_csv(args.salida, index=False)
+
+
+if __name__ == "__main__":
+    main()
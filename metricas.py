@@ -0,0 +1,258 @@
+"""
+Tiempos y memoria por etapa y por día (descarga, gzip/CSV, números, parquet, agregados)
+======================================================================================
+Los scripts solo imprimían "Descargando..." / "✓ Guardado"; en un backfill lento no se
+sabía si el tiempo se iba en red, en parsear el CSV, en los números o en el parquet.
+Cada paso se envuelve en una etapa:
+
+    with etapa("lectura_csv", dia=yyyymmdd, bytes_in=gz_path.stat().st_size) as m:
+        df = read_mitma_csv_gz(gz_path)
+        m["filas"] = len(df)
+
+y queda un registro con: etapa, día, segundos, bytes de entrada/salida, filas, filas/s,
+RSS al empezar/terminar y pico de RSS durante la etapa (un hilo muestrea la memoria
+del proceso cada INTERVALO_S mientras haya etapas abiertas; con psutil si está,
+si no /proc/self/statm). Las etapas pueden anidarse.
+
+Con configurar(ruta.jsonl) cada registro se añade además como una línea JSON; la ruta
+va en una variable de entorno, así que los procesos de los pools (pipeline.py,
+convertir_en_paralelo, eventos.py) escriben en el mismo fichero. Al final:
+
+    imprimir_resumen()                     # tabla por etapa (y opcionalmente por día)
+    python metricas.py <ruta.jsonl> [--por-dia]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None  # opcional
+
+ENV_LOG = "DATOSMITMA_METRICAS"
+ENV_EJECUCION = "DATOSMITMA_EJECUCION"
+INTERVALO_S = 0.05
+METRICAS_DIR = "metricas"
+
+_RE_DIA = re.compile(r"(20\d{6})")
+_STATM = Path("/proc/self/statm")
+
+Registro = Dict[str, object]
+
+# registros de este proceso y etapas abiertas (para el muestreo de memoria)
+_REGISTROS: List[Registro] = []
+_ABIERTAS: List[Registro] = []
+_LOCK = threading.Lock()
+_MUESTREO_PID: Optional[int] = None
+
+
+def _rss_mb() -> Optional[float]:
+    """Memoria residente actual del proceso (MB)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1e6
+    try:
+        with open(_STATM) as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _muestrear() -> None:
+    while True:
+        time.sleep(INTERVALO_S)
+        if not _ABIERTAS:
+            continue
+        rss = _rss_mb()
+        if rss is None:
+            continue
+        with _LOCK:
+            for r in _ABIERTAS:
+                r["pico_mb"] = max(r["pico_mb"] or 0.0, rss)
+
+
+def _tras_fork() -> None:
+    # el hijo no hereda el hilo de muestreo; el cerrojo podía estar tomado por él
+    global _LOCK
+    _LOCK = threading.Lock()
+    _ABIERTAS.clear()
+    _REGISTROS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_tras_fork)
+
+
+def _asegurar_muestreo() -> None:
+    # un hilo por proceso (tras un fork el hilo del padre no existe en el hijo)
+    global _MUESTREO_PID
+    if _MUESTREO_PID != os.getpid():
+        _MUESTREO_PID = os.getpid()
+        threading.Thread(target=_muestrear, name="metricas-rss", daemon=True).start()
+
+
+def dia_de(path) -> Optional[str]:
+    """'.../20250301_Viajes_distritos.csv.gz' -> '20250301' (None si no lleva fecha)."""
+    m = _RE_DIA.search(Path(path).name) if path is not None else None
+    return m.group(1) if m else None
+
+
+def configurar(log_path: Optional[Path], ejecucion: Optional[str] = None) -> Optional[Path]:
+    """
+    Activa el log JSONL (None lo desactiva). Lo heredan los procesos hijos por entorno.
+    Devuelve la ruta del log.
+    """
+    if log_path is None:
+        os.environ.pop(ENV_LOG, None)
+        return None
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    os.environ[ENV_LOG] = str(log_path)
+    os.environ[ENV_EJECUCION] = ejecucion or datetime.now().strftime("%Y%m%dT%H%M%S")
+    return log_path
+
+
+def log_por_defecto(carpeta: Path, script: str) -> Path:
+    """<carpeta>/metricas/<script>_<fecha-hora>.jsonl"""
+    return Path(carpeta) / METRICAS_DIR / f"{script}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+
+
+def _escribir(r: Registro) -> None:
+    log = os.environ.get(ENV_LOG)
+    if not log:
+        return
+    # una línea por registro en modo append: los procesos no se pisan las líneas
+    with open(log, "a", encoding="utf-8") as f:
+        f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def etapa(nombre: str, dia: Optional[str] = None, **datos) -> Iterator[Registro]:
+    """
+    Mide una etapa. El registro que se cede admite filas, bytes_in, bytes_out (y
+    cualquier otro campo) para rellenarlos dentro del bloque.
+    """
+    _asegurar_muestreo()
+    rss = _rss_mb()
+    r: Registro = {
+        "ejecucion": os.environ.get(ENV_EJECUCION),
+        "script": Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else None,
+        "pid": os.getpid(),
+        "etapa": nombre,
+        "dia": dia,
+        "inicio": datetime.now().isoformat(timespec="milliseconds"),
+        "segundos": None,
+        "filas": None,
+        "bytes_in": None,
+        "bytes_out": None,
+        "rss_inicio_mb": rss,
+        "pico_mb": rss,
+        **datos,
+    }
+    with _LOCK:
+        _ABIERTAS.append(r)
+    t0 = time.perf_counter()
+    try:
+        yield r
+    except BaseException as e:
+        r["error"] = type(e).__name__
+        raise
+    finally:
+        r["segundos"] = time.perf_counter() - t0
+        rss = _rss_mb()
+        with _LOCK:
+            _ABIERTAS.remove(r)
+        r["rss_fin_mb"] = rss
+        if rss is not None:
+            r["pico_mb"] = max(r["pico_mb"] or 0.0, rss)
+        if r["filas"] and r["segundos"] > 0:
+            r["filas_s"] = r["filas"] / r["segundos"]
+        _REGISTROS.append(r)
+        _escribir(r)
+
+
+def registros(log_path: Optional[Path] = None) -> pd.DataFrame:
+    """Registros del log JSONL (el configurado si no se indica) o, sin log, los de este proceso."""
+    actual = log_path is None
+    log_path = log_path or os.environ.get(ENV_LOG)
+    if log_path and Path(log_path).exists():
+        with open(log_path, encoding="utf-8") as f:
+            filas = [json.loads(l) for l in f if l.strip()]
+        if actual:
+            filas = [r for r in filas if r.get("ejecucion") == os.environ.get(ENV_EJECUCION)]
+    else:
+        filas = list(_REGISTROS)
+    return pd.DataFrame(filas)
+
+
+def resumen(df: Optional[pd.DataFrame] = None, por_dia: bool = False) -> pd.DataFrame:
+    """
+    Tabla por etapa (y día): llamadas, segundos totales y medios, MB de entrada/salida,
+    filas, filas/s y pico de RSS máximo.
+    """
+    df = registros() if df is None else df
+    if df.empty:
+        return pd.DataFrame()
+    for c in ["filas", "bytes_in", "bytes_out", "pico_mb"]:
+        if c not in df.columns:
+            df[c] = None
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    claves = ["etapa", "dia"] if por_dia else ["etapa"]
+    df = df.assign(dia=df["dia"].fillna("-"))
+    g = df.groupby(claves, sort=False)
+    out = pd.DataFrame({
+        "llamadas": g.size(),
+        "dias": g["dia"].nunique(),
+        "s_total": g["segundos"].sum(),
+        "s_medio": g["segundos"].mean(),
+        "mb_in": g["bytes_in"].sum(min_count=1) / 1e6,
+        "mb_out": g["bytes_out"].sum(min_count=1) / 1e6,
+        "filas": g["filas"].sum(min_count=1),
+        "pico_mb": g["pico_mb"].max(),
+    })
+    out["filas_s"] = out["filas"] / out["s_total"].where(out["s_total"] > 0)
+    if por_dia:
+        out = out.drop(columns="dias")
+    return out.sort_values("s_total", ascending=False)
+
+
+def imprimir_resumen(log_path: Optional[Path] = None, por_dia: bool = False) -> pd.DataFrame:
+    """Imprime (y devuelve) el resumen de la ejecución."""
+    tabla = resumen(registros(log_path), por_dia=por_dia)
+    if tabla.empty:
+        print("ℹ️ Sin métricas registradas.")
+        return tabla
+    formatos = {
+        "s_total": "{:,.2f}".format, "s_medio": "{:,.3f}".format, "mb_in": "{:,.1f}".format,
+        "mb_out": "{:,.1f}".format, "filas": "{:,.0f}".format, "filas_s": "{:,.0f}".format,
+        "pico_mb": "{:,.0f}".format,
+    }
+    print("\n⏱️ Tiempo y memoria por etapa:")
+    print(tabla.to_string(formatters=formatos, na_rep="-"))
+    log = log_path or os.environ.get(ENV_LOG)
+    if log:
+        print(f"   (detalle por día en {log})")
+    return tabla
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de un log de métricas (.jsonl)")
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--por-dia", action="store_true")
+    args = parser.parse_args()
+    imprimir_resumen(args.log, por_dia=args.por_dia)
+
+
+if __name__ == "__main__":
+    main()
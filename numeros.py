@@ -0,0 +1,58 @@
+"""
+Parser compartido de números en formato español del MITMA
+=========================================================
+Comportamiento único para todos los scripts:
+  - '.' es separador de miles y ',' el decimal:  '2.788' -> 2788 ; '1.234,56' -> 1234.56 ; '8,3' -> 8.3
+  - se ignoran espacios alrededor
+  - vacío, nulo o basura -> 0
+  - parse_miles_int redondea al entero más cercano ('2,6' -> 3)
+Si la columna ya es numérica se devuelve tal cual (solo cambia el dtype).
+
+Camino rápido: las transformaciones se hacen con kernels de pyarrow.compute
+directamente sobre los buffers de strings de Arrow, sin Series intermedias.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# número válido tras quitar miles y pasar la coma decimal a punto
+_RE_NUMERO = r"^[+-]?(\d+(\.\d*)?|\.\d+)$"
+
+
+def _a_arrow(series: pd.Series) -> pa.Array:
+    arr = pa.array(series, from_pandas=True)
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if pa.types.is_dictionary(arr.type):
+        arr = arr.dictionary_decode()
+    if not pa.types.is_string(arr.type) and not pa.types.is_large_string(arr.type):
+        arr = pc.cast(arr, pa.string())
+    return arr
+
+
+def _parse_float_array(series: pd.Series) -> np.ndarray:
+    arr = _a_arrow(series)
+    arr = pc.utf8_trim_whitespace(arr)
+    arr = pc.replace_substring(arr, ".", "")
+    arr = pc.replace_substring(arr, ",", ".")
+    valido = pc.fill_null(pc.match_substring_regex(arr, _RE_NUMERO), False)
+    arr = pc.if_else(valido, arr, "0")
+    return pc.cast(arr, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def parse_miles_float(series: pd.Series) -> pd.Series:
+    """'8.013' -> 8013.0 ; '8,3' -> 8.3 ; '1.234,56' -> 1234.56 ; basura/nulo -> 0.0"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0.0).astype(float)
+    return pd.Series(_parse_float_array(series), index=series.index, name=series.name)
+
+
+def parse_miles_int(series: pd.Series) -> pd.Series:
+    """'2.788' -> 2788 ; '2,6' -> 3 ; basura/nulo -> 0 (int64)"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0).round().astype("int64")
+    vals = np.rint(_parse_float_array(series)).astype("int64")
+    return pd.Series(vals, index=series.index, name=series.name)
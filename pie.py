@@ -2,22 +2,34 @@
 Pipeline: Impacto del derbi (Wanda) en movilidad MITMA + GeoJSON/HTML por hora
 ============================================================================
 - Descarga MITMA (csv.gz) por día
-- Lee en chunks, filtra origen=Wanda, excluye intradistrito, filtra IDs válidos (según GeoJSON)
+- Lee en chunks, filtra origen=Wanda (o varios orígenes/destinos en una pasada),
+  excluye intradistrito, filtra IDs válidos (según GeoJSON)
 - Calcula esperado por (destino,hora) con controles (media + IC95)
 - Calcula impacto derbi vs esperado
-- Exporta GeoJSON con "impacto_por_hora" para visor Leaflet (slider 0-23)
+- Exporta GeoJSON (o PMTiles) + valores zona x hora para visor Leaflet (slider 0-23)
+
+Un evento: python pie.py (CONFIG abajo). Muchos eventos/estadios: eventos.py
 """
 
 import warnings
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Set
-import json
+from typing import Dict, Iterable, List, Optional, Set
+import shutil
 
 import numpy as np
 import pandas as pd
-import requests
-import geopandas as gpd
+
+from descargas import descarga_completa, download_file as descargar
+from dialecto_mitma import abrir_gz, detectar_dialecto
+from exportar_geo import escribir_valores, exportar_geo, matriz_zona_hora
+from geometrias import cargar_zonas, ids_zonas
+from linea_base import actualizar_linea_base, fechas_linea_base, leer_linea_base
+from matriz_od import agregado_zonas, existe_matriz
+from metricas import configurar, dia_de, etapa, imprimir_resumen, log_por_defecto
+from numeros import parse_miles_float
+from teselas import CAPA, cabecera_pmtiles, pmtiles_zonificacion
+from zonas import codificar, codificar_ids, construir_diccionario, decodificar, normalizar_ids
 
 warnings.filterwarnings("ignore")
 
@@ -29,9 +41,6 @@ DATA_DIR = OUTPUT_DIR / "datos_movilidad"
 ANALYSIS_DIR = OUTPUT_DIR / "analisis"
 MAP_DIR = OUTPUT_DIR / "mapa_impacto"
 
-for d in [DATA_DIR, ANALYSIS_DIR, MAP_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
-
 BASE_URL = (
     "https://movilidad-opendata.mitma.es/"
     "estudios_basicos/por-distritos/viajes/ficheros-diarios"
@@ -57,39 +66,50 @@ GEO_ID_COL = "ID"
 INTERVALO_CONFIANZA_Z = 1.96  # 95%
 MIN_N = 3  # mínimo nº días control para considerar (destino,hora)
 
+# Línea base acumulada de controles (linea_base.py): cada control se agrega una sola vez.
+# El esperado usa solo FECHAS_CONTROL: los demás días guardados (de otras ejecuciones o
+# de eventos.py) no se leen, así que quitar un control de la lista basta.
+LINEA_BASE = ANALYSIS_DIR / "linea_base_controles.parquet"
+
 # Salida visor
-OUT_GEOJSON = str(MAP_DIR / "distritos_impacto_por_hora.geojson")
+# Tamaño del fichero del visor (exportar_geo.py)
+EXPORT_SOLO_CON_VALORES = True   # solo distritos con algún impacto > 0
+EXPORT_BBOX = None               # (lon_min, lat_min, lon_max, lat_max) para recortar a una región
+EXPORT_TOLERANCIA_M = 50         # simplificación en metros (0 = geometría completa)
+EXPORT_DECIMALES = 5             # decimales de lon/lat (~1 m)
+EXPORT_FORMATO = "geojson"       # "topojson" requiere pip install topojson
+EXPORT_GZIP = True               # escribe también .gz precomprimido (el visor carga ese)
+
+# Mapa nacional en teselas vectoriales (teselas.py): geometrías PMTiles cacheadas
+# por zonificación + valores por zona aparte; el visor solo pide lo que está a la vista
+MAPA_TESELAS = False
+TESELAS_ZOOM = (4, 12)
+
+# Matrices OD diarias ya construidas (matriz_od.py, p. ej. descargarViajes con MATRIZ_OD=True):
+# si el día está, el agregado sale de slices de la matriz sin descargar ni leer el gz
+# (viajes enteros, como en el catálogo: esquema.py)
+OD_DIR = None  # p. ej. Path(r"C:\Users\khora\Downloads")
+
+OUT_GEOJSON = str(MAP_DIR / f"distritos_impacto_por_hora.{EXPORT_FORMATO}")
 OUT_HTML = str(MAP_DIR / "visor_impacto_por_hora.html")
+OUT_VALORES = str(MAP_DIR / "valores_impacto_por_hora.json")
+OUT_HTML_TESELAS = str(MAP_DIR / "visor_impacto_por_hora_teselas.html")
 
 
 # =========================
 # Helpers (formato como tu ejemplo)
 # =========================
-def to_zone_str(s: pd.Series) -> pd.Series:
-    """Convierte zona a string, estilo tu ejemplo."""
-    return (
-        pd.to_numeric(s, errors="coerce")
-        .astype("Int64")
-        .astype(str)
-        .str.zfill(5)
-    )
-
-def parse_miles_float(series: pd.Series) -> pd.Series:
-    """'8.013' -> 8013 ; '8,3' -> 8.3 ; robusto a basura."""
-    s = series.astype(str).str.strip()
-    s = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
-    return pd.to_numeric(s, errors="coerce").fillna(0.0).astype(float)
-
 def download_file(url: str, dest: Path) -> bool:
-    dest.parent.mkdir(parents=True, exist_ok=True)
+    """
+    Descarga reanudable (.part + Range) y con gzip comprobado vía descargas.py.
+    Un .gz truncado de una ejecución anterior no cuenta como descargado.
+    """
+    if descarga_completa(dest):
+        return True
     try:
         print(f"  Descargando: {url}")
-        with requests.get(url, stream=True, timeout=120) as r:
-            r.raise_for_status()
-            with open(dest, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024 * 1024):
-                    if chunk:
-                        f.write(chunk)
+        dest.unlink(missing_ok=True)
+        descargar(url, dest)
         return True
     except Exception as e:
         print(f"  ⚠️ Error descarga: {e}")
@@ -105,32 +125,43 @@ def yyyymmdd(fecha_str: str) -> str:
     return datetime.strptime(fecha_str, "%Y-%m-%d").strftime("%Y%m%d")
 
 def load_geo_ids(geojson_path: str, id_col: str) -> Set[str]:
-    gdf = gpd.read_file(geojson_path)
-    gdf[id_col] = gdf[id_col].astype(str).str.zfill(5)
-    return set(gdf[id_col].astype(str))
+    # Solo atributos, desde la caché de la zonificación (geometrias.py)
+    return ids_zonas(geojson_path, id_col=id_col)
 
 
 # =========================
-# Lectura MITMA en chunks -> agregado Wanda (destino,hora)
+# Lectura MITMA en chunks -> agregado de varios orígenes/destinos en una pasada
 # =========================
-def read_mitma_wanda_agg(
+def _formas_crudas(zonas: Iterable[str]) -> Set[str]:
+    """Formas en que puede venir una zona en el fichero (p. ej. '0100101' o '100101' si perdió el cero)."""
+    formas = set()
+    for z in zonas:
+        formas.add(z)
+        formas.update(z[k:] for k in range(1, len(z)) if z[:k] == "0" * k)
+    return formas
+
+
+def read_mitma_zonas_agg(
     gz_path: Path,
-    distrito_wanda: str,
+    origenes: Optional[Iterable[str]] = None,
+    destinos: Optional[Iterable[str]] = None,
     valid_ids: Optional[Set[str]] = None,
     chunksize: int = 500_000,
 ) -> pd.DataFrame:
     """
-    Lee el MITMA csv.gz por chunks, filtra origen=Wanda, excluye intradistrito,
-    y (opcional) filtra destinos a los IDs del geojson.
-    Devuelve DF: destino(str), periodo(int), viajes(float)
+    Lee el MITMA csv.gz UNA vez por chunks y agrega a la vez todos los viajes que
+    salen de alguno de `origenes` o llegan a alguno de `destinos`.
+    Excluye intradistrito y (opcional) filtra el otro extremo a los IDs del geojson.
+    Devuelve DF: origen(str), destino(str), periodo(int), viajes(float)
+    (un estudio por sede = filtrar por origen o destino).
     """
+    origenes = list(normalizar_ids(list(origenes or [])))
+    destinos = list(normalizar_ids(list(destinos or [])))
+    if not origenes and not destinos:
+        raise ValueError("Indica al menos un origen o un destino")
 
-    # MITMA puede venir como origin/destination/period/trips o como origen/destino/periodo/viajes.
-    # Leemos header primero para decidir.
-    head = pd.read_csv(gz_path, compression="gzip", sep="|", nrows=5, dtype="string")
-    cols = [c.strip() for c in head.columns]
-
-    # Detectar nombres
+    # Separador y cabecera detectados (origin/destination/period/trips u origen/destino/periodo/viajes)
+    sep, cols = detectar_dialecto(gz_path, "Viajes_distritos")
     if set(["origin","destination","period","trips"]).issubset(cols):
         usecols = ["origin","destination","period","trips"]
         ren = {"origin":"origen","destination":"destino","period":"periodo","trips":"viajes"}
@@ -140,78 +171,127 @@ def read_mitma_wanda_agg(
     else:
         raise ValueError(f"Columnas inesperadas en {gz_path.name}: {cols[:20]}")
 
-    chunks = pd.read_csv(
-        gz_path,
-        compression="gzip",
-        sep="|",
-        usecols=usecols,
-        dtype="string",
-        chunksize=chunksize,
-        low_memory=True,
-        engine="c",
-        on_bad_lines="skip",
-    )
-
-    out = []
-    wanda = str(distrito_wanda)
-
-    for ch in chunks:
-        if ren:
-            ch = ch.rename(columns=ren)
-
-        # Formato como tu ejemplo
-        ch["origen"]  = to_zone_str(ch["origen"])
-        ch["destino"] = to_zone_str(ch["destino"])
-        ch["periodo"] = pd.to_numeric(ch["periodo"], errors="coerce").fillna(0).astype(int)
-        ch["viajes"]  = parse_miles_float(ch["viajes"])
+    # Zonas como códigos enteros (zonas.py): sedes + IDs válidos; las demás se añaden
+    # al diccionario según aparecen (append-only, los códigos no cambian entre chunks)
+    dic = construir_diccionario(origenes + destinos + sorted(valid_ids or []))
+    cod_o = codificar_ids(origenes, dic)
+    cod_d = codificar_ids(destinos, dic)
+    cod_validos = codificar_ids(sorted(valid_ids), dic) if valid_ids is not None else None
 
-        # Filtrar origen wanda
-        ch = ch[ch["origen"] == wanda]
-        if ch.empty:
-            continue
-
-        # Excluir intradistrito (muy importante)
-        ch = ch[ch["destino"] != ch["origen"]]
-        if ch.empty:
-            continue
+    # isin contra las formas crudas: sin convertir cada fila del chunk
+    crudos_o = _formas_crudas(origenes)
+    crudos_d = _formas_crudas(destinos)
 
-        # Filtrar a IDs válidos del geojson (si quieres mapa de distritos Madrid)
-        if valid_ids is not None:
-            ch = ch[ch["destino"].isin(valid_ids)]
+    out = []
+    gz_path = Path(gz_path)
+    with etapa("agregacion_zonas", dia=dia_de(gz_path), bytes_in=gz_path.stat().st_size, filas=0) as m, abrir_gz(gz_path) as f:
+        chunks = pd.read_csv(
+            f,
+            sep=sep,
+            usecols=usecols,
+            dtype=str,
+            chunksize=chunksize,
+            low_memory=True,
+            engine="c",
+            on_bad_lines="skip",
+        )
+        for ch in chunks:
+            m["filas"] += len(ch)
+            if ren:
+                ch = ch.rename(columns=ren)
+
+            ch = ch[ch["origen"].isin(crudos_o) | ch["destino"].isin(crudos_d)]
             if ch.empty:
                 continue
 
-        agg = ch.groupby(["destino","periodo"], as_index=False)["viajes"].sum()
-        out.append(agg)
+            # Solo las filas que quedan se codifican y parsean
+            if cod_validos is None:
+                dic = construir_diccionario(pd.concat([ch["origen"], ch["destino"]]).unique(), previo=dic)
+            origen = codificar(ch["origen"], dic)
+            destino = codificar(ch["destino"], dic)
+            m_o = np.isin(origen, cod_o)
+            m_d = np.isin(destino, cod_d)
+            # Filtrar a IDs válidos del geojson en el extremo que no es la sede
+            if cod_validos is not None:
+                m_o &= np.isin(destino, cod_validos)
+                m_d &= np.isin(origen, cod_validos)
+            # Excluir intradistrito (muy importante)
+            keep = (m_o | m_d) & (origen != destino)
+            if not keep.any():
+                continue
+
+            sub = pd.DataFrame({
+                "origen": origen[keep],
+                "destino": destino[keep],
+                "periodo": pd.to_numeric(ch["periodo"][keep], errors="coerce").fillna(0).astype(int).to_numpy(),
+                "viajes": parse_miles_float(ch["viajes"][keep]).to_numpy(),
+            })
+            out.append(sub.groupby(["origen","destino","periodo"], as_index=False)["viajes"].sum())
 
     if not out:
-        return pd.DataFrame(columns=["destino","periodo","viajes"])
+        return pd.DataFrame(columns=["origen","destino","periodo","viajes"])
 
     res = pd.concat(out, ignore_index=True)
-    res = res.groupby(["destino","periodo"], as_index=False)["viajes"].sum()
+    res = res.groupby(["origen","destino","periodo"], as_index=False)["viajes"].sum()
+    # De vuelta a IDs (str) para el geojson/parquets de salida
+    res["origen"] = decodificar(res["origen"].to_numpy(), dic)
+    res["destino"] = decodificar(res["destino"].to_numpy(), dic)
     return res
 
 
-def descargar_y_agregar(fecha_str: str, valid_ids: Set[str]) -> Path:
-    """Descarga el gz (si no existe) y guarda parquet agregado Wanda."""
+def read_mitma_wanda_agg(
+    gz_path: Path,
+    distrito_wanda: str,
+    valid_ids: Optional[Set[str]] = None,
+    chunksize: int = 500_000,
+) -> pd.DataFrame:
+    """
+    Caso de un solo origen de read_mitma_zonas_agg.
+    Devuelve DF: destino(str), periodo(int), viajes(float)
+    """
+    res = read_mitma_zonas_agg(gz_path, origenes=[distrito_wanda], valid_ids=valid_ids, chunksize=chunksize)
+    return res[["destino","periodo","viajes"]]
+
+
+def descargar_y_agregar(fecha_str: str, valid_ids: Set[str], origenes: Optional[List[str]] = None) -> Path:
+    """
+    Descarga el gz (si no existe) y guarda parquet agregado de los orígenes
+    (por defecto solo Wanda) leyendo el fichero una sola vez.
+    """
+    origenes = [str(o) for o in (origenes or [DISTRITO_WANDA])]
     fnum = yyyymmdd(fecha_str)
     gz_path = DATA_DIR / f"{fnum}_Viajes_distritos.csv.gz"
-    pq_path = DATA_DIR / f"{fnum}_wanda_agg.parquet"
+    if origenes == [DISTRITO_WANDA]:
+        pq_path = DATA_DIR / f"{fnum}_wanda_agg.parquet"
+    else:
+        pq_path = DATA_DIR / f"{fnum}_origenes_{'_'.join(sorted(origenes))}_agg.parquet"
 
     if pq_path.exists():
         print(f"✓ Ya existe: {pq_path.name}")
         return pq_path
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+    if OD_DIR is not None and existe_matriz(OD_DIR, "viajes", fnum):
+        print("  Agregando desde la matriz OD del día...")
+        agg = agregado_zonas(OD_DIR, fnum, origenes=origenes, valid_ids=valid_ids)
+        if origenes == [DISTRITO_WANDA]:
+            agg = agg[["destino","periodo","viajes"]]
+        agg["fecha"] = fnum
+        agg.to_parquet(pq_path, index=False)
+        print(f"  ✓ Guardado: {pq_path.name} ({len(agg):,} filas)")
+        return pq_path
 
-    if not gz_path.exists():
-        url = build_url(fecha_str)
-        ok = download_file(url, gz_path)
-        if not ok:
-            return None
+    if not download_file(build_url(fecha_str), gz_path):
+        return None
 
-    print("  Procesando (chunks) -> agregado Wanda...")
-    agg = read_mitma_wanda_agg(gz_path, DISTRITO_WANDA, valid_ids=valid_ids)
+    print(f"  Procesando (chunks) -> agregado de {len(origenes)} origen(es)...")
+    agg = read_mitma_zonas_agg(gz_path, origenes=origenes, valid_ids=valid_ids)
+    if origenes == [DISTRITO_WANDA]:
+        agg = agg[["destino","periodo","viajes"]]
     agg["fecha"] = fnum
-    agg.to_parquet(pq_path, index=False)
+    with etapa("parquet", dia=fnum, filas=len(agg)) as m:
+        agg.to_parquet(pq_path, index=False)
+        m["bytes_out"] = pq_path.stat().st_size
 
     # opcional: borrar gz
     gz_path.unlink(missing_ok=True)
@@ -223,13 +303,13 @@ def descargar_y_agregar(fecha_str: str, valid_ids: Set[str]) -> Path:
 # =========================
 # Estadística esperado + impacto
 # =========================
-def expected_stats(df_control: pd.DataFrame) -> pd.DataFrame:
+def expected_stats(linea_base: pd.DataFrame) -> pd.DataFrame:
     """
-    Calcula media y IC95 por (destino,periodo). Devuelve DF:
-    destino,periodo,n,media,std,ic_low,ic_high
+    Calcula IC95 por clave a partir de la línea base (n, media, std ya acumulados,
+    ver linea_base.py). Devuelve DF: claves..., n, media, std, ic_low, ic_high
     """
-    g = df_control.groupby(["destino","periodo"])["viajes"]
-    stats = g.agg(n="count", media="mean", std="std").reset_index()
+    claves = [c for c in ["origen", "destino", "periodo", "dia_semana"] if c in linea_base.columns]
+    stats = linea_base[claves + ["n", "media", "std"]].copy()
 
     # std puede salir NaN si n=1
     stats["std"] = stats["std"].fillna(0.0)
@@ -251,7 +331,9 @@ def impacto_derbi(df_derbi: pd.DataFrame, stats: pd.DataFrame) -> pd.DataFrame:
     Join derbi con stats y calcula:
     diff_abs, diff_pct, z, significativo (derbi > ic_high)
     """
-    m = df_derbi.merge(stats, on=["destino","periodo"], how="inner")
+    # Un solo join contra la línea base (por origen si ambos lo traen)
+    claves = [c for c in ["origen", "destino", "periodo"] if c in df_derbi.columns and c in stats.columns]
+    m = df_derbi.merge(stats, on=claves, how="inner")
     m["diff_abs"] = m["viajes"] - m["media"]
     m["diff_pct"] = np.where(m["media"] > 0, (m["diff_abs"] / m["media"]) * 100, 0.0)
 
@@ -262,10 +344,19 @@ def impacto_derbi(df_derbi: pd.DataFrame, stats: pd.DataFrame) -> pd.DataFrame:
     return m
 
 
+def leer_dia_evento(pq_path: Path) -> pd.DataFrame:
+    """Agregado del día del evento (descargar_y_agregar) con tipos normalizados."""
+    df = pd.read_parquet(pq_path)[["fecha","destino","periodo","viajes"]]
+    df["destino"]   = normalizar_ids(df["destino"])
+    df["periodo"]   = pd.to_numeric(df["periodo"], errors="coerce").fillna(0).astype(int)
+    df["viajes"]    = pd.to_numeric(df["viajes"], errors="coerce").fillna(0.0).astype(float)
+    return df
+
+
 # =========================
 # GeoJSON + HTML (como tu visor)
 # =========================
-def build_geojson_with_hour_dict(
+def build_geojson_with_hour_values(
     base_geojson: str,
     df: pd.DataFrame,
     id_col: str,
@@ -273,67 +364,125 @@ def build_geojson_with_hour_dict(
     value_col: str,
     hour_col: str,
     out_geojson: str,
-):
+    out_valores: str,
+    solo_con_valores: bool = False,
+    bbox: Optional[List[float]] = None,
+    tolerancia_m: float = 0.0,
+    decimales: Optional[int] = None,
+    formato: str = "geojson",
+    comprimir: bool = False,
+) -> Dict:
     """
-    df: columnas [zone_col, hour_col, value_col] con una fila por (zona,hora)
-    crea propiedades: impacto_por_hora { "0":..., "1":..., ...}
+    df: columnas [zone_col, hour_col, value_col] (se suman las filas repetidas).
+    Escribe los valores aparte (out_valores: índice .json + matriz Float32 .f32,
+    exportar_geo.escribir_valores) y un geojson solo con geometrías e ID, que
+    apunta a ese índice en properties.valores.
+    Opciones de tamaño (exportar_geo.py): solo_con_valores, bbox (lon/lat),
+    tolerancia_m, decimales, formato ("geojson" | "topojson"), comprimir (.gz).
+    Devuelve el informe con el tamaño del fichero.
     """
-    # 1) Agregar por zona y hora (por si acaso)
-    agg = df.groupby([zone_col, hour_col], dropna=False)[value_col].sum().reset_index()
-
-    # 2) dict por zona
-    by_zone = {}
-    for zid, sub in agg.groupby(zone_col):
-        d = {str(int(h)): float(v) for h, v in zip(sub[hour_col], sub[value_col])}
-        for h in range(24):
-            d.setdefault(str(h), 0.0)
-        by_zone[str(zid)] = d
-
-    # 3) leer base geojson
-    gdf = gpd.read_file(base_geojson)
-    if gdf.crs is None:
-        # ajusta si tu fichero lo necesita
-        gdf = gdf.set_crs(epsg=3042)
-
-    gdf[id_col] = gdf[id_col].astype(str).str.zfill(5)
-    gdf = gdf.to_crs(epsg=4326)
-
-    geo = json.loads(gdf.to_json())
-
-    max_v = 0.0
-    for feat in geo["features"]:
-        zid = str(feat["properties"].get(id_col, "")).zfill(5)
-        horas = by_zone.get(zid, {str(h): 0.0 for h in range(24)})
-        feat["properties"]["impacto_por_hora"] = horas
-        max_v = max(max_v, max(horas.values()))
+    # 1) pivot zona x hora (vectorizado) -> sidecar binario
+    ids, matriz = matriz_zona_hora(df, zone_col, hour_col, value_col, solo_con_valores=True)
+    valores = escribir_valores(
+        ids, matriz, out_valores,
+        propiedades={"value_col": value_col, "zona_col": zone_col, "hour_col": hour_col},
+    )
 
-    geo["properties"] = geo.get("properties", {})
-    geo["properties"]["max_value"] = float(max_v)
-    geo["properties"]["value_col"] = value_col
-    geo["properties"]["zona_col"] = zone_col
-    geo["properties"]["hour_col"] = hour_col
+    # 2) leer base geojson
+    # (cacheado en GeoParquet ya validado y en EPSG:4326, ver geometrias.py)
+    # crs_origen: ajusta si tu fichero no declara CRS y no es este
+    gdf = cargar_zonas(base_geojson, crs="EPSG:4326", crs_origen="EPSG:3042", id_col=id_col)
+    gdf = gdf[[id_col, "geometry"]]
+    if solo_con_valores:
+        gdf = gdf[gdf[id_col].astype(str).isin(set(ids))]
+
+    # 3) recorte + simplificación + cuantización + escritura (exportar_geo.py)
+    informe = exportar_geo(
+        gdf,
+        out_geojson,
+        bbox=bbox,
+        tolerancia_m=tolerancia_m,
+        decimales=decimales,
+        formato=formato,
+        comprimir=comprimir,
+        propiedades={"valores": Path(out_valores).name, "max_value": valores["max_value"]},
+    )
+    informe["valores"] = valores
 
-    Path(out_geojson).parent.mkdir(parents=True, exist_ok=True)
-    with open(out_geojson, "w", encoding="utf-8") as f:
-        json.dump(geo, f, ensure_ascii=False)
+    print(
+        "✅ GeoJSON impacto creado:", out_geojson,
+        f"(valores: {valores['zonas']:,} zonas, {valores['bytes'] / 1e6:.2f} MB)",
+        "max_value=", valores["max_value"],
+    )
+    return informe
 
-    print("✅ GeoJSON impacto creado:", out_geojson, "max_value=", max_v)
 
+# Piezas comunes de los visores (write_leaflet_html / write_leaflet_pmtiles_html)
+_CSS_VISOR = """<style>
+html,body,#map{height:100%;margin:0}
+.control{position:absolute;top:10px;left:10px;z-index:1000;background:#fff;padding:10px 12px;border-radius:8px;box-shadow:0 2px 10px rgba(0,0,0,.15);font-family:system-ui;min-width:260px}
+.legend{position:absolute;bottom:20px;left:10px;z-index:1000;background:#fff;padding:10px 12px;border-radius:8px;box-shadow:0 2px 10px rgba(0,0,0,.15);font-family:system-ui;font-size:12px}
+.swatch{width:14px;height:14px;display:inline-block;margin-right:6px;vertical-align:middle;border:1px solid rgba(0,0,0,.15)}
+</style>"""
 
-def write_leaflet_html(out_html: str, out_geojson: str, value_label: str = "impacto"):
+_JS_RAMPA = """function colorRamp(t){
+  const stops=[[255,255,204],[255,237,160],[254,217,118],[254,178,76],[253,141,60],[252,78,42],[227,26,28],[177,0,38],[128,0,38]];
+  t=Math.max(0,Math.min(1,t));
+  const idx=t*(stops.length-1), i0=Math.floor(idx), i1=Math.min(stops.length-1,i0+1), a=idx-i0;
+  const c0=stops[i0], c1=stops[i1];
+  const r=Math.round(c0[0]+a*(c1[0]-c0[0]));
+  const g=Math.round(c0[1]+a*(c1[1]-c0[1]));
+  const b=Math.round(c0[2]+a*(c1[2]-c0[2]));
+  return `rgb(${r},${g},${b})`;
+}
+function leyenda(maxValue, etiqueta){
+  const steps=5;
+  let h=`<div><strong>Leyenda (${etiqueta})</strong></div>`;
+  for(let i=0;i<steps;i++){
+    const v0=maxValue*i/steps, v1=maxValue*(i+1)/steps, col=colorRamp((i+1)/steps);
+    h += `<div><span class="swatch" style="background:${col}"></span>${Math.round(v0)} – ${Math.round(v1)}</div>`;
+  }
+  h += `<div style="color:#666">0 = transparente</div>`;
+  return h;
+}
+// valores zona x hora (exportar_geo.escribir_valores): índice JSON + matriz Float32
+async function cargarValores(url){
+  const indice=await (await fetch(url)).json();
+  const base=url.slice(0, url.lastIndexOf("/")+1);
+  const buf=await (await fetch(base+indice.valores)).arrayBuffer();
+  const fila=new Map();
+  indice.ids.forEach((id,i)=>fila.set(String(id),i));
+  return {fila, valores:new Float32Array(buf), horas:indice.horas, maxValue:(indice.max_value>0 ? indice.max_value : 1)};
+}"""
+
+
+def _copiar_junto(src: str, out_dir: Path) -> Path:
+    """Copia src al directorio del HTML (para fetch relativo) y devuelve la ruta destino."""
+    target = out_dir / Path(src).name
+    if str(target).lower() != str(Path(src)).lower():
+        shutil.copyfile(src, target)
+    return target
+
+
+def _copiar_valores(valores_path: str, out_dir: Path) -> None:
+    """Índice de valores + su matriz .f32 junto al HTML."""
+    _copiar_junto(valores_path, out_dir)
+    _copiar_junto(str(Path(valores_path).with_suffix(".f32")), out_dir)
+
+
+def write_leaflet_html(out_html: str, out_geojson: str, valores_path: str, value_label: str = "impacto"):
     """
-    HTML simple con slider (0-23). Carga el geojson local (mismo directorio).
+    HTML simple con slider (0-23). Carga el geojson local (mismo directorio) y los
+    valores por zona y hora en un Float32Array (índice + .f32 de escribir_valores).
+    Acepta también .topojson y ficheros precomprimidos .gz (exportar_geo.py).
+    Al mover el slider solo se re-estilan los distritos cuyo valor cambia.
     """
     out_dir = Path(out_html).parent
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    geojson_name = Path(out_geojson).name
-    geojson_target = out_dir / geojson_name
-
-    # copiar geojson al mismo dir del html para fetch
-    if str(geojson_target).lower() != str(Path(out_geojson)).lower():
-        with open(out_geojson, "r", encoding="utf-8") as fi, open(geojson_target, "w", encoding="utf-8") as fo:
-            fo.write(fi.read())
+    # copiar geojson y valores al mismo dir del html para fetch
+    geojson_name = _copiar_junto(out_geojson, out_dir).name
+    _copiar_valores(valores_path, out_dir)
 
     html = f"""<!doctype html>
 <html lang="es"><head>
@@ -341,12 +490,7 @@ def write_leaflet_html(out_html: str, out_geojson: str, value_label: str = "impa
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
 <title>Visor impacto por hora</title>
 <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
-<style>
-html,body,#map{{height:100%;margin:0}}
-.control{{position:absolute;top:10px;left:10px;z-index:1000;background:#fff;padding:10px 12px;border-radius:8px;box-shadow:0 2px 10px rgba(0,0,0,.15);font-family:system-ui;min-width:260px}}
-.legend{{position:absolute;bottom:20px;left:10px;z-index:1000;background:#fff;padding:10px 12px;border-radius:8px;box-shadow:0 2px 10px rgba(0,0,0,.15);font-family:system-ui;font-size:12px}}
-.swatch{{width:14px;height:14px;display:inline-block;margin-right:6px;vertical-align:middle;border:1px solid rgba(0,0,0,.15)}}
-</style></head><body>
+{_CSS_VISOR}</head><body>
 <div id="map"></div>
 <div class="control">
   <div><strong>Hora:</strong> <span id="hourLabel">0</span></div>
@@ -356,66 +500,71 @@ html,body,#map{{height:100%;margin:0}}
 <div class="legend" id="legend"></div>
 
 <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://unpkg.com/topojson-client@3"></script>
 <script>
 const GEOJSON_URL = "{geojson_name}";
+const VALORES_URL = "{Path(valores_path).name}";
 const hourInput = document.getElementById("hour");
 const hourLabel = document.getElementById("hourLabel");
-const legendDiv = document.getElementById("legend");
 
-function colorRamp(t){{
-  const stops=[[255,255,204],[255,237,160],[254,217,118],[254,178,76],[253,141,60],[252,78,42],[227,26,28],[177,0,38],[128,0,38]];
-  t=Math.max(0,Math.min(1,t));
-  const idx=t*(stops.length-1), i0=Math.floor(idx), i1=Math.min(stops.length-1,i0+1), a=idx-i0;
-  const c0=stops[i0], c1=stops[i1];
-  const r=Math.round(c0[0]+a*(c1[0]-c0[0]));
-  const g=Math.round(c0[1]+a*(c1[1]-c0[1]));
-  const b=Math.round(c0[2]+a*(c1[2]-c0[2]));
-  return `rgb(${{r}},${{g}},${{b}})`;
-}}
-function styleFeature(feature, hour, maxValue){{
-  const d = feature.properties.impacto_por_hora || {{}};
-  const v = (d[String(hour)] ?? 0);
-  const t = maxValue>0 ? (v/maxValue) : 0;
-  return {{color:"#666",weight:0.6,fillColor:(v>0?colorRamp(t):"transparent"),fillOpacity:(v>0?0.85:0)}};
-}}
-function makeLegend(maxValue){{
-  const steps=5;
-  let h=`<div><strong>Leyenda ({value_label})</strong></div>`;
-  for(let i=0;i<steps;i++){{ 
-    const v0=maxValue*i/steps, v1=maxValue*(i+1)/steps, col=colorRamp((i+1)/steps);
-    h += `<div><span class="swatch" style="background:${{col}}"></span>${{Math.round(v0)}} – ${{Math.round(v1)}}</div>`;
-  }}
-  h += `<div style="color:#666">0 = transparente</div>`;
-  legendDiv.innerHTML=h;
+{_JS_RAMPA}
+
+function estilo(v, maxValue){{
+  return {{color:"#666",weight:0.6,fillColor:(v>0?colorRamp(v/maxValue):"transparent"),fillOpacity:(v>0?0.85:0)}};
 }}
 
 const map=L.map("map");
 L.tileLayer("https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}{{r}}.png",{{attribution:"&copy; OSM &copy; CARTO"}}).addTo(map);
 
-let layer=null, geo=null, maxValue=1;
+// .gz: se descomprime en el navegador (salvo que el servidor ya mande Content-Encoding)
+// TopoJSON: se convierte a FeatureCollection conservando las propiedades raíz
+async function cargarGeo(url){{
+  const r=await fetch(url);
+  let data;
+  if(url.endsWith(".gz") && r.headers.get("Content-Encoding")!=="gzip"){{
+    data=await new Response(r.body.pipeThrough(new DecompressionStream("gzip"))).json();
+  }} else {{
+    data=await r.json();
+  }}
+  if(data.type==="Topology"){{
+    const nombre=Object.keys(data.objects)[0];
+    const fc=topojson.feature(data, data.objects[nombre]);
+    fc.properties=data.properties||{{}};
+    return fc;
+  }}
+  return data;
+}}
+
+// conValor: capas de distritos con fila en la matriz (el resto es siempre 0 y no se toca)
+let vals=null, conValor=[], hora=0;
+const valor=(fila,h)=>fila<0 ? 0 : vals.valores[fila*vals.horas+h];
 
-fetch(GEOJSON_URL).then(r=>r.json()).then(data=>{{
-  geo=data;
-  maxValue=(data.properties && data.properties.max_value) ? data.properties.max_value : 1;
-  layer=L.geoJSON(geo,{{
-    style:(f)=>styleFeature(f, Number(hourInput.value), maxValue),
+Promise.all([cargarGeo(GEOJSON_URL), cargarValores(VALORES_URL)]).then(([geo, v])=>{{
+  vals=v;
+  const layer=L.geoJSON(geo,{{
+    style:(f)=>estilo(valor(vals.fila.get(String(f.properties.ID)) ?? -1, hora), vals.maxValue),
     onEachFeature:(f, lyr)=>{{
-      const id=f.properties.ID || "";
+      const id=String(f.properties.ID || "");
+      lyr._fila=vals.fila.get(id) ?? -1;
+      if(lyr._fila>=0) conValor.push(lyr);
       lyr.on("mouseover", ()=>{{
-        const v=(f.properties.impacto_por_hora||{{}})[String(hourInput.value)] ?? 0;
-        lyr.bindTooltip(`ID: ${{id}}<br>{value_label}: ${{v}}`,{{sticky:true}}).openTooltip();
+        lyr.bindTooltip(`ID: ${{id}}<br>{value_label}: ${{valor(lyr._fila, hora)}}`,{{sticky:true}}).openTooltip();
       }});
     }}
   }}).addTo(map);
   map.fitBounds(layer.getBounds());
-  makeLegend(maxValue);
+  document.getElementById("legend").innerHTML=leyenda(vals.maxValue, "{value_label}");
 }});
 
 function update(){{
   const h=Number(hourInput.value);
   hourLabel.textContent=h;
-  if(!layer) return;
-  layer.setStyle((f)=>styleFeature(f,h,maxValue));
+  if(!vals || h===hora) return;
+  for(const lyr of conValor){{
+    const v=valor(lyr._fila, h);
+    if(v!==valor(lyr._fila, hora)) lyr.setStyle(estilo(v, vals.maxValue));
+  }}
+  hora=h;
 }}
 hourInput.addEventListener("input", update);
 </script>
@@ -427,105 +576,256 @@ hourInput.addEventListener("input", update);
     print("ℹ️ Ábrelo con servidor local: python -m http.server 8000 (en la carpeta del HTML)")
 
 
+def write_leaflet_pmtiles_html(
+    out_html: str,
+    pmtiles_path: str,
+    valores_path: str,
+    value_label: str = "impacto",
+):
+    """
+    Visor para mapas grandes (toda España): las geometrías salen de un .pmtiles
+    (teselas.py) y solo se piden las teselas a la vista; los valores por zona y
+    hora (índice + .f32 de escribir_valores) se cargan en un Float32Array y se
+    unen en el navegador por ID. Al mover el slider solo se repintan las
+    teselas, sin volver a descargar nada.
+    Necesita un servidor con peticiones Range: python teselas.py servir <carpeta>
+    """
+    out_dir = Path(out_html).parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    _copiar_junto(pmtiles_path, out_dir)
+    _copiar_valores(valores_path, out_dir)
+
+    _, zmax, (lon0, lat0, lon1, lat1) = cabecera_pmtiles(pmtiles_path)
+
+    html = f"""<!doctype html>
+<html lang="es"><head>
+<meta charset="utf-8"/>
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Visor impacto por hora</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+{_CSS_VISOR}</head><body>
+<div id="map"></div>
+<div class="control">
+  <div><strong>Hora:</strong> <span id="hourLabel">0</span></div>
+  <input id="hour" type="range" min="0" max="23" step="1" value="0" style="width:100%"/>
+  <div style="color:#666;font-size:12px">Colorea por <strong>{value_label}</strong> (0 = transparente)</div>
+</div>
+<div class="legend" id="legend"></div>
+
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<script src="https://unpkg.com/protomaps-leaflet@5/dist/protomaps-leaflet.js"></script>
+<script>
+const PMTILES_URL = "{Path(pmtiles_path).name}";
+const VALORES_URL = "{Path(valores_path).name}";
+const hourInput = document.getElementById("hour");
+const hourLabel = document.getElementById("hourLabel");
+
+{_JS_RAMPA}
+
+const map=L.map("map");
+L.tileLayer("https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}{{r}}.png",{{attribution:"&copy; OSM &copy; CARTO"}}).addTo(map);
+map.fitBounds([[{lat0},{lon0}],[{lat1},{lon1}]]);
+
+let vals=null, hora=0;
+function valor(id){{
+  if(!vals) return 0;
+  const i=vals.fila.get(String(id));
+  return i===undefined ? 0 : vals.valores[i*vals.horas+hora];
+}}
+
+const capa=protomapsL.leafletLayer({{
+  url: PMTILES_URL,
+  maxDataZoom: {zmax},
+  paintRules: [{{
+    dataLayer: "{CAPA}",
+    symbolizer: new protomapsL.PolygonSymbolizer({{
+      fill: (z,f)=>{{ const v=valor(f.props.ID); return v>0 ? colorRamp(v/vals.maxValue) : "transparent"; }},
+      opacity: (z,f)=>valor(f.props.ID)>0 ? 0.85 : 0,
+      stroke: "#666",
+      width: 0.6,
+    }}),
+  }}],
+  labelRules: [],
+}});
+capa.addTo(map);
+
+cargarValores(VALORES_URL).then(v=>{{
+  vals=v;
+  document.getElementById("legend").innerHTML=leyenda(vals.maxValue, "{value_label}");
+  capa.rerenderTiles();
+}});
+
+map.on("click", (e)=>{{
+  const picks=capa.queryTileFeaturesDebug(e.latlng.lng, e.latlng.lat);
+  for(const lista of picks.values()){{
+    for(const p of lista){{
+      if(p.layerName!=="{CAPA}") continue;
+      const id=p.feature.props.ID;
+      L.popup().setLatLng(e.latlng).setContent(`ID: ${{id}}<br>{value_label}: ${{valor(id)}}`).openOn(map);
+      return;
+    }}
+  }}
+}});
+
+hourInput.addEventListener("input", ()=>{{
+  hora=Number(hourInput.value);
+  hourLabel.textContent=hora;
+  capa.rerenderTiles();
+}});
+</script>
+</body></html>
+"""
+    with open(out_html, "w", encoding="utf-8") as f:
+        f.write(html)
+    print("✅ HTML (PMTiles) creado:", out_html)
+    print(f"ℹ️ Ábrelo con servidor con Range: python teselas.py servir {out_dir}")
+
+
+def exportar_mapa_impacto(
+    imp: pd.DataFrame,
+    out_geojson: str = OUT_GEOJSON,
+    out_valores: str = OUT_VALORES,
+    out_html: str = OUT_HTML,
+    out_html_teselas: str = OUT_HTML_TESELAS,
+    teselas: bool = MAPA_TESELAS,
+    value_label: str = "impacto (viajes extra)",
+) -> str:
+    """
+    Mapa por hora del impacto positivo (diff_abs >= 0) por distrito destino:
+    PMTiles compartido + valores (teselas=True) o geojson recortado + valores.
+    Devuelve la ruta del HTML.
+    """
+    # (valores aparte de las geometrías: índice out_valores + matriz Float32 .f32)
+    impact_map = imp.copy()
+    impact_map["impacto"] = impact_map["diff_abs"].clip(lower=0)
+    impact_map = impact_map[["destino","periodo","impacto"]].copy()
+
+    if teselas:
+        pmtiles_path = pmtiles_zonificacion(
+            BASE_GEOJSON, id_col=GEO_ID_COL, crs_origen="EPSG:3042",
+            zoom_min=TESELAS_ZOOM[0], zoom_max=TESELAS_ZOOM[1],
+        )
+        ids, matriz = matriz_zona_hora(impact_map, "destino", "periodo", "impacto")
+        informe = escribir_valores(ids, matriz, out_valores)
+        print(f"  valores: {informe['zonas']:,} zonas, {informe['bytes'] / 1e6:.2f} MB -> {informe['ruta_valores']}")
+        write_leaflet_pmtiles_html(out_html_teselas, pmtiles_path, out_valores, value_label=value_label)
+        return out_html_teselas
+
+    build_geojson_with_hour_values(
+        base_geojson=BASE_GEOJSON,
+        df=impact_map,
+        id_col=GEO_ID_COL,
+        zone_col="destino",
+        value_col="impacto",
+        hour_col="periodo",
+        out_geojson=out_geojson,
+        out_valores=out_valores,
+        solo_con_valores=EXPORT_SOLO_CON_VALORES,
+        bbox=EXPORT_BBOX,
+        tolerancia_m=EXPORT_TOLERANCIA_M,
+        decimales=EXPORT_DECIMALES,
+        formato=EXPORT_FORMATO,
+        comprimir=EXPORT_GZIP,
+    )
+    write_leaflet_html(out_html, out_geojson + (".gz" if EXPORT_GZIP else ""), out_valores, value_label=value_label)
+    return out_html
+
+
 # =========================
 # RUN
 # =========================
-print("="*70)
-print("Cargando IDs válidos del GeoJSON (para filtrar destinos)")
-print("="*70)
-VALID_IDS = load_geo_ids(BASE_GEOJSON, GEO_ID_COL)
-print("IDs válidos:", len(VALID_IDS))
-
-print("="*70)
-print("PASO 1: DESCARGA + AGREGADO (WANDA)")
-print("="*70)
-
-print(f"\n📅 Derbi: {FECHA_DERBI}")
-derbi_pq = descargar_y_agregar(FECHA_DERBI, VALID_IDS)
-if derbi_pq is None:
-    raise RuntimeError("No se pudo descargar/procesar el derbi.")
-
-control_pqs = []
-print(f"\n📅 Controles: {len(FECHAS_CONTROL)}")
-for f in FECHAS_CONTROL:
-    print(f"\n  {f}")
-    p = descargar_y_agregar(f, VALID_IDS)
-    if p is not None:
-        control_pqs.append(p)
-
-if len(control_pqs) < MIN_N:
-    print(f"⚠️ Ojo: solo tienes {len(control_pqs)} controles. MIN_N={MIN_N} para estadística estable.")
-
-print("="*70)
-print("PASO 2: CARGA PARQUETS -> DF CONTROL/DERBI")
-print("="*70)
-
-dfs = []
-for p in control_pqs:
-    df = pd.read_parquet(p)
-    dfs.append(df[["fecha","destino","periodo","viajes"]])
-df_control = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame(columns=["fecha","destino","periodo","viajes"])
-
-df_derbi = pd.read_parquet(derbi_pq)[["fecha","destino","periodo","viajes"]]
-
-# Normaliza tipos
-df_control["destino"] = df_control["destino"].astype(str).str.zfill(5)
-df_derbi["destino"]   = df_derbi["destino"].astype(str).str.zfill(5)
-df_control["periodo"] = pd.to_numeric(df_control["periodo"], errors="coerce").fillna(0).astype(int)
-df_derbi["periodo"]   = pd.to_numeric(df_derbi["periodo"], errors="coerce").fillna(0).astype(int)
-df_control["viajes"]  = pd.to_numeric(df_control["viajes"], errors="coerce").fillna(0.0).astype(float)
-df_derbi["viajes"]    = pd.to_numeric(df_derbi["viajes"], errors="coerce").fillna(0.0).astype(float)
-
-print("Control filas:", len(df_control), "Derbi filas:", len(df_derbi))
-
-print("="*70)
-print("PASO 3: ESPERADO (MEDIA + IC95) y IMPACTO")
-print("="*70)
-
-stats = expected_stats(df_control)
-stats.to_parquet(ANALYSIS_DIR / "estadisticas_esperadas.parquet", index=False)
-
-imp = impacto_derbi(df_derbi, stats)
-imp.to_parquet(ANALYSIS_DIR / "impacto_derbi.parquet", index=False)
-
-# Impacto positivo y significativo
-imp_sig = imp[(imp["significativo"]) & (imp["diff_abs"] > 0)].copy()
-imp_sig.to_parquet(ANALYSIS_DIR / "impacto_significativo.parquet", index=False)
-
-print("\n📊 Resumen:")
-print("  total destino-hora analizados:", len(imp))
-print("  impactos positivos significativos:", len(imp_sig))
-print("  destinos afectados:", imp_sig["destino"].nunique())
-
-print("\n🔥 Top 10 por impacto absoluto:")
-top_abs = imp_sig.nlargest(10, "diff_abs")[["destino","periodo","viajes","media","diff_abs","diff_pct","z"]]
-print(top_abs.to_string(index=False))
-
-print("\n📈 Top 10 por impacto porcentual:")
-top_pct = imp_sig.nlargest(10, "diff_pct")[["destino","periodo","viajes","media","diff_abs","diff_pct","z"]]
-print(top_pct.to_string(index=False))
+def main():
+    # las carpetas se crean al ejecutar, no al importar (eventos.py y benchmarks/ importan pie)
+    for d in [DATA_DIR, ANALYSIS_DIR, MAP_DIR]:
+        d.mkdir(parents=True, exist_ok=True)
+    configurar(log_por_defecto(ANALYSIS_DIR, "pie"))
+    print("="*70)
+    print("Cargando IDs válidos del GeoJSON (para filtrar destinos)")
+    print("="*70)
+    VALID_IDS = load_geo_ids(BASE_GEOJSON, GEO_ID_COL)
+    print("IDs válidos:", len(VALID_IDS))
+
+    print("="*70)
+    print("PASO 1: DESCARGA + AGREGADO (WANDA)")
+    print("="*70)
+
+    fecha_derbi = datetime.strptime(FECHA_DERBI, "%Y-%m-%d").date()
+    controles = {datetime.strptime(f, "%Y-%m-%d").date() for f in FECHAS_CONTROL}
+    if fecha_derbi in controles:
+        raise ValueError(f"FECHA_DERBI ({FECHA_DERBI}) está en FECHAS_CONTROL: el derbi no puede ser su propio control")
+
+    print(f"\n📅 Derbi: {FECHA_DERBI}")
+    derbi_pq = descargar_y_agregar(FECHA_DERBI, VALID_IDS)
+    if derbi_pq is None:
+        raise RuntimeError("No se pudo descargar/procesar el derbi.")
+
+    # Controles: solo se descargan/agregan los que aún no están en la línea base
+    print(f"\n📅 Controles: {len(FECHAS_CONTROL)}")
+    ya_en_base = fechas_linea_base(LINEA_BASE, origen=DISTRITO_WANDA)
+    for f in FECHAS_CONTROL:
+        print(f"\n  {f}")
+        if datetime.strptime(f, "%Y-%m-%d").date() in ya_en_base:
+            print("  ✓ Ya en la línea base")
+            continue
+        p = descargar_y_agregar(f, VALID_IDS)
+        if p is not None:
+            actualizar_linea_base(LINEA_BASE, pd.read_parquet(p), f, origen=DISTRITO_WANDA)
+
+    # Solo los controles de FECHAS_CONTROL (nunca el derbi: comprobado arriba), aunque la
+    # línea base guarde más días de otras ejecuciones o de eventos.py
+    linea_base = leer_linea_base(LINEA_BASE, dia_semana=fecha_derbi.weekday(), origen=DISTRITO_WANDA, fechas=controles)
+    n_controles = int(linea_base["n"].max()) if len(linea_base) else 0
+    if n_controles < MIN_N:
+        print(f"⚠️ Ojo: solo tienes {n_controles} controles. MIN_N={MIN_N} para estadística estable.")
+
+    print("="*70)
+    print("PASO 2: CARGA PARQUET DERBI")
+    print("="*70)
+
+    df_derbi = leer_dia_evento(derbi_pq)
+
+    print("Línea base filas:", len(linea_base), "Derbi filas:", len(df_derbi))
+
+    print("="*70)
+    print("PASO 3: ESPERADO (MEDIA + IC95) y IMPACTO")
+    print("="*70)
+
+    stats = expected_stats(linea_base)
+    stats.to_parquet(ANALYSIS_DIR / "estadisticas_esperadas.parquet", index=False)
+
+    imp = impacto_derbi(df_derbi, stats)
+    imp.to_parquet(ANALYSIS_DIR / "impacto_derbi.parquet", index=False)
+
+    # Impacto positivo y significativo
+    imp_sig = imp[(imp["significativo"]) & (imp["diff_abs"] > 0)].copy()
+    imp_sig.to_parquet(ANALYSIS_DIR / "impacto_significativo.parquet", index=False)
+
+    print("\n📊 Resumen:")
+    print("  total destino-hora analizados:", len(imp))
+    print("  impactos positivos significativos:", len(imp_sig))
+    print("  destinos afectados:", imp_sig["destino"].nunique())
+
+    print("\n🔥 Top 10 por impacto absoluto:")
+    top_abs = imp_sig.nlargest(10, "diff_abs")[["destino","periodo","viajes","media","diff_abs","diff_pct","z"]]
+    print(top_abs.to_string(index=False))
+
+    print("\n📈 Top 10 por impacto porcentual:")
+    top_pct = imp_sig.nlargest(10, "diff_pct")[["destino","periodo","viajes","media","diff_abs","diff_pct","z"]]
+    print(top_pct.to_string(index=False))
+
+    # =========================
+    # PASO 4: GeoJSON/HTML del impacto por hora
+    # =========================
+    print("="*70)
+    print("PASO 4: EXPORT GEOJSON + HTML (IMPACTO POR HORA)")
+    print("="*70)
+
+    # Para el visor queremos, por distrito destino y hora, el impacto absoluto (diff_abs) (solo positivo)
+    exportar_mapa_impacto(imp)
+    imprimir_resumen()
+    print("✅ Listo. Abre el HTML con servidor local.")
 
-# =========================
-# PASO 4: GeoJSON/HTML del impacto por hora
-# =========================
-print("="*70)
-print("PASO 4: EXPORT GEOJSON + HTML (IMPACTO POR HORA)")
-print("="*70)
-
-# Para el visor queremos, por distrito destino y hora, el impacto absoluto (diff_abs) (solo positivo)
-impact_map = imp.copy()
-impact_map["impacto"] = impact_map["diff_abs"].clip(lower=0)
-impact_map = impact_map[["destino","periodo","impacto"]].copy()
-
-build_geojson_with_hour_dict(
-    base_geojson=BASE_GEOJSON,
-    df=impact_map,
-    id_col=GEO_ID_COL,
-    zone_col="destino",
-    value_col="impacto",
-    hour_col="periodo",
-    out_geojson=OUT_GEOJSON
-)
 
-write_leaflet_html(OUT_HTML, OUT_GEOJSON, value_label="impacto (viajes extra)")
-print("✅ Listo. Abre el HTML con servidor local.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Pipeline por días: descarga (pool de hilos) -> conversión + agregado (pool de procesos)
+======================================================================================
+Mientras un día se descarga, los ya descargados se convierten/agregan en otros
+núcleos, así que un rango de meses tarda lo que la etapa más lenta y no la suma.
+
+    for dia, res in ejecutar_por_dias(dias, descargar_dia, procesar_dia):
+        ...
+
+- descargar(dia) -> bool: trabajo de red (se ejecuta en hilos)
+- procesar(dia) -> resultado: CPU; con usar_procesos=True debe ser una función
+  definida a nivel de módulo (se envía a otro proceso con pickle)
+Los resultados salen según terminan (no en orden de fecha); los fallos se
+imprimen y ese día no se devuelve.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+MAX_DESCARGAS = 4
+MAX_PROCESOS = max(1, (os.cpu_count() or 2) - 1)
+
+
+def ejecutar_por_dias(
+    dias: Iterable[Any],
+    descargar: Callable[[Any], bool],
+    procesar: Callable[[Any], Any],
+    max_descargas: int = MAX_DESCARGAS,
+    max_procesos: Optional[int] = None,
+    usar_procesos: bool = True,
+) -> Iterator[Tuple[Any, Any]]:
+    """Genera (dia, resultado) según va terminando cada día."""
+    dias = list(dias)
+    max_procesos = max_procesos or MAX_PROCESOS
+    PoolCPU = ProcessPoolExecutor if usar_procesos else ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, max_descargas)) as io, PoolCPU(max_workers=max_procesos) as cpu:
+        dia_de = {}
+        es_descarga = set()
+        for d in dias:
+            fut = io.submit(descargar, d)
+            dia_de[fut] = d
+            es_descarga.add(fut)
+
+        pendientes = set(dia_de)
+        while pendientes:
+            hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for fut in hechos:
+                d = dia_de.pop(fut)
+                if fut in es_descarga:
+                    es_descarga.discard(fut)
+                    try:
+                        ok = fut.result()
+                    except Exception as e:
+                        print(f"Error descargando {d}: {e}")
+                        ok = False
+                    if ok:
+                        nuevo = cpu.submit(procesar, d)
+                        dia_de[nuevo] = d
+                        pendientes.add(nuevo)
+                else:
+                    try:
+                        res = fut.result()
+                    except Exception as e:
+                        print(f"Error procesando {d}: {e}")
+                        continue
+                    yield d, res
@@ -0,0 +1,256 @@
+"""
+Teselas vectoriales (PMTiles) de la zonificación + valores por zona aparte
+=========================================================================
+Para mapas de toda España ni el GeoJSON simplificado compensa descargarlo
+entero. Aquí:
+
+- las geometrías de los distritos se teselan UNA vez en un único .pmtiles
+  (MVT, capa "zonas", propiedad ID), cacheado por hash de la zonificación
+  (geometrias.py): sirve para cualquier análisis sobre esa zonificación
+- los valores de cada análisis van aparte (exportar_geo.escribir_valores: matriz
+  zona x hora Float32 + índice de IDs), que el visor une en el navegador por ID
+- el visor (pie.write_leaflet_pmtiles_html) pide solo las teselas a la vista,
+  así que el tiempo de carga no depende del nº de distritos
+
+Teselado: con `tippecanoe` en el PATH se usa ese; si no, en Python con las
+librerías opcionales `mapbox-vector-tile` y `pmtiles` (pip install ...).
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+from geometrias import CACHE_DIR, ID_COL, _hash_fichero, cargar_zonas
+
+CAPA = "zonas"
+ZOOM_MIN = 4
+ZOOM_MAX = 12
+EXTENT = 4096
+BUFFER_PX = 16
+
+_ORIGEN = 20037508.342789244  # semieje de EPSG:3857
+
+
+def _tile_bbox(z: int, x: int, y: int):
+    tam = 2 * _ORIGEN / (1 << z)
+    minx = -_ORIGEN + x * tam
+    maxy = _ORIGEN - y * tam
+    return minx, maxy - tam, minx + tam, maxy
+
+
+def _con_tippecanoe(gdf, out_path: Path, id_col: str, zoom_min: int, zoom_max: int, capa: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "zonas.geojson"
+        gdf[[id_col, "geometry"]].to_crs("EPSG:4326").to_file(src, driver="GeoJSON")
+        subprocess.run(
+            [
+                "tippecanoe", "-o", str(out_path), "--force", "-l", capa,
+                "-Z", str(zoom_min), "-z", str(zoom_max),
+                "--no-tile-size-limit", "--detect-shared-borders", str(src),
+            ],
+            check=True,
+        )
+
+
+def _con_python(gdf, out_path: Path, id_col: str, zoom_min: int, zoom_max: int, capa: str) -> None:
+    try:
+        import mapbox_vector_tile
+        from pmtiles.tile import Compression, TileType, zxy_to_tileid
+        from pmtiles.writer import Writer
+    except ImportError as e:
+        raise ImportError(
+            "Sin tippecanoe hace falta: pip install mapbox-vector-tile pmtiles"
+        ) from e
+    import shapely
+    from shapely import STRtree
+
+    gm = gdf[[id_col, "geometry"]].to_crs("EPSG:3857")
+    ids = gm[id_col].astype(str).to_numpy()
+    geoms = gm.geometry.values
+    arbol = STRtree(geoms)
+    minx, miny, maxx, maxy = gm.total_bounds
+
+    teselas = []
+    for z in range(zoom_min, zoom_max + 1):
+        tam = 2 * _ORIGEN / (1 << z)
+        # simplificación de 1 píxel de tesela en este zoom
+        simp = shapely.simplify(geoms, tam / EXTENT, preserve_topology=True)
+        x0, x1 = int((minx + _ORIGEN) // tam), int((maxx + _ORIGEN) // tam)
+        y0, y1 = int((_ORIGEN - maxy) // tam), int((_ORIGEN - miny) // tam)
+        margen = tam * BUFFER_PX / EXTENT
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                bx0, by0, bx1, by1 = _tile_bbox(z, x, y)
+                idx = arbol.query(shapely.box(bx0 - margen, by0 - margen, bx1 + margen, by1 + margen), predicate="intersects")
+                if not len(idx):
+                    continue
+                recortes = shapely.clip_by_rect(simp[idx], bx0 - margen, by0 - margen, bx1 + margen, by1 + margen)
+                feats = [
+                    {"geometry": g, "properties": {"ID": ids[i]}}
+                    for i, g in zip(idx, recortes)
+                    if not g.is_empty
+                ]
+                if not feats:
+                    continue
+                data = mapbox_vector_tile.encode(
+                    [{"name": capa, "features": feats}],
+                    default_options={"quantize_bounds": (bx0, by0, bx1, by1), "extents": EXTENT},
+                )
+                teselas.append((zxy_to_tileid(z, x, y), gzip.compress(data, mtime=0)))
+
+    lon0, lat0, lon1, lat1 = gdf.to_crs("EPSG:4326").total_bounds
+    teselas.sort(key=lambda t: t[0])
+    with open(out_path, "wb") as f:
+        w = Writer(f)
+        for tid, data in teselas:
+            w.write_tile(tid, data)
+        w.finalize(
+            {
+                "tile_type": TileType.MVT,
+                "tile_compression": Compression.GZIP,
+                "min_zoom": zoom_min,
+                "max_zoom": zoom_max,
+                "min_lon_e7": int(lon0 * 1e7),
+                "min_lat_e7": int(lat0 * 1e7),
+                "max_lon_e7": int(lon1 * 1e7),
+                "max_lat_e7": int(lat1 * 1e7),
+                "center_zoom": zoom_min + 2,
+                "center_lon_e7": int((lon0 + lon1) / 2 * 1e7),
+                "center_lat_e7": int((lat0 + lat1) / 2 * 1e7),
+            },
+            {"vector_layers": [{"id": capa, "fields": {"ID": "String"}, "minzoom": zoom_min, "maxzoom": zoom_max}]},
+        )
+
+
+def construir_pmtiles(
+    gdf,
+    out_path: Path,
+    id_col: str = ID_COL,
+    zoom_min: int = ZOOM_MIN,
+    zoom_max: int = ZOOM_MAX,
+    capa: str = CAPA,
+) -> Path:
+    """Tesela las geometrías de gdf (propiedad ID) en un único .pmtiles."""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_suffix(".tmp.pmtiles")
+    if shutil.which("tippecanoe"):
+        _con_tippecanoe(gdf, tmp, id_col, zoom_min, zoom_max, capa)
+    else:
+        _con_python(gdf, tmp, id_col, zoom_min, zoom_max, capa)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def pmtiles_zonificacion(
+    base_geojson: Path,
+    id_col: str = ID_COL,
+    crs_origen: Optional[str] = None,
+    zoom_min: int = ZOOM_MIN,
+    zoom_max: int = ZOOM_MAX,
+    cache_dir: Path = CACHE_DIR,
+) -> Path:
+    """PMTiles de la zonificación, cacheado por hash del fichero y rango de zoom."""
+    cache_dir = Path(cache_dir)
+    destino = cache_dir / f"{Path(base_geojson).stem}_{_hash_fichero(base_geojson, cache_dir)}_z{zoom_min}-{zoom_max}.pmtiles"
+    if not destino.exists():
+        print(f"  Teselando {Path(base_geojson).name} (z{zoom_min}-{zoom_max})...")
+        gdf = cargar_zonas(base_geojson, crs="EPSG:4326", crs_origen=crs_origen, id_col=id_col, cache_dir=cache_dir)
+        construir_pmtiles(gdf, destino, id_col=id_col, zoom_min=zoom_min, zoom_max=zoom_max)
+    return destino
+
+
+def cabecera_pmtiles(path: Path) -> Tuple[int, int, Tuple[float, float, float, float]]:
+    """(zoom mínimo, zoom máximo, (lon_min, lat_min, lon_max, lat_max)) de la cabecera v3 (127 bytes)."""
+    with open(path, "rb") as f:
+        cab = f.read(127)
+    if cab[:7] != b"PMTiles":
+        raise ValueError(f"{Path(path).name} no es un PMTiles")
+    zmin, zmax, *e7 = struct.unpack_from("<BB4i", cab, 100)
+    return zmin, zmax, tuple(v / 1e7 for v in e7)
+
+
+def servir(carpeta: Path, puerto: int = 8000) -> None:
+    """
+    Servidor local con peticiones Range (PMTiles lee el archivo por trozos;
+    `python -m http.server` no las soporta).
+    """
+    import functools
+    import http.server
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def send_head(self):
+            rango = self.headers.get("Range")
+            path = Path(self.translate_path(self.path))
+            if not rango or not rango.startswith("bytes=") or not path.is_file():
+                return super().send_head()
+            total = path.stat().st_size
+            ini, _, fin = rango[len("bytes="):].split(",")[0].partition("-")
+            if not ini:  # "bytes=-N": últimos N bytes
+                ini, fin = max(0, total - int(fin)), total - 1
+            else:
+                ini, fin = int(ini), min(int(fin), total - 1) if fin else total - 1
+            if ini >= total:
+                self.send_error(416)
+                return None
+            f = open(path, "rb")
+            f.seek(ini)
+            self.send_response(206)
+            self.send_header("Content-Type", self.guess_type(str(path)))
+            self.send_header("Content-Range", f"bytes {ini}-{fin}/{total}")
+            self.send_header("Content-Length", str(fin - ini + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            self._restante = fin - ini + 1
+            return f
+
+        def copyfile(self, source, outputfile):
+            restante = getattr(self, "_restante", None)
+            if restante is None:
+                return super().copyfile(source, outputfile)
+            while restante > 0:
+                bloque = source.read(min(64 * 1024, restante))
+                if not bloque:
+                    break
+                outputfile.write(bloque)
+                restante -= len(bloque)
+            self._restante = None
+
+    handler = functools.partial(Handler, directory=str(carpeta))
+    with http.server.ThreadingHTTPServer(("", puerto), handler) as srv:
+        print(f"Sirviendo {carpeta} en http://localhost:{puerto} (Ctrl+C para parar)")
+        srv.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teselas PMTiles de la zonificación")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("construir", help="tesela una zonificación (geojson/shp)")
+    p_c.add_argument("zonificacion", type=Path)
+    p_c.add_argument("--salida", type=Path, default=None, help="si no se indica, queda en la caché")
+    p_c.add_argument("--id-col", default=ID_COL)
+    p_c.add_argument("--zmin", type=int, default=ZOOM_MIN)
+    p_c.add_argument("--zmax", type=int, default=ZOOM_MAX)
+    p_s = sub.add_parser("servir", help="servidor local con Range para abrir el visor")
+    p_s.add_argument("carpeta", type=Path)
+    p_s.add_argument("--puerto", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.cmd == "construir":
+        ruta = pmtiles_zonificacion(args.zonificacion, id_col=args.id_col, zoom_min=args.zmin, zoom_max=args.zmax)
+        if args.salida is not None:
+            shutil.copyfile(ruta, args.salida)
+            ruta = args.salida
+        print(f"✓ {ruta} ({Path(ruta).stat().st_size / 1e6:.2f} MB)")
+    elif args.cmd == "servir":
+        servir(args.carpeta, args.puerto)
+
+
+if __name__ == "__main__":
+    main()
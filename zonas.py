@@ -0,0 +1,173 @@
+"""
+Diccionario de zonas MITMA: ID de distrito <-> código entero
+===========================================================
+Los IDs de zona viajan como strings en varias formas ('2807920', '1103103_AD',
+'01001', a veces sin el cero inicial si alguien los pasó por número). Aquí se
+construye, a partir de la zonificación MITMA, un diccionario estable:
+
+    codigo (int32, 0..n-1) <-> ID canónico (str, tal cual en la zonificación)
+    codigo -> municipio (int32, posición en dic["municipios"], 5 primeros dígitos INE)
+    codigo -> provincia (int16, código INE de provincia, 2 primeros dígitos)
+
+Codificar una columna hace el trabajo de strings una vez por categoría, no por
+fila; después comparaciones, joins y agregados por municipio/provincia son
+búsquedas en arrays numpy. Los códigos son append-only: ampliar el diccionario
+con zonas nuevas no cambia los ya asignados.
+
+    dic = diccionario_desde_zonificacion(geojson)   # o cargar_diccionario(parquet)
+    cod = codificar(df["zona_residencia"], dic)
+    prov = provincia_de(cod, dic)
+"""
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SIN_ZONA = -1
+DICCIONARIO_NAME = "diccionario_zonas.parquet"
+
+# {"ids", "municipios", "municipio", "provincia", "indice"}
+Diccionario = Dict[str, object]
+
+
+def normalizar_ids(zonas: Iterable) -> pd.Index:
+    """Quita espacios y restos de float ('2807920.0'); no rellena ni toca sufijos como '_AD'."""
+    s = pd.Index(zonas).astype(str).str.strip()
+    return pd.Index(s.str.replace(r"^(\d+)\.0$", r"\1", regex=True), dtype=object)
+
+
+def _diccionario(ids: List[str]) -> Diccionario:
+    """Arrays del diccionario; el código de cada ID es su posición en `ids`."""
+    indice = pd.Index(ids, dtype=object)
+    munis = indice.str[:5]
+    # municipios en orden de primera aparición: con IDs append-only, también estable
+    municipios = pd.Index(pd.unique(munis.to_numpy()), dtype=object)
+    provincia = pd.to_numeric(pd.Series(indice.str[:2]), errors="coerce").fillna(SIN_ZONA)
+    return {
+        "ids": indice.to_numpy(dtype=object),
+        "municipios": municipios.to_numpy(dtype=object),
+        "municipio": municipios.get_indexer(munis).astype(np.int32),
+        "provincia": provincia.to_numpy().astype(np.int16),
+        "indice": indice,
+    }
+
+
+def construir_diccionario(ids: Iterable[str], previo: Optional[Diccionario] = None) -> Diccionario:
+    """Diccionario con los IDs dados (ordenados); con `previo`, los nuevos se añaden al final."""
+    nuevos = normalizar_ids(ids).unique()
+    if previo is None:
+        return _diccionario(sorted(nuevos))
+    existentes = list(previo["ids"])
+    ya = set(existentes)
+    return _diccionario(existentes + sorted(z for z in nuevos if z not in ya))
+
+
+def diccionario_desde_zonificacion(path: Path, id_col: str = "ID") -> Diccionario:
+    """
+    Diccionario desde la zonificación MITMA: nombres_distritos.csv (ID|nombre)
+    o el geojson/shp de distritos (solo atributos, sin geometría).
+    """
+    path = Path(path)
+    if path.suffix.lower() in (".csv", ".txt"):
+        df = pd.read_csv(path, sep=None, engine="python", dtype=str)
+        df.columns = [c.strip() for c in df.columns]
+        return construir_diccionario(df[id_col if id_col in df.columns else df.columns[0]])
+    import geopandas as gpd
+    return construir_diccionario(gpd.read_file(path, ignore_geometry=True)[id_col])
+
+
+def guardar_diccionario(dic: Diccionario, path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = pd.DataFrame({
+        "codigo": np.arange(len(dic["ids"]), dtype=np.int32),
+        "id": pd.Series(dic["ids"], dtype=str),
+        "municipio": dic["municipio"],
+        "provincia": dic["provincia"],
+    })
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def cargar_diccionario(path: Path) -> Diccionario:
+    df = pd.read_parquet(path, columns=["codigo", "id"]).sort_values("codigo")
+    return _diccionario(df["id"].astype(str).tolist())
+
+
+def _resolver(valores: pd.Index, dic: Diccionario) -> np.ndarray:
+    """Códigos de IDs ya normalizados; si no aparecen, se prueba con los ceros iniciales perdidos."""
+    indice: pd.Index = dic["indice"]
+    cod = indice.get_indexer(valores)
+    faltan = (cod < 0) & np.asarray(valores.str.fullmatch(r"\d+"), dtype=bool)
+    for ancho in (7, 5):
+        if not faltan.any():
+            break
+        cod[faltan] = indice.get_indexer(valores[faltan].str.zfill(ancho))
+        faltan &= cod < 0
+    return cod.astype(np.int32)
+
+
+def codificar(zonas: pd.Series, dic: Diccionario) -> np.ndarray:
+    """Columna de IDs (str o categórica) -> códigos int32 (SIN_ZONA si no está en el diccionario)."""
+    if not isinstance(zonas.dtype, pd.CategoricalDtype):
+        zonas = zonas.astype("category")
+    por_cat = _resolver(normalizar_ids(zonas.cat.categories), dic)
+    por_cat = np.append(por_cat, np.int32(SIN_ZONA))  # código -1 (nulo) -> SIN_ZONA
+    return por_cat[zonas.cat.codes.to_numpy()]
+
+
+def codificar_ids(ids: Iterable[str], dic: Diccionario) -> np.ndarray:
+    """Lista de IDs sueltos -> códigos (para filtros con isin sobre enteros)."""
+    return _resolver(normalizar_ids(ids), dic)
+
+
+def _con_nulo(tabla: np.ndarray, codigos: np.ndarray, nulo) -> np.ndarray:
+    codigos = np.asarray(codigos)
+    return np.where(codigos >= 0, tabla[np.clip(codigos, 0, None)], nulo)
+
+
+def decodificar(codigos: np.ndarray, dic: Diccionario) -> np.ndarray:
+    """Códigos -> IDs canónicos (None donde SIN_ZONA)."""
+    return _con_nulo(dic["ids"], codigos, None)
+
+
+def municipio_de(codigos: np.ndarray, dic: Diccionario) -> np.ndarray:
+    """Códigos de zona -> código de municipio (posición en dic["municipios"])."""
+    return _con_nulo(dic["municipio"], codigos, SIN_ZONA).astype(np.int32)
+
+
+def municipio_ine(codigos: np.ndarray, dic: Diccionario) -> np.ndarray:
+    """Códigos de zona -> código INE del municipio (str de 5 dígitos)."""
+    return _con_nulo(dic["municipios"], municipio_de(codigos, dic), None)
+
+
+def provincia_de(codigos: np.ndarray, dic: Diccionario) -> np.ndarray:
+    """Códigos de zona -> código INE de provincia (int16)."""
+    return _con_nulo(dic["provincia"], codigos, SIN_ZONA).astype(np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diccionario de zonas MITMA")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_c = sub.add_parser("construir", help="crea/amplía el diccionario desde la zonificación")
+    p_c.add_argument("zonificacion", type=Path, help="nombres_distritos.csv o geojson/shp de distritos")
+    p_c.add_argument("--salida", type=Path, default=Path(DICCIONARIO_NAME))
+    p_c.add_argument("--id-col", default="ID")
+    args = parser.parse_args()
+
+    if args.cmd == "construir":
+        nuevo = diccionario_desde_zonificacion(args.zonificacion, args.id_col)
+        if args.salida.exists():
+            # append-only: los códigos ya asignados no cambian
+            nuevo = construir_diccionario(nuevo["ids"], previo=cargar_diccionario(args.salida))
+        guardar_diccionario(nuevo, args.salida)
+        print(f"✓ {len(nuevo['ids'])} zonas, {len(nuevo['municipios'])} municipios -> {args.salida}")
+
+
+if __name__ == "__main__":
+    main()